@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings')
+# Pool database connections across the per-request threads (see settings)
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
@@ -37,6 +37,57 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+# Don't write task states to the result backend at all. Fire-and-forget
+# tasks (email dispatch, stats reconciliation) skip it regardless.
+CELERY_TASK_IGNORE_RESULT = env.bool('CELERY_TASK_IGNORE_RESULT', default=False)
+CELERY_BEAT_SCHEDULE = {
+    # Totals are recounted in full; daily breakdown rows for the last two days
+    'reconcile-listing-stats': {
+        'task': 'listings.tasks.reconcile_stats',
+        'schedule': env.int('LISTING_STATS_RECONCILE_INTERVAL', default=60 * 60),
+        'kwargs': {'days': 2},
+    },
+    # Publishes the tasks recorded in the outbox by booking/payment writes
+    'relay-listing-outbox': {
+        'task': 'listings.tasks.relay_outbox',
+        'schedule': env.float('LISTING_OUTBOX_RELAY_INTERVAL', default=2.0),
+    },
+    # Catches payments whose gateway webhook never arrived
+    'verify-pending-payments': {
+        'task': 'listings.tasks.verify_pending_payments',
+        'schedule': env.int('CHAPA_VERIFY_INTERVAL', default=5 * 60),
+    },
+    # Sends notifications whose scheduled dispatch was lost
+    'dispatch-listing-emails': {
+        'task': 'listings.tasks.dispatch_emails',
+        'schedule': env.int('LISTING_EMAIL_SWEEP_INTERVAL', default=60),
+    },
+}
+
+# Listing search: 'auto' uses MySQL FULLTEXT / PostgreSQL tsvector when
+# available and an in-process inverted index otherwise. The inverted index
+# returns only the LISTING_SEARCH_MAX_RESULTS best matches among the
+# filtered listings, so later pages and ?count=true stop there. Each
+# process builds its own index and only sees the listing writes it made
+# itself: with several processes serving writes, use a database backend.
+LISTING_SEARCH_BACKEND = env('LISTING_SEARCH_BACKEND', default='auto')
+LISTING_SEARCH_MAX_RESULTS = env.int('LISTING_SEARCH_MAX_RESULTS', default=1000)
+
+# Location search: ?radius= default and cap, in km
+LISTING_GEO_DEFAULT_RADIUS_KM = env.float('LISTING_GEO_DEFAULT_RADIUS_KM', default=10)
+LISTING_GEO_MAX_RADIUS_KM = env.float('LISTING_GEO_MAX_RADIUS_KM', default=500)
+
+# Listing response cache: 'local' (in-process LRU), 'none', or the name of
+# an entry in CACHES to share the cache between processes
+LISTING_CACHE_BACKEND = env('LISTING_CACHE_BACKEND', default='local')
+LISTING_CACHE_TIMEOUT = env.int('LISTING_CACHE_TIMEOUT', default=60)
+LISTING_CACHE_MAX_ENTRIES = env.int('LISTING_CACHE_MAX_ENTRIES', default=1000)
+
+# Stats rollup: number of counter rows writers spread their increments over
+LISTING_STATS_SHARDS = env.int('LISTING_STATS_SHARDS', default=8)
+
+# Largest batch accepted by the bulk listing/booking create endpoints
+LISTING_BULK_MAX_ITEMS = env.int('LISTING_BULK_MAX_ITEMS', default=5000)
 
 # Email Configuration
 EMAIL_BACKEND = env('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
@@ -47,6 +98,40 @@ EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
 
+# Chapa payment gateway. Calls run in Celery tasks over a pooled keep-alive
+# session (CHAPA_POOL_SIZE connections per worker process); webhooks are
+# checked against CHAPA_WEBHOOK_SECRET
+CHAPA_API_URL = env('CHAPA_API_URL', default='https://api.chapa.co')
+CHAPA_SECRET_KEY = env('CHAPA_SECRET_KEY', default='')
+CHAPA_WEBHOOK_SECRET = env('CHAPA_WEBHOOK_SECRET', default='')
+CHAPA_CURRENCY = env('CHAPA_CURRENCY', default='ETB')
+CHAPA_CALLBACK_URL = env('CHAPA_CALLBACK_URL', default='')
+CHAPA_RETURN_URL = env('CHAPA_RETURN_URL', default='')
+CHAPA_CONNECT_TIMEOUT = env.float('CHAPA_CONNECT_TIMEOUT', default=3.05)
+CHAPA_READ_TIMEOUT = env.float('CHAPA_READ_TIMEOUT', default=10)
+CHAPA_POOL_SIZE = env.int('CHAPA_POOL_SIZE', default=10)
+CHAPA_MAX_RETRIES = env.int('CHAPA_MAX_RETRIES', default=6)
+# Pending payments are polled once their webhook is CHAPA_VERIFY_AFTER
+# seconds late, for up to CHAPA_VERIFY_WINDOW seconds after creation
+CHAPA_VERIFY_AFTER = env.int('CHAPA_VERIFY_AFTER', default=10 * 60)
+CHAPA_VERIFY_WINDOW = env.int('CHAPA_VERIFY_WINDOW', default=24 * 60 * 60)
+
+# Outbox relay: events published per transaction, and days published
+# events are kept before the relay deletes them
+LISTING_OUTBOX_BATCH_SIZE = env.int('LISTING_OUTBOX_BATCH_SIZE', default=500)
+LISTING_OUTBOX_RETENTION_DAYS = env.int('LISTING_OUTBOX_RETENTION_DAYS', default=7)
+
+# Queued notifications: a dispatch runs this many seconds after the first
+# one is queued and sends everything pending over one SMTP connection
+LISTING_EMAIL_DISPATCH_DELAY = env.int('LISTING_EMAIL_DISPATCH_DELAY', default=5)
+LISTING_EMAIL_BATCH_SIZE = env.int('LISTING_EMAIL_BATCH_SIZE', default=100)
+# Sends of one notification before it is marked failed, and retries of a
+# dispatch run after SMTP errors
+LISTING_EMAIL_MAX_ATTEMPTS = env.int('LISTING_EMAIL_MAX_ATTEMPTS', default=5)
+LISTING_EMAIL_MAX_RETRIES = env.int('LISTING_EMAIL_MAX_RETRIES', default=8)
+# Seconds after which rows claimed by a dead worker are claimed again
+LISTING_EMAIL_CLAIM_TIMEOUT = env.int('LISTING_EMAIL_CLAIM_TIMEOUT', default=10 * 60)
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -82,14 +167,17 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'listings.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
 }
 
 
 MIDDLEWARE = [
+    # First, so its latency covers the whole stack; inert unless enabled
+    'listings.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'listings.replicas.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -159,7 +247,44 @@ DATABASES = {
     }
 }
 
-
+# Connection reuse. Web and Celery worker threads keep their connection
+# open for DB_CONN_MAX_AGE seconds instead of reconnecting per request or
+# task (0 reconnects every time); give workers their own value through the
+# environment they start with. With DB_CONN_HEALTH_CHECKS a reused
+# connection is pinged once per request and replaced if it died.
+#
+# Under ASGI each request runs its sync code in a new thread, so per-thread
+# connections are never reused. asgi.py sets DJANGO_ASGI, which switches to
+# a per-process pool (listings/db/pool.py) of DB_POOL_SIZE idle connections;
+# DB_POOL turns the pool on or off explicitly.
+DB_POOL = env.bool('DB_POOL', default=env.bool('DJANGO_ASGI', default=False))
+if DB_POOL:
+    DATABASES['default']['ENGINE'] = 'listings.db.backends.mysql'
+    DATABASES['default']['POOL'] = {
+        'SIZE': env.int('DB_POOL_SIZE', default=10),
+        'RECYCLE': env.int('DB_POOL_RECYCLE', default=3600),
+    }
+# The pool takes connections back when Django closes them after a request
+DATABASES['default']['CONN_MAX_AGE'] = 0 if DB_POOL else env.int('DB_CONN_MAX_AGE', default=60)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = env.bool('DB_CONN_HEALTH_CHECKS', default=True)
+
+# Read replicas: one alias per host in DB_REPLICA_HOSTS, otherwise like
+# default. Listing, review and stats reads are routed to them (see
+# listings/replicas.py); under test they mirror default.
+for index, host in enumerate(env.list('DB_REPLICA_HOSTS', default=[])):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['listings.replicas.ReplicaRouter']
+LISTING_DB_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# Seconds a client stays on the primary after a write, to read its writes
+LISTING_DB_PIN_SECONDS = env.int('LISTING_DB_PIN_SECONDS', default=5)
+
+
+# Per-request query counts, SQL/serialization/render time and latency, as
+# Server-Timing headers and per-view histograms at /api/metrics/ (see
+# listings/instrumentation.py). Off unless enabled.
+LISTING_METRICS_ENABLED = env.bool('LISTING_METRICS_ENABLED', default=False)
+LISTING_METRICS_SERVER_TIMING = env.bool('LISTING_METRICS_SERVER_TIMING', default=True)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
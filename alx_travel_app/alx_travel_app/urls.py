@@ -7,8 +7,9 @@ from rest_framework.routers import DefaultRouter
 from listings.views import (
     ListingViewSet, BookingViewSet, 
     ReviewViewSet, PaymentViewSet, 
-    UserViewSet, StatsAPIView
+    UserViewSet, StatsAPIView, ExportAPIView, MetricsAPIView
 )
+from listings import async_views
 
 # Create router and register viewsets
 router = DefaultRouter()
@@ -51,6 +52,14 @@ urlpatterns = [
     # API endpoints
     path('api/', include(router.urls)),
     path('api/stats/', StatsAPIView.as_view(), name='stats'),
+    path('api/exports/<str:kind>/', ExportAPIView.as_view(), name='export'),
+    path('api/metrics/', MetricsAPIView.as_view(), name='metrics'),
+
+    # Async read path for ASGI deployments
+    path('api/async/listings/', async_views.listing_list, name='async-listing-list'),
+    path('api/async/listings/<uuid:pk>/', async_views.listing_detail, name='async-listing-detail'),
+    path('api/async/listings/<uuid:pk>/availability/', async_views.listing_availability, name='async-listing-availability'),
+    path('api/async/stats/', async_views.stats, name='async-stats'),
     
     # Authentication (if using DRF's token auth or Djoser)
     path('api/auth/', include('rest_framework.urls')),
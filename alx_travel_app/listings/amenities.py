@@ -0,0 +1,74 @@
+"""
+Normalized amenities: the Listing.amenities text stays the editable source,
+and Amenity/ListingAmenity rows mirror it for indexed filtering.
+"""
+from django.db.models import Count
+from django.utils.text import slugify
+
+from .models import Amenity, ListingAmenity
+
+MATCH_ALL = 'all'
+MATCH_ANY = 'any'
+
+
+def normalize_amenities(names):
+    """Map amenity names to {slug: display name}, dropping blanks and duplicates."""
+    normalized = {}
+    for name in names:
+        slug = slugify(name)
+        if slug and slug not in normalized:
+            normalized[slug] = name.strip()
+    return normalized
+
+
+def get_or_create_amenities(names):
+    """Return Amenity rows for the given names, creating missing ones in bulk."""
+    normalized = normalize_amenities(names)
+    if not normalized:
+        return []
+    existing = {amenity.slug: amenity for amenity in Amenity.objects.filter(slug__in=normalized)}
+    missing = [Amenity(slug=slug, name=name) for slug, name in normalized.items() if slug not in existing]
+    if missing:
+        Amenity.objects.bulk_create(missing, ignore_conflicts=True)
+        existing = {amenity.slug: amenity for amenity in Amenity.objects.filter(slug__in=normalized)}
+    return list(existing.values())
+
+
+def sync_listing_amenities(listing):
+    """
+    Make the listing's ListingAmenity rows match its amenities text.
+
+    Called from the Listing post_save signal; writes that bypass save()
+    (QuerySet.update, bulk_create) must call it themselves.
+    """
+    wanted = normalize_amenities(listing.get_amenities_list())
+    current = dict(
+        ListingAmenity.objects.filter(listing=listing).values_list('amenity__slug', 'amenity_id')
+    )
+    if set(wanted) == set(current):
+        return
+
+    stale = [amenity_id for slug, amenity_id in current.items() if slug not in wanted]
+    if stale:
+        ListingAmenity.objects.filter(listing=listing, amenity_id__in=stale).delete()
+    added = [name for slug, name in wanted.items() if slug not in current]
+    ListingAmenity.objects.bulk_create(
+        [ListingAmenity(listing=listing, amenity=amenity) for amenity in get_or_create_amenities(added)],
+        ignore_conflicts=True,
+    )
+
+
+def filter_by_amenities(queryset, names, match=MATCH_ALL):
+    """
+    Narrow a Listing queryset to listings with all (or any) of the amenities.
+    Resolves through the unique slug and the (amenity, listing) index on
+    ListingAmenity.
+    """
+    slugs = list(normalize_amenities(names))
+    if not slugs:
+        return queryset
+    # Stays lazy (a subquery, no lookup up front) so async views can use it
+    links = ListingAmenity.objects.filter(amenity__slug__in=slugs)
+    if match != MATCH_ANY:
+        links = links.values('listing').annotate(matched=Count('amenity')).filter(matched=len(slugs))
+    return queryset.filter(pk__in=links.values('listing'))
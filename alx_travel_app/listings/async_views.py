@@ -0,0 +1,130 @@
+"""
+Async (ASGI-native) versions of the hot read endpoints, mounted under
+/api/async/.
+
+Under ASGI the DRF viewsets in views.py run every request in a worker
+thread. These views stay on the event loop and only leave it for the
+queries the async ORM runs. They reuse the viewsets' filters, serializers,
+pagination and response cache, so the payloads are the same as on the sync
+endpoints. Under WSGI they still work, but each request pays an event loop
+start-up, so only route traffic here from an ASGI server.
+"""
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotAuthenticated, NotFound, PermissionDenied
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .availability import booked_nights
+from .cache import get_listing_cache
+from .models import Listing
+from .replicas import replica_reads
+from .search import get_search_backend
+from .serializers import AvailabilityQuerySerializer
+from .stats import adaily_breakdown, aget_totals
+from .views import ListingViewSet, StatsAPIView, availability_payload
+
+
+def error_response(exc):
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return JsonResponse(detail, status=exc.status_code, safe=False, encoder=JSONEncoder)
+
+
+def async_api_view(view):
+    """
+    Wrap an async read-only view: hand it a DRF Request (for query_params),
+    let it read from a replica, and render APIExceptions the way DRF's
+    exception handler does.
+    """
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise MethodNotAllowed(request.method)
+            with replica_reads():
+                return await view(Request(request), *args, **kwargs)
+        except APIException as exc:
+            return error_response(exc)
+    return wrapped
+
+
+async def authenticate(request):
+    """
+    Return the request's user: the session user without leaving the event
+    loop, or else the configured DRF authenticators (token) in a thread.
+    """
+    user = await request.auser()
+    if user.is_authenticated or 'HTTP_AUTHORIZATION' not in request.META:
+        return user
+    authenticated = Request(
+        request._request,
+        authenticators=[authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    return await sync_to_async(lambda: authenticated.user)()
+
+
+def listing_view(request, action, **kwargs):
+    return ListingViewSet(request=request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+
+
+async def render_listing_page(view):
+    request = view.request
+    queryset = view.get_queryset()
+    if request.query_params.get(api_settings.SEARCH_PARAM) and not get_search_backend().is_ready():
+        # The in-process index loads from the database and reads filtered ids
+        queryset = await sync_to_async(view.filter_queryset)(queryset)
+    else:
+        queryset = view.filter_queryset(queryset)
+    page = await view.paginator.apaginate_queryset(queryset, request, view)
+    return view.paginator.get_paginated_data(view.get_serializer(page, many=True).data)
+
+
+async def render_listing(view, pk):
+    listing = await view.get_queryset().filter(pk=pk).afirst()
+    if listing is None:
+        raise NotFound('No Listing matches the given query.')
+    return view.get_serializer(listing).data
+
+
+@async_api_view
+async def listing_list(request):
+    view = listing_view(request, 'list')
+    cache = get_listing_cache()
+    return await cache.acached_response(request, await cache.alist_key(request), partial(render_listing_page, view))
+
+
+@async_api_view
+async def listing_detail(request, pk):
+    view = listing_view(request, 'retrieve', pk=pk)
+    render = partial(render_listing, view, pk)
+    if request.query_params:
+        return JsonResponse(await render(), encoder=JSONEncoder)
+    cache = get_listing_cache()
+    return await cache.acached_response(request, cache.detail_key(pk), render)
+
+
+@async_api_view
+async def listing_availability(request, pk):
+    query = AvailabilityQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    if not await Listing.objects.filter(pk=pk).aexists():
+        raise NotFound('No Listing matches the given query.')
+    check_in, check_out = query.validated_data['check_in'], query.validated_data['check_out']
+    available = not await booked_nights(check_in, check_out, listing=pk).aexists()
+    return JsonResponse(availability_payload(pk, check_in, check_out, available), encoder=JSONEncoder)
+
+
+@async_api_view
+async def stats(request):
+    user = await authenticate(request)
+    if not user.is_authenticated:
+        # DRF answers 403 as well when no authenticator sends a challenge
+        raise PermissionDenied(NotAuthenticated.default_detail)
+    payload = await aget_totals()
+    breakdown = StatsAPIView().get_breakdown(request)
+    if breakdown:
+        payload['daily'] = await adaily_breakdown(*breakdown)
+    return JsonResponse(payload, encoder=JSONEncoder)
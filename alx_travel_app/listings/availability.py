@@ -0,0 +1,55 @@
+"""
+Availability lookups backed by the BookedNight occupancy table.
+
+Stays are half-open date ranges [check_in, check_out): the check-out day is
+not a booked night, so back-to-back bookings do not overlap.
+"""
+from datetime import timedelta
+
+from .models import BookedNight
+
+
+def nights_between(check_in, check_out):
+    return [check_in + timedelta(days=offset) for offset in range((check_out - check_in).days)]
+
+
+def booked_nights(check_in, check_out, listing=None):
+    nights = BookedNight.objects.filter(night__gte=check_in, night__lt=check_out)
+    if listing is not None:
+        nights = nights.filter(listing=listing)
+    return nights
+
+
+def is_available(listing, check_in, check_out, exclude_booking=None):
+    """
+    Return True if no active booking holds a night of [check_in, check_out)
+    on the listing. Answered from the unique (listing, night) index.
+    """
+    nights = booked_nights(check_in, check_out, listing=listing)
+    if exclude_booking is not None:
+        nights = nights.exclude(booking=exclude_booking)
+    return not nights.exists()
+
+
+def available_listings(queryset, check_in, check_out):
+    """
+    Narrow a Listing queryset to listings that are free for the whole stay.
+    """
+    taken = booked_nights(check_in, check_out).values('listing')
+    return queryset.exclude(pk__in=taken)
+
+
+def sync_booked_nights(booking):
+    """
+    Rewrite the BookedNight rows of a booking from its dates and status.
+
+    Called from the Booking post_save signal; writes that bypass save()
+    (QuerySet.update, bulk_create) must call it themselves.
+    """
+    BookedNight.objects.filter(booking=booking).delete()
+    if not booking.holds_nights:
+        return
+    BookedNight.objects.bulk_create([
+        BookedNight(listing_id=booking.listing_id, booking=booking, night=night)
+        for night in nights_between(booking.check_in_date, booking.check_out_date)
+    ])
@@ -0,0 +1,173 @@
+"""
+Bulk creation of listings and bookings for partner syncs.
+
+Items are validated one by one for shape, but everything that needs the
+database (listing lookups, availability) runs once per batch, and the
+accepted rows are written with bulk_create in chunks inside a single
+transaction. bulk_create skips the model save signals, so the work they
+normally do (BookedNight rows, amenity links, search index, stats rollup,
+outbox events, cache invalidation) is done here for the whole batch.
+
+Every function returns one result per input item, in input order:
+{'index': i, 'status': 'created', 'id': pk} or
+{'index': i, 'status': 'error', 'errors': {...}}.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import outbox
+from .amenities import get_or_create_amenities, normalize_amenities
+from .availability import nights_between
+from .cache import invalidate_availability_pages, invalidate_listing_pages
+from .models import BookedNight, Booking, Listing, ListingAmenity, OutboxEvent
+from .search import get_search_backend
+from .serializers import BulkBookingItemSerializer, ListingCreateSerializer
+from .stats import record_daily, record_totals
+
+STATUS_CREATED = 'created'
+STATUS_ERROR = 'error'
+
+UNAVAILABLE_MESSAGE = "The listing is not available for the selected dates."
+
+
+def created(index, pk):
+    return {'index': index, 'status': STATUS_CREATED, 'id': pk}
+
+
+def failed(index, errors):
+    return {'index': index, 'status': STATUS_ERROR, 'errors': errors}
+
+
+def validate_items(serializer_class, items, results):
+    """
+    Run each item through ``serializer_class``, recording failures in
+    ``results``. Returns [(index, validated_data)] for the valid ones.
+    """
+    valid = []
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = failed(index, serializer.errors)
+    return valid
+
+
+def bulk_create_listings(items, host, chunk_size=500):
+    results = [None] * len(items)
+    valid = validate_items(ListingCreateSerializer, items, results)
+    listings = [Listing(host=host, **data) for _, data in valid]
+
+    with transaction.atomic():
+        Listing.objects.bulk_create(listings, batch_size=chunk_size)
+
+        wanted = {listing.pk: normalize_amenities(listing.get_amenities_list()) for listing in listings}
+        names = {slug: name for amenities in wanted.values() for slug, name in amenities.items()}
+        amenities = {amenity.slug: amenity for amenity in get_or_create_amenities(names.values())}
+        ListingAmenity.objects.bulk_create(
+            [
+                ListingAmenity(listing_id=listing_id, amenity=amenities[slug])
+                for listing_id, slugs in wanted.items()
+                for slug in slugs
+            ],
+            batch_size=chunk_size,
+        )
+
+        if listings:
+            record_totals(total_listings=len(listings))
+            invalidate_listing_pages()
+
+    backend = get_search_backend()
+    for listing in listings:
+        backend.listing_saved(listing)
+    for (index, _), listing in zip(valid, listings):
+        results[index] = created(index, listing.pk)
+    return results
+
+
+def bulk_create_bookings(items, guest, chunk_size=500):
+    """
+    Create pending bookings for ``guest``. A booking is rejected when one of
+    its nights is already held, or claimed by an earlier item of the batch.
+    """
+    results = [None] * len(items)
+    valid = validate_items(BulkBookingItemSerializer, items, results)
+
+    with transaction.atomic():
+        # Lock the listings in primary key order so concurrent batches
+        # touching the same listings cannot deadlock.
+        listing_ids = {data['listing_id'] for _, data in valid}
+        listings = {
+            listing.pk: listing
+            for listing in Listing.objects.select_for_update().filter(pk__in=listing_ids)
+            .order_by('pk').only('pk', 'price_per_night')
+        }
+
+        taken = set()
+        if valid:
+            taken = set(
+                BookedNight.objects.filter(
+                    listing_id__in=listings,
+                    night__gte=min(data['check_in_date'] for _, data in valid),
+                    night__lt=max(data['check_out_date'] for _, data in valid),
+                ).order_by().values_list('listing_id', 'night')
+            )
+
+        accepted = []
+        for index, data in valid:
+            listing = listings.get(data['listing_id'])
+            if listing is None:
+                results[index] = failed(index, {
+                    'listing_id': [f'Invalid pk "{data["listing_id"]}" - object does not exist.']
+                })
+                continue
+            nights = [(listing.pk, night) for night in nights_between(data['check_in_date'], data['check_out_date'])]
+            if taken.intersection(nights):
+                results[index] = failed(index, {'dates': [UNAVAILABLE_MESSAGE]})
+                continue
+            taken.update(nights)
+            accepted.append((index, Booking(
+                listing_id=listing.pk,
+                guest=guest,
+                check_in_date=data['check_in_date'],
+                check_out_date=data['check_out_date'],
+                total_price=listing.price_per_night * len(nights),
+                status=Booking.STATUS_PENDING,
+            )))
+
+        bookings = [booking for _, booking in accepted]
+        try:
+            # The unique (listing, night) key still guards against writers
+            # on backends where select_for_update() is a no-op.
+            with transaction.atomic():
+                Booking.objects.bulk_create(bookings, batch_size=chunk_size)
+                BookedNight.objects.bulk_create(
+                    [
+                        BookedNight(listing_id=booking.listing_id, booking=booking, night=night)
+                        for booking in bookings
+                        for night in nights_between(booking.check_in_date, booking.check_out_date)
+                    ],
+                    batch_size=chunk_size,
+                )
+                OutboxEvent.objects.bulk_create(
+                    [event for event in map(outbox.booking_created, bookings) if event is not None],
+                    batch_size=chunk_size,
+                )
+        except IntegrityError:
+            raise serializers.ValidationError({"dates": UNAVAILABLE_MESSAGE})
+
+        if bookings:
+            record_totals(total_bookings=len(bookings))
+            per_day = Counter(
+                (booking.listing_id, timezone.localdate(booking.created_at)) for booking in bookings
+            )
+            for (listing_id, day), count in per_day.items():
+                record_daily(listing_id, day, bookings=count)
+            invalidate_availability_pages()
+
+    for index, booking in accepted:
+        results[index] = created(index, booking.pk)
+    return results
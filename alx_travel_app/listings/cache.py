@@ -0,0 +1,308 @@
+"""
+Response cache for listing reads.
+
+Serialized listing payloads are cached together with an ETag. Detail
+entries are keyed by listing id and deleted when that listing (or one of
+its reviews) changes; list pages are keyed by their normalized query
+string under a generation number that any Listing or Review write bumps,
+which orphans every cached page at once. Only pages filtered by
+?check_in=&check_out= depend on bookings: their keys also carry an
+availability generation, which Booking writes bump on their own.
+
+Generation numbers are counters kept apart from the cached payloads, so
+evicting payloads never resets them.
+
+The store is picked by settings.LISTING_CACHE_BACKEND: 'local' (the
+default) is an in-process LRU with TTL, 'none' disables caching, and any
+other value names an entry of settings.CACHES to share between processes.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponseNotModified, JsonResponse
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+LIST_GENERATION_KEY = 'listings:list:generation'
+AVAILABILITY_GENERATION_KEY = 'listings:list:availability-generation'
+
+# Query parameters that make a list page depend on bookings
+AVAILABILITY_PARAMS = ('check_in', 'check_out')
+
+
+class LocalLRUCache:
+    """
+    Thread-safe in-process LRU with a per-entry TTL. Counters live outside
+    the LRU and never expire.
+    """
+
+    def __init__(self, max_entries=1000, timeout=60):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=-1):
+        if timeout == -1:
+            timeout = self.timeout
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def aget(self, key, default=None):
+        # In-memory, so there is nothing to await
+        return self.get(key, default)
+
+    async def aset(self, key, value, timeout=-1):
+        self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    async def acounter(self, key):
+        return self.counter(key)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, 0) + 1
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedCache:
+    """Adapter giving a Django cache backend the LocalLRUCache interface."""
+
+    def __init__(self, alias, timeout=60):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    def set(self, key, value, timeout=-1):
+        self.cache.set(key, value, self.timeout if timeout == -1 else timeout)
+
+    async def aget(self, key, default=None):
+        return await self.cache.aget(key, default)
+
+    async def aset(self, key, value, timeout=-1):
+        await self.cache.aset(key, value, self.timeout if timeout == -1 else timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    # The shared cache may evict a counter like any other key. A missing
+    # counter restarts from the clock rather than 0, past every value it
+    # had before, so pages cached under an old generation stay orphaned.
+
+    def counter(self, key):
+        value = self.cache.get(key)
+        if value is None:
+            self.cache.add(key, time.time_ns(), None)
+            value = self.cache.get(key, 0)
+        return value
+
+    async def acounter(self, key):
+        value = await self.cache.aget(key)
+        if value is None:
+            await self.cache.aadd(key, time.time_ns(), None)
+            value = await self.cache.aget(key, 0)
+        return value
+
+    def incr(self, key):
+        self.cache.add(key, time.time_ns(), None)
+        return self.cache.incr(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ListingCache:
+
+    def __init__(self, store):
+        self.store = store
+
+    def detail_key(self, listing_id):
+        return f'listings:detail:{listing_id}'
+
+    def generation_keys(self, request):
+        """The generation counters the list page for ``request`` depends on."""
+        if any(request.query_params.get(param) for param in AVAILABILITY_PARAMS):
+            return [LIST_GENERATION_KEY, AVAILABILITY_GENERATION_KEY]
+        return [LIST_GENERATION_KEY]
+
+    def list_key(self, request):
+        generations = [self.store.counter(key) for key in self.generation_keys(request)]
+        return self.build_list_key(request, generations)
+
+    async def alist_key(self, request):
+        generations = [await self.store.acounter(key) for key in self.generation_keys(request)]
+        return self.build_list_key(request, generations)
+
+    def build_list_key(self, request, generations):
+        params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        # Pagination links are absolute, so host and path are part of the key
+        raw = json.dumps([request.build_absolute_uri(request.path), params])
+        generation = '.'.join(map(str, generations))
+        return f'listings:list:{generation}:{hashlib.sha1(raw.encode("utf-8")).hexdigest()}'
+
+    def cached_response(self, request, key, render):
+        """
+        Serve ``render()`` through the cache, answering If-None-Match with a
+        304 when the cached ETag still matches.
+        """
+        entry = self.store.get(key)
+        if entry is None:
+            response = render()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = (compute_etag(response.data), response.data)
+            self.store.set(key, entry)
+        etag, data = entry
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+    async def acached_response(self, request, key, render):
+        """
+        cached_response() for async views: ``render`` is a coroutine function
+        returning the payload, and a Django JsonResponse is returned.
+        """
+        entry = await self.store.aget(key)
+        if entry is None:
+            data = await render()
+            entry = (compute_etag(data), data)
+            await self.store.aset(key, entry)
+        etag, data = entry
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return HttpResponseNotModified(headers={'ETag': etag})
+        return JsonResponse(data, encoder=JSONEncoder, headers={'ETag': etag})
+
+    def invalidate_listing(self, listing_id):
+        self.store.delete(self.detail_key(listing_id))
+        self.invalidate_lists()
+
+    def invalidate_lists(self):
+        self.store.incr(LIST_GENERATION_KEY)
+
+    def invalidate_availability_lists(self):
+        self.store.incr(AVAILABILITY_GENERATION_KEY)
+
+    def clear(self):
+        self.store.clear()
+
+
+class NullListingCache(ListingCache):
+
+    def __init__(self):
+        super().__init__(store=None)
+
+    def cached_response(self, request, key, render):
+        return render()
+
+    async def acached_response(self, request, key, render):
+        return JsonResponse(await render(), encoder=JSONEncoder)
+
+    def list_key(self, request):
+        return None
+
+    async def alist_key(self, request):
+        return None
+
+    def invalidate_listing(self, listing_id):
+        pass
+
+    def invalidate_lists(self):
+        pass
+
+    def invalidate_availability_lists(self):
+        pass
+
+    def clear(self):
+        pass
+
+
+def compute_etag(data):
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True).encode('utf-8')
+    return f'"{hashlib.md5(payload).hexdigest()}"'
+
+
+def parse_etags(header):
+    return {etag.strip().removeprefix('W/') for etag in header.split(',') if etag.strip()}
+
+
+_listing_cache = None
+
+
+def get_listing_cache():
+    global _listing_cache
+    if _listing_cache is None:
+        backend = getattr(settings, 'LISTING_CACHE_BACKEND', 'local')
+        timeout = getattr(settings, 'LISTING_CACHE_TIMEOUT', 60)
+        if backend == 'none':
+            _listing_cache = NullListingCache()
+        elif backend == 'local':
+            max_entries = getattr(settings, 'LISTING_CACHE_MAX_ENTRIES', 1000)
+            _listing_cache = ListingCache(LocalLRUCache(max_entries=max_entries, timeout=timeout))
+        else:
+            _listing_cache = ListingCache(SharedCache(backend, timeout=timeout))
+    return _listing_cache
+
+
+def reset_listing_cache():
+    global _listing_cache
+    _listing_cache = None
+
+
+def invalidate_listing(listing_id):
+    """
+    Drop cached payloads for a listing now and again once the surrounding
+    transaction commits, so a read that raced the write cannot leave the
+    pre-commit state cached.
+    """
+    get_listing_cache().invalidate_listing(listing_id)
+    transaction.on_commit(lambda: get_listing_cache().invalidate_listing(listing_id))
+
+
+def invalidate_listing_pages():
+    get_listing_cache().invalidate_lists()
+    transaction.on_commit(lambda: get_listing_cache().invalidate_lists())
+
+
+def invalidate_availability_pages():
+    """invalidate_listing_pages() for the pages filtered by availability only."""
+    get_listing_cache().invalidate_availability_lists()
+    transaction.on_commit(lambda: get_listing_cache().invalidate_availability_lists())
@@ -0,0 +1,161 @@
+"""
+A per-process pool of database connections, for backends Django doesn't
+pool itself (MySQL).
+
+With CONN_MAX_AGE Django keeps one connection per thread. That suits WSGI
+and Celery workers, whose threads live as long as the process. Under ASGI
+every request runs its sync code in a fresh thread, so a per-thread
+connection is never reused and each request pays a new connection.
+PooledDatabaseWrapperMixin turns the backend's close into a return to a
+pool shared by the process's threads, and its connect into a checkout.
+Use it with CONN_MAX_AGE = 0 so Django closes (returns) the connection at
+the end of every request.
+
+Settings, in the database's ``POOL`` dict:
+- SIZE: idle connections kept (default 10). Connections in use aren't
+  capped; any beyond SIZE are closed when they come back.
+- RECYCLE: seconds after which a connection is closed instead of reused
+  (default 3600), to stay under the server's wait_timeout.
+
+With CONN_HEALTH_CHECKS an idle connection is pinged before it is handed
+out, and a dead one is replaced. Connections that saw errors are never
+returned to the pool.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=10, recycle=3600, ping=None):
+        self.connect = connect
+        self.size = size
+        self.recycle = recycle
+        self.ping = ping
+        self.created = {}
+        self.idle = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                connection = self.idle.pop() if self.idle else None
+            if connection is None:
+                connection = self.connect()
+                with self.lock:
+                    self.created[id(connection)] = time.monotonic()
+                return connection
+            if self.expired(connection) or (self.ping is not None and not self.ping(connection)):
+                self.discard(connection)
+                continue
+            return connection
+
+    def release(self, connection):
+        with self.lock:
+            # LIFO: the most recently used connections stay warm, the rest
+            # age out through RECYCLE
+            if len(self.idle) < self.size and not self.expired(connection):
+                self.idle.append(connection)
+                return
+        self.discard(connection)
+
+    def expired(self, connection):
+        created = self.created.get(id(connection))
+        return created is None or time.monotonic() - created >= self.recycle
+
+    def discard(self, connection):
+        with self.lock:
+            self.created.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def clear(self):
+        with self.lock:
+            idle, self.idle = list(self.idle), deque()
+        for connection in idle:
+            self.discard(connection)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias):
+    return _pools.get(alias)
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.clear()
+
+
+def _forget_pools():
+    # A forked child shares its parent's sockets: drop the pools without
+    # closing (and so without sending QUIT over) the parent's connections
+    global _pools, _pools_lock
+    _pools, _pools_lock = {}, threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pools)
+
+
+class PooledDatabaseWrapperMixin:
+    """Mix into a backend's DatabaseWrapper to share connections through a ConnectionPool."""
+
+    def pool(self, conn_params):
+        with _pools_lock:
+            pool = _pools.get(self.alias)
+            if pool is None:
+                options = self.settings_dict.get('POOL') or {}
+                pool = _pools[self.alias] = ConnectionPool(
+                    # Connection parameters are fixed per alias, so the first
+                    # wrapper's can open connections for every thread
+                    lambda connect=super().get_new_connection: connect(conn_params),
+                    size=options.get('SIZE', 10),
+                    recycle=options.get('RECYCLE', 3600),
+                    ping=self.ping if self.settings_dict['CONN_HEALTH_CHECKS'] else None,
+                )
+        return pool
+
+    def get_new_connection(self, conn_params):
+        return self.pool(conn_params).acquire()
+
+    def _close(self):
+        pool = get_pool(self.alias)
+        if self.connection is None or pool is None:
+            return super()._close()
+        # Django keeps using a connection closed inside atomic() until the
+        # block exits, so that one can't go back to the pool either
+        if self.errors_occurred or self.in_atomic_block or not self.reset_connection():
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection)
+
+    def reset_connection(self):
+        try:
+            if self.get_autocommit() != self.settings_dict['AUTOCOMMIT']:
+                # Left in a manual transaction: don't hand its locks on
+                self.connection.rollback()
+                self._set_autocommit(self.settings_dict['AUTOCOMMIT'])
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def ping(connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
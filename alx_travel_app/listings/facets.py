@@ -0,0 +1,73 @@
+"""
+Facet counts for a filtered set of listings, for building a search page
+in one request: listings per location, a price histogram and listings
+per amenity.
+
+All three come from one statement. The listings are grouped by
+(location, price bucket), which gives both the location counts and the
+histogram, and the amenity links of the same listings are grouped by
+amenity. The two GROUP BYs are joined with UNION ALL, so the database
+reads the filtered set once per grouping and there is one round trip
+however many facet values there are.
+"""
+from django.db.models import Case, CharField, Count, IntegerField, Value, When
+
+from .models import ListingAmenity
+
+# Upper bounds of the price histogram's buckets; the last bucket is open
+PRICE_BUCKETS = (50, 100, 150, 200, 300, 500, 1000)
+
+# Locations are free text: only the most common are returned
+MAX_LOCATIONS = 50
+
+
+def price_bucket():
+    return Case(
+        *[When(price_per_night__lt=bound, then=Value(index)) for index, bound in enumerate(PRICE_BUCKETS)],
+        default=Value(len(PRICE_BUCKETS)),
+        output_field=IntegerField(),
+    )
+
+
+def facet_counts(queryset):
+    """
+    {'count', 'locations', 'price', 'amenities'} for the listings in
+    ``queryset``, which may carry filters, annotations and ordering.
+    """
+    listings = queryset.order_by()
+    groups = listings.values('location').annotate(
+        bucket=price_bucket(),
+        amenity_slug=Value(None, output_field=CharField()),
+        amenity_name=Value(None, output_field=CharField()),
+    ).values('location', 'bucket', 'amenity_slug', 'amenity_name').annotate(listings=Count('pk'))
+    amenities = ListingAmenity.objects.filter(listing__in=listings.values('pk')).order_by().annotate(
+        location=Value(None, output_field=CharField()),
+        bucket=Value(None, output_field=IntegerField()),
+    ).values('location', 'bucket', 'amenity__slug', 'amenity__name').annotate(listings=Count('pk'))
+
+    total = 0
+    locations = {}
+    histogram = [0] * (len(PRICE_BUCKETS) + 1)
+    amenity_counts = []
+    for row in groups.union(amenities, all=True):
+        # Rows take the first query's column names
+        if row['bucket'] is None:
+            amenity_counts.append({'slug': row['amenity_slug'], 'name': row['amenity_name'], 'count': row['listings']})
+            continue
+        total += row['listings']
+        locations[row['location']] = locations.get(row['location'], 0) + row['listings']
+        histogram[row['bucket']] += row['listings']
+
+    bounds = (0,) + PRICE_BUCKETS + (None,)
+    return {
+        'count': total,
+        'locations': [
+            {'location': location, 'count': count}
+            for location, count in sorted(locations.items(), key=lambda item: (-item[1], item[0]))[:MAX_LOCATIONS]
+        ],
+        'price': [
+            {'min': bounds[index], 'max': bounds[index + 1], 'count': count}
+            for index, count in enumerate(histogram)
+        ],
+        'amenities': sorted(amenity_counts, key=lambda item: (-item['count'], item['name'])),
+    }
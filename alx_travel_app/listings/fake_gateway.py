@@ -0,0 +1,166 @@
+"""
+A local stand-in for the Chapa API, for tests and latency benchmarks.
+
+FakeGateway serves the initialize and verify endpoints that payments.py
+calls, from memory, on a 127.0.0.1 port in a background thread. It speaks
+HTTP/1.1 with keep-alive and counts the connections it accepts, so callers
+can check that a client reuses its connections. ``latency`` adds a fixed
+delay to every answer. ``fail_next`` makes the next N answers 503s.
+
+    with FakeGateway(secret_key='sk') as gateway:
+        ...  # point settings.CHAPA_API_URL at gateway.url
+        body, signature = gateway.pay(reference)  # a signed webhook
+"""
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .payments import GATEWAY_FAILED, GATEWAY_PENDING, GATEWAY_SUCCESS, sign
+
+VERIFY_PATH = re.compile(r'^/v1/transaction/verify/(?P<reference>[^/]+)$')
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, every
+    # keep-alive answer would wait out the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.gateway.connection_opened()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path != '/v1/transaction/initialize':
+            return self.reply(404, {'message': 'Not found'})
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self.reply(400, {'message': 'Invalid JSON'})
+        self.answer(lambda gateway: gateway.initialize(payload))
+
+    def do_GET(self):
+        match = VERIFY_PATH.match(self.path)
+        if match is None:
+            return self.reply(404, {'message': 'Not found'})
+        self.answer(lambda gateway: gateway.verify(match['reference']))
+
+    def answer(self, handle):
+        gateway = self.server.gateway
+        if gateway.latency:
+            time.sleep(gateway.latency)
+        if gateway.take_failure():
+            return self.reply(503, {'message': 'Service unavailable'})
+        if self.headers.get('Authorization') != f'Bearer {gateway.secret_key}':
+            return self.reply(401, {'message': 'Invalid API key'})
+        self.reply(*handle(gateway))
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class GatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before the answer is written
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeGateway:
+    def __init__(self, secret_key='test-secret-key', webhook_secret='test-webhook-secret',
+                 latency=0.0, port=0):
+        self.secret_key = secret_key
+        self.webhook_secret = webhook_secret
+        self.latency = latency
+        self.port = port
+        self.fail_next = 0
+        self.connections = 0
+        self.transactions = {}
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.server = GatewayServer(('127.0.0.1', self.port), GatewayHandler)
+        self.server.gateway = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def connection_opened(self):
+        with self.lock:
+            self.connections += 1
+
+    def take_failure(self):
+        with self.lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+        return False
+
+    def initialize(self, payload):
+        reference = payload.get('tx_ref')
+        if not reference or not payload.get('amount'):
+            return 400, {'message': 'tx_ref and amount are required', 'status': 'failed'}
+        with self.lock:
+            if reference in self.transactions:
+                return 400, {'message': 'Transaction reference has been used before', 'status': 'failed'}
+            self.transactions[reference] = {
+                'tx_ref': reference,
+                'amount': payload['amount'],
+                'currency': payload.get('currency', 'ETB'),
+                'email': payload.get('email'),
+                'status': GATEWAY_PENDING,
+                'reference': f'CH{uuid.uuid4().hex[:12].upper()}',
+            }
+        return 200, {
+            'message': 'Hosted Link', 'status': 'success',
+            'data': {'checkout_url': f'{self.url}/checkout/{reference}'},
+        }
+
+    def verify(self, reference):
+        with self.lock:
+            transaction = self.transactions.get(reference)
+            if transaction is None:
+                return 404, {'message': 'Invalid transaction or transaction not found', 'status': 'failed'}
+            return 200, {'message': 'Payment details', 'status': 'success', 'data': dict(transaction)}
+
+    def pay(self, reference, succeed=True):
+        """
+        Settle a transaction as the checkout page would, and return the
+        (body, signature) of the webhook the gateway sends for it.
+        """
+        with self.lock:
+            transaction = self.transactions[reference]
+            transaction['status'] = GATEWAY_SUCCESS if succeed else GATEWAY_FAILED
+            event = {'event': f'charge.{transaction["status"]}', **transaction}
+        body = json.dumps(event).encode()
+        return body, sign(body, self.webhook_secret)
@@ -0,0 +1,82 @@
+from django import forms
+from django_filters import rest_framework as filters
+from django_filters.widgets import QueryArrayWidget
+from rest_framework.exceptions import ValidationError
+
+from .amenities import MATCH_ALL, MATCH_ANY, filter_by_amenities
+from .availability import available_listings
+from .models import Booking, Listing
+
+
+class MultipleValueField(forms.Field):
+    """A list of strings from a repeated query parameter: ?location=Accra&location=Nairobi."""
+    widget = QueryArrayWidget
+
+    def to_python(self, value):
+        return sorted(item.strip() for item in value or [] if item.strip())
+
+
+class MultipleValueFilter(filters.Filter):
+    """Rows matching any of the values; a single value stays an equality lookup."""
+    field_class = MultipleValueField
+
+    def filter(self, queryset, value):
+        if not value:
+            return queryset
+        if len(value) == 1:
+            return queryset.filter(**{self.field_name: value[0]})
+        return queryset.filter(**{f'{self.field_name}__in': value})
+
+
+class ListingFilter(filters.FilterSet):
+    location = MultipleValueFilter(label='Location; repeat the parameter to match any of several')
+    min_price = filters.NumberFilter(field_name='price_per_night', lookup_expr='gte', label='Minimum price per night')
+    max_price = filters.NumberFilter(field_name='price_per_night', lookup_expr='lte', label='Maximum price per night')
+    min_rating = filters.NumberFilter(field_name='average_rating', lookup_expr='gte', label='Minimum average rating')
+    max_rating = filters.NumberFilter(field_name='average_rating', lookup_expr='lte', label='Maximum average rating')
+    amenities = filters.CharFilter(method='filter_amenities', label='Comma-separated amenities, e.g. pool,wifi')
+    amenities_match = filters.ChoiceFilter(
+        choices=[(MATCH_ALL, 'All'), (MATCH_ANY, 'Any')],
+        method='filter_noop',
+        label='Require all (default) or any of the amenities',
+    )
+    check_in = filters.DateFilter(method='filter_stay', label='Check-in date (requires check_out)')
+    check_out = filters.DateFilter(method='filter_stay', label='Check-out date (requires check_in)')
+
+    class Meta:
+        model = Listing
+        fields = {
+            'price_per_night': ['exact'],
+            'is_available': ['exact'],
+        }
+
+    def filter_amenities(self, queryset, name, value):
+        match = self.form.cleaned_data.get('amenities_match') or MATCH_ALL
+        return filter_by_amenities(queryset, value.split(','), match=match)
+
+    def filter_noop(self, queryset, name, value):
+        return queryset
+
+    def filter_stay(self, queryset, name, value):
+        # check_in and check_out only make sense together; both are applied
+        # once the second of the pair is seen.
+        check_in = self.form.cleaned_data.get('check_in')
+        check_out = self.form.cleaned_data.get('check_out')
+        if name != 'check_out' or not check_in or not check_out:
+            return queryset
+        if check_in >= check_out:
+            raise ValidationError({
+                "check_out": "Check-out date must be after check-in date."
+            })
+        return available_listings(queryset, check_in, check_out)
+
+
+class BookingFilter(filters.FilterSet):
+    """Filters on the duration and is_active annotations of BookingQuerySet.with_stay_fields()."""
+    is_active = filters.BooleanFilter(label='Only bookings that hold their nights and have not ended')
+    min_duration = filters.NumberFilter(field_name='duration', lookup_expr='gte', label='Minimum nights')
+    max_duration = filters.NumberFilter(field_name='duration', lookup_expr='lte', label='Maximum nights')
+
+    class Meta:
+        model = Booking
+        fields = ['status']
@@ -0,0 +1,254 @@
+"""
+Location search for listings without GIS extensions.
+
+Listings carry a latitude and longitude, and a geohash of them in an
+indexed CharField. A geohash cell is every hash sharing its prefix, which
+is a contiguous range of the index, so a bounding box becomes a handful of
+``geohash >= 'u4pr' AND geohash < 'u4ps'`` range scans that work the same
+on MySQL and SQLite. The exact latitude/longitude bounds and the
+great-circle distance are then checked on the few rows those ranges read.
+
+ListingGeoFilter exposes it on the listing endpoints:
+- ?near=<lat>,<lng>&radius=<km>: listings within ``radius`` km of the
+  point (settings.LISTING_GEO_DEFAULT_RADIUS_KM when left out), annotated
+  with ``distance`` in km and ordered nearest first unless the client
+  asked for ?ordering= or ?search=.
+- ?bbox=<min_lat>,<min_lng>,<max_lat>,<max_lng>: listings inside the box.
+  A box whose min_lng is greater than its max_lng crosses the antimeridian.
+"""
+import math
+
+from django.conf import settings
+from django.db import models
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# 9 characters is a cell of about 5 x 5 m
+GEOHASH_PRECISION = 9
+
+# Most prefix ranges a bounding box is turned into; fewer, coarser cells
+# read a few more rows outside the box but keep the WHERE clause short
+MAX_CELLS = 32
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell of ``precision`` characters."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lng_bits
+
+
+def successor(prefix):
+    """The smallest hash greater than every hash starting with ``prefix``, or None."""
+    while prefix:
+        index = BASE32.index(prefix[-1])
+        if index + 1 < len(BASE32):
+            return prefix[:-1] + BASE32[index + 1]
+        prefix = prefix[:-1]
+    return None
+
+
+def cells_covering(min_lat, min_lng, max_lat, max_lng, max_cells=MAX_CELLS):
+    """
+    The geohash cells, at the finest precision that needs at most
+    ``max_cells`` of them, that together cover the box. The box must not
+    cross the antimeridian.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(int((min_lat + 90) // height), min(int((max_lat + 90) // height), round(180 / height) - 1) + 1)
+        cols = range(int((min_lng + 180) // width), min(int((max_lng + 180) // width), round(360 / width) - 1) + 1)
+        if len(rows) * len(cols) <= max_cells or precision == 1:
+            break
+    return sorted(
+        encode(-90 + (row + 0.5) * height, -180 + (col + 0.5) * width, precision)
+        for row in rows for col in cols
+    )
+
+
+def hash_ranges(cells):
+    """Merge sorted cells into [(start, end)] ranges; end None means unbounded."""
+    ranges = []
+    for cell in cells:
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1] = (ranges[-1][0], successor(cell))
+        else:
+            ranges.append((cell, successor(cell)))
+    return ranges
+
+
+def split_antimeridian(min_lat, min_lng, max_lat, max_lng):
+    """The box as one or two boxes that don't cross the antimeridian."""
+    if min_lng <= max_lng:
+        return [(min_lat, min_lng, max_lat, max_lng)]
+    return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+
+
+def radius_box(latitude, longitude, radius_km):
+    """The (min_lat, min_lng, max_lat, max_lng) box around a circle; min_lng > max_lng across the antimeridian."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    # Near a pole, or when the circle is wider than the globe, every longitude is in
+    cos_lat = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+    if cos_lat <= 0 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    lng_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+    min_lng, max_lng = longitude - lng_delta, longitude + lng_delta
+    if min_lng < -180:
+        min_lng += 360
+    if max_lng > 180:
+        max_lng -= 360
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def box_condition(min_lat, min_lng, max_lat, max_lng, field_prefix=''):
+    """
+    A Q matching rows inside the box: geohash ranges for the index, then
+    the exact latitude/longitude bounds.
+    """
+    condition = Q()
+    for box in split_antimeridian(min_lat, min_lng, max_lat, max_lng):
+        ranges = Q()
+        for start, end in hash_ranges(cells_covering(*box)):
+            bounds = {f'{field_prefix}geohash__gte': start}
+            if end is not None:
+                bounds[f'{field_prefix}geohash__lt'] = end
+            ranges |= Q(**bounds)
+        condition |= ranges & Q(**{
+            f'{field_prefix}latitude__gte': box[0], f'{field_prefix}latitude__lte': box[2],
+            f'{field_prefix}longitude__gte': box[1], f'{field_prefix}longitude__lte': box[3],
+        })
+    return condition
+
+
+def distance_expression(latitude, longitude, field_prefix=''):
+    """Haversine distance in km from the point to the row's coordinates."""
+    lat, lng = F(f'{field_prefix}latitude'), F(f'{field_prefix}longitude')
+    half_chord = (
+        Power(Sin(Radians(lat - Value(latitude)) / 2), 2)
+        + Value(math.cos(math.radians(latitude))) * Cos(Radians(lat)) * Power(Sin(Radians(lng - Value(longitude)) / 2), 2)
+    )
+    # Rounding can push antipodal points just past 1, out of ASIN's domain
+    return models.ExpressionWrapper(
+        2 * EARTH_RADIUS_KM * ASin(Sqrt(Least(half_chord, Value(1.0)))), output_field=FloatField()
+    )
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """``queryset`` narrowed to rows within ``radius_km`` of the point, annotated with ``distance``."""
+    return queryset.filter(box_condition(*radius_box(latitude, longitude, radius_km))).annotate(
+        distance=distance_expression(latitude, longitude)
+    ).filter(distance__lte=radius_km)
+
+
+class GeohashField(models.CharField):
+    """
+    The geohash of the model's latitude and longitude, computed on every
+    save() and bulk_create(); '' without coordinates. queryset.update()
+    doesn't go through it, so updates of the coordinates must go through
+    save().
+    """
+
+    def __init__(self, *args, precision=GEOHASH_PRECISION, **kwargs):
+        self.precision = precision
+        kwargs.setdefault('max_length', precision)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('default', '')
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.precision != GEOHASH_PRECISION:
+            kwargs['precision'] = self.precision
+        for key, default in [('max_length', self.precision), ('editable', False), ('blank', True), ('default', '')]:
+            if kwargs.get(key, not default) == default:
+                kwargs.pop(key, None)
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        if model_instance.latitude is None or model_instance.longitude is None:
+            value = ''
+        else:
+            value = encode(model_instance.latitude, model_instance.longitude, self.precision)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+def parse_floats(value, count, param):
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(math.isfinite(number) for number in numbers):
+        raise ValidationError({param: f'Expected {count} comma-separated numbers.'})
+    return numbers
+
+
+def check_point(latitude, longitude, param):
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValidationError({param: 'Latitude must be within [-90, 90] and longitude within [-180, 180].'})
+
+
+class ListingGeoFilter(BaseFilterBackend):
+    """
+    ?near=&radius= and ?bbox= on the listing endpoints. Radius results are
+    ordered by distance unless the client asked for ?ordering=, so it must
+    come after OrderingFilter in filter_backends; put ListingSearchFilter
+    after it to keep ?search= results ranked by relevance.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        if params.get('bbox'):
+            min_lat, min_lng, max_lat, max_lng = parse_floats(params['bbox'], 4, 'bbox')
+            check_point(min_lat, min_lng, 'bbox')
+            check_point(max_lat, max_lng, 'bbox')
+            if min_lat > max_lat:
+                raise ValidationError({'bbox': 'min_lat must not be greater than max_lat.'})
+            queryset = queryset.filter(box_condition(min_lat, min_lng, max_lat, max_lng))
+
+        if params.get('near'):
+            latitude, longitude = parse_floats(params['near'], 2, 'near')
+            check_point(latitude, longitude, 'near')
+            radius = params.get('radius') or getattr(settings, 'LISTING_GEO_DEFAULT_RADIUS_KM', 10)
+            (radius,) = parse_floats(str(radius), 1, 'radius')
+            max_radius = getattr(settings, 'LISTING_GEO_MAX_RADIUS_KM', 500)
+            if not 0 < radius <= max_radius:
+                raise ValidationError({'radius': f'Radius must be greater than 0 and at most {max_radius} km.'})
+            ordering = queryset.query.order_by
+            queryset = within_radius(queryset, latitude, longitude, radius)
+            if not (params.get(api_settings.ORDERING_PARAM) and ordering):
+                queryset = queryset.order_by('distance')
+        elif params.get('radius'):
+            raise ValidationError({'radius': 'radius needs near=<lat>,<lng>.'})
+        return queryset
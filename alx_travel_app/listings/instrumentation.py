@@ -0,0 +1,266 @@
+"""
+Per-request query and latency metrics.
+
+With settings.LISTING_METRICS_ENABLED, RequestMetricsMiddleware records for
+every request:
+- the number of SQL queries and the time spent in them
+- duplicates: queries run again with the same SQL and parameters
+- the time spent serializing (ExpandableFieldsMixin.to_representation)
+  and rendering the response
+- the total latency
+
+It reports them to the client in a Server-Timing header and adds them to
+an in-process registry, aggregated per view and action
+(``ListingViewSet.list``) with latency and query-count histograms. The
+admin-only /api/metrics/ endpoint serves the registry of the process that
+answers it; every worker process keeps its own.
+
+Queries are counted by an execute wrapper installed on each database
+connection as it opens. The wrapper finds the request's metrics through a
+ContextVar, so it also counts the queries that async views run in worker
+threads. When the setting is off, the middleware drops out of the stack
+and nothing is installed.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('listings_request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = Counter()
+        self.timings = {'serialize': 0.0, 'render': 0.0}
+        self.active = set()
+        self.label = None
+
+    def add_query(self, sql, params, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        self.statements[sql, str(params)] += 1
+
+    @property
+    def duplicates(self):
+        return self.queries - len(self.statements)
+
+    def duplicated_sql(self):
+        return [sql for (sql, _), count in self.statements.items() if count > 1]
+
+    @contextmanager
+    def timing(self, phase):
+        # Nested serializers run inside their parent's to_representation;
+        # only the outermost call adds to the phase
+        if phase in self.active:
+            yield
+            return
+        self.active.add(phase)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.perf_counter() - started
+            self.active.discard(phase)
+
+    def server_timing(self, total_seconds):
+        return ', '.join([
+            f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.queries} queries, {self.duplicates} duplicates"',
+            f'serialize;dur={self.timings["serialize"] * 1000:.1f}',
+            f'render;dur={self.timings["render"] * 1000:.1f}',
+            f'total;dur={total_seconds * 1000:.1f}',
+        ])
+
+
+def current_metrics():
+    """The metrics of the request being handled, or None."""
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, params, time.perf_counter() - started)
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def observe(self, value):
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[index] += 1
+                return
+        self.counts[-1] += 1
+
+    def snapshot(self):
+        labels = [str(bound) for bound in self.bounds] + ['+Inf']
+        return dict(zip(labels, self.counts))
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.queries = 0
+        self.duplicates = 0
+        self.latency_ms = 0.0
+        self.sql_ms = 0.0
+        self.serialize_ms = 0.0
+        self.render_ms = 0.0
+        self.max_latency_ms = 0.0
+        self.max_queries = 0
+        self.latency_histogram = Histogram(LATENCY_BUCKETS_MS)
+        self.query_histogram = Histogram(QUERY_BUCKETS)
+        self.duplicated_sql = Counter()
+
+    def add(self, metrics, latency_ms, status_code):
+        self.requests += 1
+        self.errors += status_code >= 500
+        self.queries += metrics.queries
+        self.duplicates += metrics.duplicates
+        self.latency_ms += latency_ms
+        self.sql_ms += metrics.sql_seconds * 1000
+        self.serialize_ms += metrics.timings['serialize'] * 1000
+        self.render_ms += metrics.timings['render'] * 1000
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self.max_queries = max(self.max_queries, metrics.queries)
+        self.latency_histogram.observe(latency_ms)
+        self.query_histogram.observe(metrics.queries)
+        self.duplicated_sql.update(metrics.duplicated_sql())
+
+    def snapshot(self):
+        requests = self.requests or 1
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'mean_latency_ms': round(self.latency_ms / requests, 2),
+            'max_latency_ms': round(self.max_latency_ms, 2),
+            'mean_queries': round(self.queries / requests, 2),
+            'max_queries': self.max_queries,
+            'mean_sql_ms': round(self.sql_ms / requests, 2),
+            'mean_serialize_ms': round(self.serialize_ms / requests, 2),
+            'mean_render_ms': round(self.render_ms / requests, 2),
+            'duplicate_queries': self.duplicates,
+            'top_duplicated_sql': [sql for sql, _ in self.duplicated_sql.most_common(5)],
+            'latency_ms_histogram': self.latency_histogram.snapshot(),
+            'queries_histogram': self.query_histogram.snapshot(),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def add(self, label, metrics, latency_ms, status_code):
+        with self.lock:
+            stats = self.views.get(label)
+            if stats is None:
+                stats = self.views[label] = ViewStats()
+            stats.add(metrics, latency_ms, status_code)
+
+    def snapshot(self):
+        with self.lock:
+            return {label: stats.snapshot() for label, stats in sorted(self.views.items())}
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+registry = MetricsRegistry()
+
+
+def view_label(view_func, method):
+    """'ListingViewSet.list' for viewsets, 'StatsAPIView.get' for APIViews."""
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    method = method.lower()
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'LISTING_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_recorder, dispatch_uid='listings_record_query')
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection=connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, metrics, response)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, metrics, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.label = view_label(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.timings['render'] += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, metrics, response):
+        total = time.perf_counter() - metrics.started
+        if getattr(settings, 'LISTING_METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing(total)
+        registry.add(metrics.label or 'unresolved', metrics, total * 1000, response.status_code)
+        return response
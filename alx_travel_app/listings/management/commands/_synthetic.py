@@ -0,0 +1,210 @@
+"""
+Synthetic data shared by the benchmark commands. The leading underscore
+keeps Django from treating this module as a command.
+"""
+import math
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from listings.amenities import get_or_create_amenities, normalize_amenities
+from listings.models import BookedNight, Booking, Listing, ListingAmenity, Review
+from listings.search import reset_search_backend
+from listings.stats import reconcile_stats
+
+WORDS = [
+    'beach', 'house', 'ocean', 'view', 'mountain', 'cabin', 'retreat', 'downtown',
+    'apartment', 'modern', 'lakeside', 'villa', 'luxury', 'cozy', 'studio', 'loft',
+    'garden', 'family', 'quiet', 'central', 'historic', 'rustic', 'sunny', 'spacious',
+]
+LOCATIONS = ['Miami, FL', 'Aspen, CO', 'New York, NY', 'Lake Tahoe, CA', 'Accra', 'Addis Ababa', 'Nairobi']
+CITY_CENTERS = {
+    'Miami, FL': (25.7617, -80.1918), 'Aspen, CO': (39.1911, -106.8175), 'New York, NY': (40.7128, -74.0060),
+    'Lake Tahoe, CA': (39.0968, -120.0324), 'Accra': (5.6037, -0.1870), 'Addis Ababa': (8.9806, 38.7578),
+    'Nairobi': (-1.2921, 36.8219),
+}
+# Listings are scattered up to this far from their city's center
+CITY_RADIUS_KM = 30
+FIRST_NAMES = ['Abebe', 'Amara', 'Chen', 'Diego', 'Fatima', 'Kofi', 'Lena', 'Noah', 'Priya', 'Sara']
+LAST_NAMES = ['Bekele', 'Garcia', 'Kim', 'Mensah', 'Novak', 'Okafor', 'Rossi', 'Silva', 'Smith', 'Tanaka']
+AMENITIES = ['WiFi', 'Pool', 'Parking', 'Gym', 'Fireplace', 'Hot Tub', 'Beach Access', 'Concierge']
+
+
+def scatter(rng, location):
+    """A (latitude, longitude) within CITY_RADIUS_KM of the location's center, denser towards it."""
+    latitude, longitude = CITY_CENTERS[location]
+    distance, bearing = CITY_RADIUS_KM * rng.random() / 111.2, rng.uniform(0, 2 * math.pi)
+    return (
+        round(latitude + distance * math.cos(bearing), 6),
+        round(longitude + distance * math.sin(bearing) / math.cos(math.radians(latitude)), 6),
+    )
+
+
+def generate_listings(count, rng, batch_size=5000):
+    """
+    Bulk-insert ``count`` listings for a benchmark host. bulk_create skips
+    save signals, so amenity links and the search index are not touched.
+    """
+    host, _ = User.objects.get_or_create(username='benchmark_host')
+    batch = []
+    for i in range(count):
+        words = rng.sample(WORDS, 6)
+        location = rng.choice(LOCATIONS)
+        latitude, longitude = scatter(rng, location)
+        batch.append(Listing(
+            title=' '.join(words[:3]).title(),
+            description=f'{" ".join(words)} near {rng.choice(LOCATIONS)} #{i}',
+            price_per_night=Decimal(rng.randint(30, 500)),
+            location=location, latitude=latitude, longitude=longitude,
+            amenities=', '.join(rng.sample(AMENITIES, 3)),
+            host=host,
+        ))
+        if len(batch) >= batch_size:
+            Listing.objects.bulk_create(batch)
+            batch = []
+    Listing.objects.bulk_create(batch)
+    return host
+
+
+def spread(total, parts, index):
+    """The share of ``total`` items that part ``index`` of ``parts`` gets; shares differ by at most one."""
+    return total * (index + 1) // parts - total * index // parts
+
+
+def seeded_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def generate_users(count, rng, prefix='synthetic', password='password123', batch_size=5000):
+    """
+    Bulk-insert ``count`` users named ``<prefix>_<n>`` and return their ids.
+    The password is hashed once and shared: hashing it per user would take
+    longer than everything else here.
+    """
+    hashed = make_password(password)
+    for start in range(0, count, batch_size):
+        User.objects.bulk_create([
+            User(
+                username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=hashed,
+                first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+            )
+            for i in range(start, min(start + batch_size, count))
+        ])
+    # MySQL doesn't return auto-increment ids from bulk inserts
+    return list(
+        User.objects.filter(username__startswith=f'{prefix}_').order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def generate_dataset(rng, listings, users, bookings, reviews, batch_size=5000, prefix='synthetic', progress=None):
+    """
+    Bulk-insert a deterministic (for a given ``rng`` seed) dataset:
+    ``users`` users, the first tenth of them hosts; ``listings`` listings
+    with their amenity links; ``bookings`` bookings spread evenly over the
+    listings, never overlapping on a listing, with the BookedNight rows of
+    the active ones; and up to ``reviews`` reviews with the listings'
+    rating aggregates filled in. As through the API, a review comes from
+    the guest of a completed booking of the listing, once per guest, so
+    there can be fewer reviews than asked for when too few bookings are
+    completed. Rows are generated and written ``batch_size`` listings at a
+    time, so memory stays flat at any size.
+
+    bulk_create skips the save signals: the stats rollup is rebuilt with
+    reconcile_stats() and the search index is left for the next search to
+    build. ``progress(counts)`` is called with the rows written so far,
+    {table: rows}, after the users and after every batch of listings.
+    Returns the final counts.
+    """
+    progress = progress or (lambda counts: None)
+    counts = {'users': 0, 'listings': 0, 'amenity links': 0, 'bookings': 0, 'booked nights': 0, 'reviews': 0}
+
+    def write(model, rows, table):
+        model.objects.bulk_create(rows, batch_size=batch_size)
+        counts[table] += len(rows)
+
+    user_ids = generate_users(users, rng, prefix=prefix, batch_size=batch_size)
+    counts['users'] = len(user_ids)
+    progress(counts)
+    host_ids = user_ids[:max(1, len(user_ids) // 10)]
+    by_slug = {amenity.slug: amenity.pk for amenity in get_or_create_amenities(AMENITIES)}
+    amenities = {name: by_slug[slug] for slug, name in normalize_amenities(AMENITIES).items()}
+    today = date.today()
+    # Reviews a listing couldn't take for lack of completed bookings are
+    # handed on to the next ones
+    owed_reviews = 0
+
+    for start in range(0, listings, batch_size):
+        listing_rows, links, booking_rows, nights, review_rows = [], [], [], [], []
+        for index in range(start, min(start + batch_size, listings)):
+            words = rng.sample(WORDS, 6)
+            location = rng.choice(LOCATIONS)
+            latitude, longitude = scatter(rng, location)
+            names = rng.sample(AMENITIES, rng.randint(1, 4))
+            listing = Listing(
+                listing_id=seeded_uuid(rng),
+                title=' '.join(words[:3]).title(),
+                description=f'{" ".join(words)} near {location} #{index}',
+                price_per_night=Decimal(rng.randint(30, 500)),
+                location=location, latitude=latitude, longitude=longitude,
+                amenities=', '.join(names),
+                host_id=rng.choice(host_ids),
+            )
+            listing_rows.append(listing)
+            links += [ListingAmenity(listing_id=listing.pk, amenity_id=amenities[name]) for name in names]
+
+            # Consecutive stays separated by random gaps never overlap
+            check_in = today - timedelta(days=rng.randint(0, 120))
+            completed_guests = []
+            for _ in range(spread(bookings, listings, index)):
+                stay = rng.randint(1, 7)
+                check_out = check_in + timedelta(days=stay)
+                if check_out <= today:
+                    status = Booking.STATUS_CANCELLED if rng.random() < 0.1 else Booking.STATUS_COMPLETED
+                else:
+                    status = rng.choices(
+                        [Booking.STATUS_CONFIRMED, Booking.STATUS_PENDING, Booking.STATUS_CANCELLED], [7, 2, 1],
+                    )[0]
+                booking = Booking(
+                    booking_id=seeded_uuid(rng), listing_id=listing.pk, guest_id=rng.choice(user_ids),
+                    check_in_date=check_in, check_out_date=check_out,
+                    total_price=listing.price_per_night * stay, status=status,
+                )
+                booking_rows.append(booking)
+                if status == Booking.STATUS_COMPLETED and booking.guest_id not in completed_guests:
+                    completed_guests.append(booking.guest_id)
+                if booking.holds_nights:
+                    nights += [
+                        BookedNight(listing_id=listing.pk, booking_id=booking.pk, night=check_in + timedelta(days=n))
+                        for n in range(stay)
+                    ]
+                check_in = check_out + timedelta(days=rng.randint(0, 30))
+
+            # One review per guest with a completed stay
+            wanted = spread(reviews, listings, index) + owed_reviews
+            count = min(wanted, len(completed_guests))
+            owed_reviews = wanted - count
+            ratings = rng.choices([1, 2, 3, 4, 5], [1, 1, 3, 6, 9], k=count)
+            for reviewer, rating in zip(rng.sample(completed_guests, count), ratings):
+                review_rows.append(Review(
+                    review_id=seeded_uuid(rng), listing_id=listing.pk, reviewer_id=reviewer,
+                    rating=rating, comment=f'{rng.choice(WORDS).title()} stay, {rng.choice(WORDS)} place.',
+                ))
+            listing.review_count, listing.rating_sum = count, sum(ratings)
+            listing.average_rating = listing.rating_sum / count if count else 0
+
+        # One commit per chunk rather than one per INSERT
+        with transaction.atomic():
+            write(Listing, listing_rows, 'listings')
+            write(ListingAmenity, links, 'amenity links')
+            write(Booking, booking_rows, 'bookings')
+            write(BookedNight, nights, 'booked nights')
+            write(Review, review_rows, 'reviews')
+        progress(counts)
+
+    reconcile_stats()
+    reset_search_backend()
+    return counts
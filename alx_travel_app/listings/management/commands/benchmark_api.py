@@ -0,0 +1,267 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client, override_settings
+
+from listings.cache import reset_listing_cache
+from listings.management.commands._synthetic import CITY_CENTERS, WORDS, generate_dataset
+from listings.models import Booking, Listing
+from listings.search import reset_search_backend
+
+SCALES = {
+    '10k': {'listings': 10_000, 'users': 1_000, 'bookings': 20_000, 'reviews': 10_000},
+    '100k': {'listings': 100_000, 'users': 10_000, 'bookings': 200_000, 'reviews': 100_000},
+    '1m': {'listings': 1_000_000, 'users': 100_000, 'bookings': 2_000_000, 'reviews': 1_000_000},
+}
+
+# A slower p50 or bigger peak than the baseline only counts as a
+# regression beyond both the relative tolerance and these floors, which
+# keep timer and allocator noise on sub-millisecond requests out
+LATENCY_FLOOR_MS = 1.0
+MEMORY_FLOOR_KIB = 64
+
+# Scenarios that read a share of every table, timed fewer times
+REQUEST_LIMITS = {'export-bookings': 5}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every API endpoint through the test client on a seeded dataset: '
+        'p50/p99 latency, queries and peak memory per request, compared with a saved baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='10k', help='Dataset size (default: 10k listings)')
+        parser.add_argument('--use-existing', action='store_true',
+                            help='Benchmark the data already in the database instead of generating it')
+        parser.add_argument('--keep', action='store_true', help='Commit the generated data instead of rolling it back')
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per scenario (default: 50)')
+        parser.add_argument('--scenario', action='append', dest='scenarios', help='Scenario to run (repeatable)')
+        parser.add_argument('--baseline', help='Baseline file (default: benchmarks/<scale>-<database>.json)')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results to the baseline file')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p50 latency and memory growth over the baseline (default: 0.25)')
+        parser.add_argument('--cache', action='store_true', help='Keep the listing response cache on')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+
+    def handle(self, *args, **options):
+        vendor = connections[DEFAULT_DB_ALIAS].vendor
+        label = 'existing' if options['use_existing'] else options['scale']
+        baseline_path = Path(options['baseline'] or settings.BASE_DIR / 'benchmarks' / f'{label}-{vendor}.json')
+
+        with override_settings(**({} if options['cache'] else {'LISTING_CACHE_BACKEND': 'none'})):
+            reset_listing_cache()
+            try:
+                with transaction.atomic():
+                    if not options['use_existing']:
+                        self.generate(options['scale'], options['seed'])
+                    results = self.run(options)
+                    transaction.set_rollback(not options['keep'])
+            finally:
+                reset_listing_cache()
+                reset_search_backend()
+
+        if options['save_baseline']:
+            failed = [name for name, result in results.items() if result['errors']]
+            if failed:
+                raise CommandError(f'Not saving a baseline with failed requests in: {", ".join(failed)}')
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(
+                {'scale': label, 'database': vendor, 'requests': options['requests'], 'results': results},
+                indent=2, sort_keys=True,
+            ) + '\n')
+            self.stdout.write(f'Saved the baseline to {baseline_path}')
+        elif baseline_path.exists():
+            self.compare(results, json.loads(baseline_path.read_text())['results'], options['tolerance'])
+        else:
+            self.stdout.write(f'No baseline at {baseline_path}; run with --save-baseline to record one.')
+
+    def generate(self, scale, seed):
+        counts = SCALES[scale]
+        self.stdout.write(f'Generating the {scale} dataset...')
+        started = time.perf_counter()
+        # Not seed's random stream: its rows (and so primary keys) may already be there
+        written = generate_dataset(random.Random(f'benchmark-{seed}'), prefix='benchmark', **counts)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{sum(written.values())} rows in {elapsed:.1f}s')
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        context = self.context()
+        if context is None:
+            raise CommandError('No bookings to benchmark against; drop --use-existing or seed the database first.')
+        scenarios = self.scenarios(context)
+        unknown = set(options['scenarios'] or []) - set(scenarios)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}. Choose from: {", ".join(scenarios)}')
+
+        self.stdout.write(
+            f'{"scenario":<24}{"p50 ms":>10}{"p99 ms":>10}{"queries":>9}{"peak KiB":>10}{"errors":>8}'
+        )
+        results = {}
+        for name, (client, request) in scenarios.items():
+            if options['scenarios'] and name not in options['scenarios']:
+                continue
+            count = min(options['requests'], REQUEST_LIMITS.get(name, options['requests']))
+            results[name] = result = self.measure(client, request, count, rng)
+            self.stdout.write(
+                f'{name:<24}{result["p50_ms"]:>10.2f}{result["p99_ms"]:>10.2f}{result["queries"]:>9}'
+                f'{result["peak_kib"]:>10.0f}{result["errors"]:>8}'
+            )
+        return results
+
+    def context(self):
+        """The users, listings and booking the scenarios act on."""
+        booking = Booking.objects.order_by('pk').first()
+        if booking is None:
+            return None
+        admin, _ = User.objects.get_or_create(
+            username='benchmark_admin', defaults={'is_staff': True, 'is_superuser': True},
+        )
+        guest = Client()
+        guest.force_login(booking.guest)
+        staff = Client()
+        staff.force_login(admin)
+        listing_ids = [str(pk) for pk in Listing.objects.order_by('pk').values_list('pk', flat=True)[:200]]
+        return {
+            'anonymous': Client(), 'guest': guest, 'admin': staff,
+            'listing_ids': listing_ids, 'booking_id': str(booking.pk), 'today': date.today(),
+        }
+
+    def scenarios(self, context):
+        """
+        {name: (client, request(i, rng) -> (method, path, data))} covering
+        every endpoint in alx_travel_app/urls.py.
+        """
+        anonymous, guest, admin = context['anonymous'], context['guest'], context['admin']
+        listing_ids, today = context['listing_ids'], context['today']
+
+        def listing(rng):
+            return rng.choice(listing_ids)
+
+        def stay(rng):
+            check_in = today + timedelta(days=rng.randint(1, 300))
+            return {'check_in': check_in.isoformat(), 'check_out': (check_in + timedelta(days=rng.randint(1, 7))).isoformat()}
+
+        def new_booking(i, rng):
+            # A listing and dates no earlier request (or generated booking) holds
+            check_in = today + timedelta(days=400 + 10 * (i // len(listing_ids)))
+            return 'post', '/api/bookings/', {
+                'listing_id': listing_ids[i % len(listing_ids)],
+                'check_in_date': check_in.isoformat(),
+                'check_out_date': (check_in + timedelta(days=3)).isoformat(),
+            }
+
+        return {
+            'listing-list': (anonymous, lambda i, rng: ('get', '/api/listings/', {})),
+            'listing-list-expand': (anonymous, lambda i, rng: ('get', '/api/listings/', {'expand': 'host', 'page_size': 50})),
+            'listing-filter': (anonymous, lambda i, rng: ('get', '/api/listings/', {
+                'location': 'Accra', 'min_rating': 4, 'ordering': '-price_per_night',
+            })),
+            'listing-amenities': (anonymous, lambda i, rng: ('get', '/api/listings/', {'amenities': 'wifi,pool'})),
+            'listing-stay': (anonymous, lambda i, rng: ('get', '/api/listings/', stay(rng))),
+            'listing-search': (anonymous, lambda i, rng: ('get', '/api/listings/', {'search': rng.choice(WORDS)})),
+            'listing-facets': (anonymous, lambda i, rng: ('get', '/api/listings/facets/', {
+                'location': rng.sample(list(CITY_CENTERS), 2), 'min_price': 100, 'max_price': 300,
+            })),
+            'listing-near': (anonymous, lambda i, rng: ('get', '/api/listings/', {
+                'near': '{},{}'.format(*rng.choice(list(CITY_CENTERS.values()))), 'radius': 10,
+            })),
+            'listing-detail': (anonymous, lambda i, rng: ('get', f'/api/listings/{listing(rng)}/', {})),
+            'listing-availability': (anonymous, lambda i, rng: (
+                'get', f'/api/listings/{listing(rng)}/availability/', stay(rng),
+            )),
+            'review-list': (guest, lambda i, rng: ('get', '/api/reviews/', {'expand': 'reviewer'})),
+            'booking-list': (guest, lambda i, rng: ('get', '/api/bookings/', {})),
+            'booking-detail': (guest, lambda i, rng: ('get', f'/api/bookings/{context["booking_id"]}/', {})),
+            'booking-create': (guest, new_booking),
+            'payment-list': (guest, lambda i, rng: ('get', '/api/payments/', {})),
+            'user-me': (guest, lambda i, rng: ('get', '/api/users/me/', {})),
+            'stats': (guest, lambda i, rng: ('get', '/api/stats/', {})),
+            'stats-breakdown': (guest, lambda i, rng: ('get', '/api/stats/', {'breakdown': 'location'})),
+            'async-listing-list': (anonymous, lambda i, rng: ('get', '/api/async/listings/', {})),
+            'async-listing-detail': (anonymous, lambda i, rng: ('get', f'/api/async/listings/{listing(rng)}/', {})),
+            'async-availability': (anonymous, lambda i, rng: (
+                'get', f'/api/async/listings/{listing(rng)}/availability/', stay(rng),
+            )),
+            'async-stats': (guest, lambda i, rng: ('get', '/api/async/stats/', {})),
+            'export-bookings': (admin, lambda i, rng: ('get', '/api/exports/bookings/', {'status': 'pending'})),
+            'metrics': (admin, lambda i, rng: ('get', '/api/metrics/', {})),
+        }
+
+    def measure(self, client, request, count, rng):
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries[-1] += 1
+            return execute(sql, params, many, context)
+
+        def call(i):
+            method, path, data = request(i, rng)
+            queries.append(0)
+            started = time.perf_counter()
+            if method == 'post':
+                response = client.post(path, data, content_type='application/json')
+            else:
+                response = client.get(path, data)
+            # Streamed responses do their work while they are read
+            if response.streaming:
+                b''.join(response.streaming_content)
+            else:
+                response.content
+            return (time.perf_counter() - started) * 1000, response.status_code >= 400
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count_query))
+            call(0)  # warm-up: lazy imports, the search index, the query plan cache
+            latencies, errors = [], 0
+            for i in range(1, count + 1):
+                elapsed, failed = call(i)
+                latencies.append(elapsed)
+                errors += failed
+            request_queries = queries[1:]
+
+            tracemalloc.start()
+            try:
+                call(count + 1)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p99_ms': round(latencies[max(0, int(len(latencies) * 0.99) - 1)], 3),
+            'queries': max(request_queries),
+            'peak_kib': round(peak / 1024, 1),
+            'errors': errors,
+        }
+
+    def compare(self, results, baseline, tolerance):
+        regressions = []
+        for name, result in results.items():
+            if result['errors']:
+                regressions.append(f'{name}: {result["errors"]} requests failed')
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                regressions.append(f'{name}: {result["queries"]} queries per request, baseline {expected["queries"]}')
+            if result['p50_ms'] > max(expected['p50_ms'] * (1 + tolerance), expected['p50_ms'] + LATENCY_FLOOR_MS):
+                regressions.append(f'{name}: p50 {result["p50_ms"]:.2f} ms, baseline {expected["p50_ms"]:.2f} ms')
+            if result['peak_kib'] > max(expected['peak_kib'] * (1 + tolerance), expected['peak_kib'] + MEMORY_FLOOR_KIB):
+                regressions.append(f'{name}: peak {result["peak_kib"]:.0f} KiB, baseline {expected["peak_kib"]:.0f} KiB')
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against the baseline ({len(results)} scenarios)'))
@@ -0,0 +1,85 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIClient
+
+from listings.management.commands._synthetic import AMENITIES, LOCATIONS, WORDS
+from listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Compare one POST per item with the bulk listing and booking endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=2000, help='Listings and bookings to create per path (default: 2000)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Items per bulk request (default: 1000)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+
+    def handle(self, *args, **options):
+        count, batch_size = options['items'], options['batch_size']
+        rng = random.Random(options['seed'])
+        listings = [self.listing_payload(rng, i) for i in range(count)]
+
+        self.stdout.write(f'{"path":<12}{"items":>8}{"per-item s":>12}{"bulk s":>10}{"speedup":>10}')
+        # Everything is written inside a transaction that is rolled back
+        with transaction.atomic():
+            client = APIClient()
+            client.force_authenticate(User.objects.get_or_create(username='benchmark_host')[0])
+
+            single = self.time(lambda: [self.post(client, '/api/listings/', item, 201) for item in listings])
+            bulk = self.time(lambda: self.post_batches(client, '/api/listings/bulk/', listings, batch_size))
+            self.report('listings', count, single, bulk)
+
+            listing_ids = list(Listing.objects.order_by('pk').values_list('pk', flat=True)[:count])
+            start = date.today() + timedelta(days=1)
+            # Two disjoint sets of stays so both paths book free nights
+            single_items = self.booking_payloads(listing_ids, count, start)
+            bulk_items = self.booking_payloads(listing_ids, count, start + timedelta(days=3 * count))
+            single = self.time(lambda: [self.post(client, '/api/bookings/', item, 201) for item in single_items])
+            bulk = self.time(lambda: self.post_batches(client, '/api/bookings/bulk/', bulk_items, batch_size))
+            self.report('bookings', count, single, bulk)
+
+            transaction.set_rollback(True)
+
+    def listing_payload(self, rng, i):
+        words = rng.sample(WORDS, 6)
+        return {
+            'title': ' '.join(words[:3]).title(),
+            'description': f'{" ".join(words)} #{i}',
+            'price_per_night': str(rng.randint(30, 500)),
+            'location': rng.choice(LOCATIONS),
+            'amenities': ', '.join(rng.sample(AMENITIES, 3)),
+        }
+
+    def booking_payloads(self, listing_ids, count, start):
+        items = []
+        for i in range(count):
+            check_in = start + timedelta(days=3 * (i // len(listing_ids)))
+            items.append({
+                'listing_id': str(listing_ids[i % len(listing_ids)]),
+                'check_in_date': check_in.isoformat(),
+                'check_out_date': (check_in + timedelta(days=2)).isoformat(),
+            })
+        return items
+
+    def post(self, client, url, payload, expected_status):
+        response = client.post(url, payload, format='json')
+        if response.status_code != expected_status:
+            raise RuntimeError(f'{url} returned {response.status_code}: {response.data}')
+        return response
+
+    def post_batches(self, client, url, items, batch_size):
+        for offset in range(0, len(items), batch_size):
+            self.post(client, url, items[offset:offset + batch_size], 201)
+
+    def time(self, run):
+        started = time.perf_counter()
+        run()
+        return time.perf_counter() - started
+
+    def report(self, path, count, single, bulk):
+        self.stdout.write(f'{path:<12}{count:>8}{single:>12.2f}{bulk:>10.2f}{single / max(bulk, 0.001):>9.1f}x')
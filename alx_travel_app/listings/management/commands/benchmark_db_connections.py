@@ -0,0 +1,194 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+
+from listings.cache import reset_listing_cache
+from listings.db.pool import PooledDatabaseWrapperMixin, close_pools
+from listings.models import Listing
+
+MODES = ['reconnect', 'persistent', 'pooled']
+SERVERS = ['wsgi', 'asgi']
+
+
+class ConnectCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.seconds += seconds
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the per-request cost of database connections: reconnecting every '
+        'request, persistent per-thread connections, and the connection pool, under '
+        'WSGI and ASGI'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run (default: 2000)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (default: 8)')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES, help='Mode to run (repeatable)')
+        parser.add_argument('--server', action='append', dest='servers', choices=SERVERS,
+                            help='Server to run (repeatable)')
+
+    def handle(self, *args, **options):
+        listing_ids = list(Listing.objects.values_list('pk', flat=True)[:100])
+        if not listing_ids:
+            self.stderr.write('No listings to read; run seed first.')
+            return
+        paths = [f'/api/listings/{listing_ids[i % len(listing_ids)]}/' for i in range(options['requests'])]
+        self.stdout.write(
+            f'{options["requests"]} listing detail requests, concurrency {options["concurrency"]}, '
+            f'{connections[DEFAULT_DB_ALIAS].vendor}'
+        )
+        self.stdout.write(
+            f'{"server":<8}{"mode":<12}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}'
+            f'{"connects":>10}{"connect ms/req":>16}'
+        )
+        # Responses from the listing cache would skip the database entirely
+        with override_settings(LISTING_CACHE_BACKEND='none'):
+            reset_listing_cache()
+            try:
+                for server in options['servers'] or SERVERS:
+                    for mode in options['modes'] or MODES:
+                        self.run(server, mode, paths, options['concurrency'])
+            finally:
+                reset_listing_cache()
+
+    def run(self, server, mode, paths, concurrency):
+        counter = ConnectCounter()
+        with connection_mode(mode, counter):
+            if server == 'wsgi':
+                elapsed, latencies = self.run_wsgi(paths, concurrency)
+            else:
+                elapsed, latencies = asyncio.run(self.run_asgi(paths, concurrency))
+        latencies.sort()
+        self.stdout.write(
+            f'{server:<8}{mode:<12}{len(paths) / elapsed:>10.0f}{statistics.median(latencies):>10.2f}'
+            f'{latencies[int(len(latencies) * 0.99) - 1]:>10.2f}{counter.count:>10}'
+            f'{counter.seconds * 1000 / len(paths):>16.3f}'
+        )
+
+    def run_wsgi(self, paths, concurrency):
+        handler = WSGIHandler()
+
+        def call(path):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'testserver', 'wsgi.url_scheme': 'http',
+                'wsgi.input': BytesIO(), 'wsgi.errors': BytesIO(),
+            }
+            started = time.perf_counter()
+            response = handler(environ, lambda status, headers: None)
+            b''.join(response)
+            # What the WSGI server does; fires request_finished, which
+            # closes or keeps the connection
+            response.close()
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(call, paths))
+        return time.perf_counter() - started, latencies
+
+    async def run_asgi(self, paths, concurrency):
+        handler = ASGIHandler()
+        queue = asyncio.Queue()
+        for path in paths:
+            queue.put_nowait(path)
+        latencies = []
+
+        async def call(path):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+                'headers': [(b'host', b'testserver')],
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await asyncio.Event().wait()  # no disconnect until the response is sent
+
+            async def send(message):
+                pass
+
+            await handler(scope, receive, send)
+
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                started = time.perf_counter()
+                await call(path)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return time.perf_counter() - started, latencies
+
+
+@contextmanager
+def connection_mode(mode, counter):
+    """
+    Make new connections to the default database in ``mode``, counting
+    and timing the real connects in ``counter``. Only threads that open
+    their connection inside the block are affected, which is every thread
+    the benchmark starts.
+    """
+    # The configured backend without the pool, whatever the settings say
+    backend = next(
+        cls for cls in type(connections[DEFAULT_DB_ALIAS]).__mro__
+        if cls.__name__ == 'DatabaseWrapper' and cls.__module__.startswith('django.db.backends.')
+    )
+
+    class CountingDatabaseWrapper(backend):
+        def get_new_connection(self, conn_params):
+            started = time.perf_counter()
+            connection = super().get_new_connection(conn_params)
+            counter.add(time.perf_counter() - started)
+            return connection
+
+    class PooledCountingDatabaseWrapper(PooledDatabaseWrapperMixin, CountingDatabaseWrapper):
+        pass
+
+    wrapper_class = PooledCountingDatabaseWrapper if mode == 'pooled' else CountingDatabaseWrapper
+    settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+    saved = dict(settings_dict)
+    settings_dict['CONN_MAX_AGE'] = 60 if mode == 'persistent' else 0
+    settings_dict.setdefault('POOL', {})
+    create_connection = connections.create_connection
+
+    def create(alias):
+        if alias == DEFAULT_DB_ALIAS:
+            return wrapper_class(connections.settings[alias], alias)
+        return create_connection(alias)
+
+    connections.close_all()
+    close_pools()
+    connections.create_connection = create
+    try:
+        yield
+    finally:
+        del connections.create_connection
+        settings_dict.clear()
+        settings_dict.update(saved)
+        connections.close_all()
+        close_pools()
@@ -0,0 +1,65 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from listings.fake_gateway import FakeGateway
+from listings.payments import GatewayClient
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure gateway call latency against the local fake gateway with a pooled '
+        'keep-alive session and with a new connection per call'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Verify calls per mode (default: 1000)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent callers (default: 8)')
+        parser.add_argument('--latency-ms', type=float, default=0, help='Delay the fake gateway adds (default: 0)')
+
+    def handle(self, *args, **options):
+        with FakeGateway() as gateway:
+            setup = GatewayClient(gateway.url, gateway.secret_key)
+            references = []
+            for _ in range(50):
+                payment = SimpleNamespace(amount=Decimal('100.00'), reference=f'tx-{uuid.uuid4().hex}')
+                setup.initialize(payment, 'bench@example.com')
+                references.append(payment.reference)
+            setup.close()
+            gateway.latency = options['latency_ms'] / 1000
+
+            calls = [references[i % len(references)] for i in range(options['requests'])]
+            self.stdout.write(f'{options["requests"]} calls, concurrency {options["concurrency"]}')
+            self.stdout.write(f'{"mode":<12}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"connections":>13}')
+
+            pooled = GatewayClient(gateway.url, gateway.secret_key, pool_size=options['concurrency'])
+            self.run('pooled', gateway, calls, options['concurrency'], lambda: pooled)
+            pooled.close()
+            self.run('per-call', gateway, calls, options['concurrency'],
+                     lambda: GatewayClient(gateway.url, gateway.secret_key))
+
+    def run(self, mode, gateway, calls, concurrency, client_for_call):
+        opened = gateway.connections
+
+        def call(reference):
+            client = client_for_call()
+            started = time.perf_counter()
+            client.verify(reference)
+            elapsed = (time.perf_counter() - started) * 1000
+            if mode == 'per-call':
+                client.close()
+            return elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = sorted(pool.map(call, calls))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{mode:<12}{len(calls) / elapsed:>10.0f}{statistics.median(latencies):>10.2f}'
+            f'{latencies[int(len(latencies) * 0.99) - 1]:>10.2f}{gateway.connections - opened:>13}'
+        )
@@ -0,0 +1,70 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from listings.geo import ListingGeoFilter, distance_expression
+from listings.management.commands._synthetic import CITY_CENTERS, generate_listings, scatter
+from listings.views import ListingViewSet
+
+DEFAULT_RADII = [1, 5, 25, 100]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare ?near= radius search over the geohash index with computing the distance '
+        'to every listing, on synthetic listings scattered around a few cities'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1_000_000, help='Listings to generate (default: 1000000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per radius (default: 5)')
+        parser.add_argument('--radius', action='append', dest='radii', type=float, help='Radius in km (repeatable)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Everything is generated inside a transaction that is rolled back
+        with transaction.atomic():
+            started = time.perf_counter()
+            generate_listings(options['listings'], rng)
+            self.stdout.write(f'{options["listings"]} listings generated in {time.perf_counter() - started:.1f}s')
+
+            base = ListingViewSet.queryset
+            factory = RequestFactory()
+            self.stdout.write(f'{"radius km":<12}{"hits":>8}{"scan ms":>12}{"geohash ms":>12}{"speedup":>10}')
+            for radius in options['radii'] or DEFAULT_RADII:
+                latitude, longitude = scatter(rng, rng.choice(list(CITY_CENTERS)))
+                request = Request(factory.get('/api/listings/', {'near': f'{latitude},{longitude}', 'radius': radius}))
+                scan_ms, expected = self.time_page(
+                    lambda: base.annotate(distance=distance_expression(latitude, longitude))
+                    .filter(distance__lte=radius).order_by('distance'),
+                    options['repeat'],
+                )
+                indexed_ms, hits = self.time_page(
+                    lambda: ListingGeoFilter().filter_queryset(request, base, ListingViewSet()),
+                    options['repeat'],
+                )
+                if hits != expected:
+                    self.stderr.write(f'{radius} km: the geohash search found {hits} listings, the scan {expected}')
+                self.stdout.write(
+                    f'{radius:<12g}{hits:>8}{scan_ms:>12.1f}{indexed_ms:>12.1f}'
+                    f'{scan_ms / max(indexed_ms, 0.001):>9.1f}x'
+                )
+
+            transaction.set_rollback(True)
+
+    def time_page(self, search, repeat):
+        """Time what one paginated request costs: the search, COUNT and the first page."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = search()
+            hits = queryset.count()
+            list(queryset[:20])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), hits
@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+
+from listings.management.commands._synthetic import generate_listings
+from listings.models import Listing
+from listings.pagination import KeysetPagination
+
+DEFAULT_PAGES = [1, 10, 100, 1000, 10000]
+
+
+class Command(BaseCommand):
+    help = 'Compare page-number (OFFSET) and keyset pagination latency at increasing page depth'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=200000, help='Listings to generate (default: 200000)')
+        parser.add_argument('--page-size', type=int, default=20, help='Rows per page (default: 20)')
+        parser.add_argument('--page', type=int, action='append', dest='pages', help='Page number to time (repeatable)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per page (default: 5)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        pages = options['pages'] or DEFAULT_PAGES
+        # Everything is generated inside a transaction that is rolled back
+        with transaction.atomic():
+            generate_listings(options['listings'], random.Random(options['seed']))
+            queryset = Listing.objects.order_by('-created_at')
+            total = queryset.count()
+
+            self.stdout.write(f'{"page":>8}{"OFFSET ms":>12}{"keyset ms":>12}')
+            for page in pages:
+                offset = (page - 1) * page_size
+                if offset >= total:
+                    self.stdout.write(f'{page:>8}  beyond the {total} generated rows')
+                    continue
+                offset_ms = self.time(lambda: self.page_number(queryset, page, page_size), options['repeat'])
+                cursor_request = self.keyset_request(queryset, offset, page_size)
+                keyset_ms = self.time(lambda: self.keyset(queryset, cursor_request), options['repeat'])
+                self.stdout.write(f'{page:>8}{offset_ms:>12.1f}{keyset_ms:>12.1f}')
+
+            transaction.set_rollback(True)
+
+    def page_number(self, queryset, page, page_size):
+        paginator = PageNumberPagination()
+        paginator.page_size = page_size
+        request = Request(RequestFactory().get('/api/listings/', {'page': page}))
+        return paginator.paginate_queryset(queryset, request)
+
+    def keyset_request(self, queryset, offset, page_size):
+        """Build the request a client following `next` links would send for this page."""
+        params = {'page_size': page_size}
+        if offset:
+            previous_row = queryset[offset - 1]
+            paginator = KeysetPagination()
+            paginator.request = Request(RequestFactory().get('/api/listings/', params))
+            paginator.ordering = paginator.get_ordering(queryset)
+            url = paginator.encode_cursor(paginator.get_position(previous_row), reverse=False)
+            params['cursor'] = parse_qs(urlsplit(url).query)['cursor'][0]
+        return Request(RequestFactory().get('/api/listings/', params))
+
+    def keyset(self, queryset, request):
+        return KeysetPagination().paginate_queryset(queryset, request)
+
+    def time(self, fetch, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fetch()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,77 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+
+from listings.management.commands._synthetic import generate_listings
+from listings.search import get_search_backend, reset_search_backend
+from listings.views import ListingViewSet
+
+DEFAULT_QUERIES = ['beach', 'cozy cabin', 'pool', 'miami', 'lux', 'historic loft garden']
+
+
+class LegacySearchView:
+    search_fields = ['title', 'description', 'location', 'amenities']
+
+
+class Command(BaseCommand):
+    help = 'Compare the listing search backend with DRF SearchFilter on synthetic listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000, help='Listings to generate (default: 100000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query (default: 5)')
+        parser.add_argument('--query', action='append', dest='queries', help='Search query (repeatable)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or DEFAULT_QUERIES
+        # Everything is generated inside a transaction that is rolled back
+        with transaction.atomic():
+            generate_listings(options['listings'], random.Random(options['seed']))
+
+            reset_search_backend()
+            backend = get_search_backend()
+            started = time.perf_counter()
+            if hasattr(backend, 'get_index'):
+                backend.get_index()
+            self.stdout.write(
+                f'{type(backend).__name__} ready in {time.perf_counter() - started:.2f}s '
+                f'for {options["listings"]} listings'
+            )
+
+            base = ListingViewSet.queryset
+            factory = RequestFactory()
+            self.stdout.write(f'{"query":<24}{"hits":>8}{"ranked":>8}{"SearchFilter ms":>18}{"backend ms":>14}{"speedup":>10}')
+            for query in queries:
+                request = Request(factory.get('/api/listings/', {'search': query}))
+                legacy_ms, hits = self.time_page(
+                    lambda: SearchFilter().filter_queryset(request, base, LegacySearchView()),
+                    options['repeat'],
+                )
+                indexed_ms, ranked = self.time_page(
+                    lambda: backend.search(base, [query]),
+                    options['repeat'],
+                )
+                self.stdout.write(
+                    f'{query:<24}{hits:>8}{ranked:>8}{legacy_ms:>18.1f}{indexed_ms:>14.1f}'
+                    f'{legacy_ms / max(indexed_ms, 0.001):>9.1f}x'
+                )
+
+            transaction.set_rollback(True)
+        reset_search_backend()
+
+    def time_page(self, search, repeat):
+        """Time what one paginated request costs: the search, COUNT and the first page."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            queryset = search()
+            hits = queryset.count()
+            list(queryset[:20])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), hits
@@ -0,0 +1,44 @@
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.export import EXPORTS, RENDERERS, ExportError, stream_export
+from listings.stats import day_bounds
+
+
+class Command(BaseCommand):
+    help = 'Stream bookings or payments as NDJSON or CSV for reconciliation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS), help='What to export')
+        parser.add_argument('--format', dest='file_format', choices=list(RENDERERS), default='ndjson',
+                            help='Output format (default: ndjson)')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--status', action='append', dest='statuses', help='Status to include (repeatable)')
+        parser.add_argument('--created-after', type=date.fromisoformat, help='Only rows created on or after this day')
+        parser.add_argument('--created-before', type=date.fromisoformat, help='Only rows created on or before this day')
+        parser.add_argument('--after', type=uuid.UUID, help='Resume after the row with this id')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows per query (default: 2000)')
+
+    def handle(self, *args, **options):
+        created_after, created_before = options['created_after'], options['created_before']
+        try:
+            chunks = stream_export(
+                options['kind'],
+                options['file_format'],
+                statuses=options['statuses'],
+                since=day_bounds(created_after, created_after)[0] if created_after else None,
+                until=day_bounds(created_before, created_before)[1] if created_before else None,
+                after=options['after'],
+                chunk_size=options['chunk_size'],
+            )
+        except ExportError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
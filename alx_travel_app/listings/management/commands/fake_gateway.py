@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.fake_gateway import FakeGateway
+
+
+class Command(BaseCommand):
+    help = 'Run the in-memory Chapa stand-in; point CHAPA_API_URL at it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+        parser.add_argument('--latency-ms', type=float, default=0, help='Delay added to every answer (default: 0)')
+        parser.add_argument('--secret-key', default='test-secret-key', help='Expected CHAPA_SECRET_KEY')
+        parser.add_argument('--webhook-secret', default='test-webhook-secret', help='CHAPA_WEBHOOK_SECRET used to sign')
+
+    def handle(self, *args, **options):
+        gateway = FakeGateway(
+            secret_key=options['secret_key'], webhook_secret=options['webhook_secret'],
+            latency=options['latency_ms'] / 1000, port=options['port'],
+        )
+        with gateway:
+            self.stdout.write(f'Fake gateway listening on {gateway.url}; Ctrl-C to stop.')
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
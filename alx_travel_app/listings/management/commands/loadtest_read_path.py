@@ -0,0 +1,155 @@
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from listings.cache import reset_listing_cache
+from listings.management.commands._synthetic import generate_listings
+from listings.models import Listing
+from listings.stats import reconcile_stats
+
+MODES = ['wsgi', 'asgi-sync', 'asgi-async']
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the listing read endpoints in-process: the sync views under WSGI '
+        'and ASGI against the async views under ASGI'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode (default: 2000)')
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent clients (default: 64)')
+        parser.add_argument('--listings', type=int, default=0,
+                            help='Synthetic listings to create first and delete afterwards (default: use existing data)')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES, help='Mode to run (repeatable)')
+        parser.add_argument('--cache', action='store_true', help='Keep the listing response cache on')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+
+    def handle(self, *args, **options):
+        host = None
+        if options['listings']:
+            host = generate_listings(options['listings'], random.Random(options['seed']))
+        try:
+            with override_settings(**({} if options['cache'] else {'LISTING_CACHE_BACKEND': 'none'})):
+                reset_listing_cache()
+                self.run(options)
+        finally:
+            reset_listing_cache()
+            if host is not None:
+                host.delete()
+                reconcile_stats()
+
+    def run(self, options):
+        listing_ids = list(Listing.objects.order_by('?').values_list('pk', flat=True)[:100])
+        if not listing_ids:
+            self.stderr.write('No listings to read; pass --listings N to generate some.')
+            return
+        user, _ = User.objects.get_or_create(username='loadtest_user')
+        client = Client()
+        client.force_login(user)
+        cookie = f'sessionid={client.cookies["sessionid"].value}'
+
+        rng = random.Random(options['seed'])
+        paths = [self.pick_path(rng, listing_ids) for _ in range(options['requests'])]
+        self.stdout.write(
+            f'{options["requests"]} requests, concurrency {options["concurrency"]}, '
+            f'{len(listing_ids)} listings sampled'
+        )
+        self.stdout.write(f'{"mode":<12}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for mode in options['modes'] or MODES:
+            prefix = '/api/async' if mode == 'asgi-async' else '/api'
+            requests = [(prefix + path, query, cookie) for path, query in paths]
+            if mode == 'wsgi':
+                elapsed, latencies, errors = self.run_wsgi(requests, options['concurrency'])
+            else:
+                elapsed, latencies, errors = asyncio.run(self.run_asgi(requests, options['concurrency']))
+            latencies.sort()
+            self.stdout.write(
+                f'{mode:<12}{len(requests) / elapsed:>10.0f}{statistics.median(latencies):>10.1f}'
+                f'{latencies[int(len(latencies) * 0.99) - 1]:>10.1f}{errors:>8}'
+            )
+
+    def pick_path(self, rng, listing_ids):
+        """A read mix weighted towards listing pages and details."""
+        listing_id = rng.choice(listing_ids)
+        check_in = date.today() + timedelta(days=rng.randint(1, 300))
+        stay = f'check_in={check_in}&check_out={check_in + timedelta(days=rng.randint(1, 7))}'
+        return rng.choices([
+            ('/listings/', f'ordering=-price_per_night&page_size={rng.choice([10, 20, 50])}'),
+            ('/listings/', stay),
+            (f'/listings/{listing_id}/', ''),
+            (f'/listings/{listing_id}/availability/', stay),
+            ('/stats/', ''),
+        ], weights=[4, 2, 4, 3, 1])[0]
+
+    def run_wsgi(self, requests, concurrency):
+        handler = WSGIHandler()
+
+        def call(request):
+            path, query, cookie = request
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie, 'wsgi.url_scheme': 'http',
+                'wsgi.input': BytesIO(), 'wsgi.errors': BytesIO(),
+            }
+            status = []
+            started = time.perf_counter()
+            b''.join(handler(environ, lambda code, headers: status.append(code)))
+            return (time.perf_counter() - started) * 1000, not status[0].startswith('200')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(call, requests))
+        return time.perf_counter() - started, [ms for ms, _ in results], sum(error for _, error in results)
+
+    async def run_asgi(self, requests, concurrency):
+        handler = ASGIHandler()
+        queue = asyncio.Queue()
+        for request in requests:
+            queue.put_nowait(request)
+        latencies, errors = [], 0
+
+        async def call(path, query, cookie):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+                'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await asyncio.Event().wait()  # no disconnect until the response is sent
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            await handler(scope, receive, send)
+            return status[0] != 200
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                request = queue.get_nowait()
+                started = time.perf_counter()
+                errors += await call(*request)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return time.perf_counter() - started, latencies, errors
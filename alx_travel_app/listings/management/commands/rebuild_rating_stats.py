@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized review_count/rating_sum/average_rating columns on Listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of listings updated per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        listing_ids = Listing.objects.order_by('pk').values_list('pk', flat=True)
+
+        total = 0
+        chunk = []
+        for listing_id in listing_ids.iterator(chunk_size=chunk_size):
+            chunk.append(listing_id)
+            if len(chunk) >= chunk_size:
+                total += self.rebuild(chunk)
+                chunk = []
+        if chunk:
+            total += self.rebuild(chunk)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt rating stats for {total} listings.')
+        )
+
+    def rebuild(self, listing_ids):
+        with transaction.atomic():
+            Listing.objects.filter(pk__in=listing_ids).refresh_rating_stats()
+        return len(listing_ids)
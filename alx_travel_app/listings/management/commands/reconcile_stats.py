@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from listings.stats import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stats rollup behind /api/stats/ from the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Only rebuild daily breakdown rows for the last N days (default: all)',
+        )
+
+    def handle(self, *args, **options):
+        totals = reconcile_stats(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled stats: {totals["total_listings"]} listings, '
+            f'{totals["total_bookings"]} bookings, {totals["review_count"]} reviews.'
+        ))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings import outbox
+
+
+class Command(BaseCommand):
+    help = 'Publish pending outbox events to the Celery broker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Events published per transaction (default: LISTING_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep relaying instead of exiting once the outbox is empty')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep between passes with --loop (default: 1)')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                published = outbox.relay(batch_size=options['batch_size'])
+            except Exception as exc:
+                if not options['loop']:
+                    raise
+                # Keep going through broker outages; nothing is lost
+                self.stderr.write(f'Relay failed: {exc}')
+                published = 0
+            if published or not options['loop']:
+                self.stdout.write(f'Published {published} outbox events.')
+            if not options['loop']:
+                return
+            purged = outbox.purge()
+            if purged:
+                self.stdout.write(f'Purged {purged} published outbox events.')
+            time.sleep(options['interval'])
@@ -1,148 +1,99 @@
-from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from decimal import Decimal
-from datetime import date, timedelta
 import random
+import time
 
-from alx_travel_app.alx_travel_app import Listing, Booking, Review
-
-
-class Command(BaseCommand):
-    help = 'Seed the database with sample listing data'
-
-    def handle(self, *args, **options):
-        self.stdout.write('Starting database seeding...')
-
-        # Clear existing data to prevent duplicates on re-run
-        self.stdout.write('Clearing old data...')
-        Review.objects.all().delete()
-        Booking.objects.all().delete()
-        Listing.objects.all().delete()
-        User.objects.filter(is_superuser=False).delete()
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
 
-        # Create sample users
-        self.create_users()
+from listings.cache import reset_listing_cache
+from listings.management.commands._synthetic import generate_dataset
 
-        # Create sample listings
-        self.create_listings()
+PASSWORD = 'password123'
 
-        # Create sample bookings
-        self.create_bookings()
 
-        # Create sample reviews
-        self.create_reviews()
+class Command(BaseCommand):
+    help = (
+        'Replace the listings data and non-superusers with a generated dataset. '
+        'The same --seed always generates the same rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100, help='Listings to create (default: 100)')
+        parser.add_argument('--users', type=int, default=20,
+                            help='Users to create, the first tenth of them hosts (default: 20)')
+        parser.add_argument('--bookings', type=int, default=200,
+                            help='Bookings, spread evenly over the listings (default: 200)')
+        parser.add_argument('--reviews', type=int, default=100,
+                            help='Reviews, each by the guest of a completed booking, at most one per guest '
+                                 'and listing; fewer when too few bookings are completed (default: 100)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT (default: 5000)')
 
-        self.stdout.write(
-            self.style.SUCCESS('Successfully seeded the database!')
+    def handle(self, *args, **options):
+        if options['listings'] < 1 or options['users'] < 1:
+            raise CommandError('Seeding needs at least one listing and one user.')
+        if options['reviews'] > options['bookings']:
+            raise CommandError('Reviews come from completed bookings: there can be at most one per booking.')
+
+        started = time.perf_counter()
+        self.truncate()
+        self.stdout.write(f'Cleared the old data in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        counts = generate_dataset(
+            random.Random(options['seed']),
+            listings=options['listings'], users=options['users'],
+            bookings=options['bookings'], reviews=options['reviews'],
+            batch_size=options['batch_size'], progress=self.progress(options['listings']),
         )
-
-    def create_users(self):
-        users_data = [
-            {'username': 'john_host', 'email': 'john@example.com', 'first_name': 'John', 'last_name': 'Doe'},
-            {'username': 'jane_guest', 'email': 'jane@example.com', 'first_name': 'Jane', 'last_name': 'Smith'},
-            {'username': 'bob_traveler', 'email': 'bob@example.com', 'first_name': 'Bob', 'last_name': 'Johnson'},
-            {'username': 'alice_host', 'email': 'alice@example.com', 'first_name': 'Alice', 'last_name': 'Brown'},
-        ]
-
-        for user_data in users_data:
-            user, created = User.objects.get_or_create(
-                username=user_data['username'],
-                defaults=user_data
-            )
-            if created:
-                user.set_password('password123')
-                user.save()
-                self.stdout.write(f'Created user: {user.username}')
-
-    def create_listings(self):
-        hosts = User.objects.filter(username__in=['john_host', 'alice_host'])
-
-        listings_data = [
-            {
-                'title': 'Cozy Beach House',
-                'description': 'Beautiful beach house with ocean view',
-                'price_per_night': Decimal('150.00'),
-                'location': 'Miami, FL',
-                'amenities': 'WiFi, Pool, Beach Access, Parking'
-            },
-            {
-                'title': 'Mountain Cabin Retreat',
-                'description': 'Peaceful cabin in the mountains',
-                'price_per_night': Decimal('120.00'),
-                'location': 'Aspen, CO',
-                'amenities': 'WiFi, Fireplace, Hiking Trails, Parking'
-            },
-            {
-                'title': 'Downtown Apartment',
-                'description': 'Modern apartment in city center',
-                'price_per_night': Decimal('200.00'),
-                'location': 'New York, NY',
-                'amenities': 'WiFi, Gym, Concierge, Public Transport'
-            },
-            {
-                'title': 'Lakeside Villa',
-                'description': 'Luxurious villa by the lake',
-                'price_per_night': Decimal('300.00'),
-                'location': 'Lake Tahoe, CA',
-                'amenities': 'WiFi, Private Dock, Hot Tub, Parking'
-            }
+        elapsed = time.perf_counter() - started
+        reset_listing_cache()
+
+        self.stdout.write(f'{"table":<16}{"rows":>12}')
+        for table, rows in counts.items():
+            self.stdout.write(f'{table:<16}{rows:>12}')
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s). '
+            f'Users are synthetic_<n> with password {PASSWORD}.'
+        ))
+
+    def truncate(self):
+        """
+        Empty every listings table with TRUNCATE (DELETE on SQLite) rather
+        than a cascading delete() that loads each row first, then delete the
+        users that aren't superusers.
+        """
+        tables = [
+            model._meta.db_table
+            for model in apps.get_app_config('listings').get_models(include_auto_created=True)
         ]
-
-        for i, listing_data in enumerate(listings_data):
-            listing, created = Listing.objects.get_or_create(
-                title=listing_data['title'],
-                defaults={
-                    **listing_data,
-                    'host': hosts[i % len(hosts)]
-                }
-            )
-            if created:
-                self.stdout.write(f'Created listing: {listing.title}')
-
-    def create_bookings(self):
-        listings = Listing.objects.all()
-        guests = User.objects.filter(username__in=['jane_guest', 'bob_traveler'])
-
-        for listing in listings:
-            for guest in guests:
-                check_in = date.today() + timedelta(days=random.randint(1, 30))
-                check_out = check_in + timedelta(days=random.randint(2, 7))
-                nights = (check_out - check_in).days
-                total_price = listing.price_per_night * nights
-
-                booking, created = Booking.objects.get_or_create(
-                    listing=listing,
-                    guest=guest,
-                    check_in_date=check_in,
-                    defaults={
-                        'check_out_date': check_out,
-                        'total_price': total_price,
-                        'status': random.choice(['pending', 'confirmed', 'completed'])
-                    }
-                )
-                if created:
-                    self.stdout.write(f'Created booking for {listing.title}')
-
-    def create_reviews(self):
-        # Create reviews for completed bookings
-        completed_bookings = Booking.objects.filter(status='completed')
-
-        review_comments = [
-            "Great place to stay! Highly recommended.",
-            "Beautiful location and excellent amenities.",
-            "Host was very responsive and helpful.",
-            "Clean and comfortable accommodation.",
-            "Amazing views and peaceful environment."
-        ]
-
-        for booking in completed_bookings:
-            review, created = Review.objects.get_or_create(
-                listing=booking.listing,
-                reviewer=booking.guest,
-                defaults={
-                    'rating': random.randint(3, 5),
-                    'comment': random.choice(review_comments)
-                }
+        # TRUNCATE commits implicitly on MySQL, so it runs on its own
+        connection.ops.execute_sql_flush(
+            connection.ops.sql_flush(no_style(), tables, reset_sequences=True, allow_cascade=True)
+        )
+        with transaction.atomic():
+            users = User.objects.filter(is_superuser=False)
+            # The rows left pointing at those users, outside the listings app
+            for model, field in [
+                (User.groups.through, 'user'), (User.user_permissions.through, 'user'),
+                *((rel.related_model, rel.field.name) for rel in User._meta.related_objects
+                  if rel.related_model._meta.app_label != 'listings'),
+            ]:
+                model._base_manager.filter(**{f'{field}__in': users}).delete()
+            # Nothing references them any more: skip delete()'s collector,
+            # which would load every user to look for cascades
+            users._raw_delete(users.db)
+
+    def progress(self, listings):
+        started = time.perf_counter()
+
+        def report(counts):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{counts["listings"]}/{listings} listings, {sum(counts.values())} rows, '
+                f'{sum(counts.values()) / elapsed:.0f} rows/s'
             )
-            if created:
-                self.stdout.write(f'Created review for {booking.listing.title}')
+        return report
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:07
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Listing = apps.get_model('listings', 'Listing')
+    Review = apps.get_model('listings', 'Review')
+    reviews = Review.objects.using(db).filter(listing=OuterRef('pk')).order_by().values('listing')
+    Listing.objects.using(db).update(
+        review_count=Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+    )
+    Listing.objects.using(db).update(
+        average_rating=Case(
+            When(review_count=0, then=Value(0.0)),
+            default=Cast('rating_sum', FloatField()) / F('review_count'),
+            output_field=FloatField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_review_rating_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='average_rating',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
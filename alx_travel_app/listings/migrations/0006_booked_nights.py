@@ -0,0 +1,92 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:08
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef
+
+ACTIVE_STATUSES = ['pending', 'confirmed']
+
+
+def backfill_booked_nights(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Booking = apps.get_model('listings', 'Booking')
+    BookedNight = apps.get_model('listings', 'BookedNight')
+    active = Booking.objects.using(db).filter(
+        status__in=ACTIVE_STATUSES, check_out_date__gt=F('check_in_date'),
+    )
+
+    # A night can only be held once. Existing double bookings can't be
+    # resolved here without losing one of them, so they stop the migration
+    overlapping = active.filter(Exists(active.filter(
+        listing=OuterRef('listing'),
+        check_in_date__lt=OuterRef('check_out_date'),
+        check_out_date__gt=OuterRef('check_in_date'),
+    ).exclude(pk=OuterRef('pk'))))
+    clashes = list(overlapping.order_by('listing_id', 'check_in_date').values_list(
+        'listing_id', 'booking_id', 'check_in_date', 'check_out_date',
+    )[:20])
+    if clashes:
+        raise RuntimeError(
+            'Active bookings overlap on the same listing; cancel all but one of each '
+            'and run the migration again (at most 20 shown):\n' + '\n'.join(
+                f'  listing {listing_id}: booking {booking_id} {check_in} to {check_out}'
+                for listing_id, booking_id, check_in, check_out in clashes
+            )
+        )
+
+    nights = []
+    for booking in active.order_by('created_at').iterator(chunk_size=1000):
+        for offset in range((booking.check_out_date - booking.check_in_date).days):
+            nights.append(BookedNight(
+                listing_id=booking.listing_id,
+                booking_id=booking.booking_id,
+                night=booking.check_in_date + timedelta(days=offset),
+            ))
+        if len(nights) >= 1000:
+            BookedNight.objects.using(db).bulk_create(nights)
+            nights = []
+    BookedNight.objects.using(db).bulk_create(nights)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_listing_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookedNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+            ],
+            options={
+                'ordering': ['listing', 'night'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['listing', 'status', 'check_in_date', 'check_out_date'], name='booking_listing_avail_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookednight',
+            name='booking',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='listings.booking'),
+        ),
+        migrations.AddField(
+            model_name='bookednight',
+            name='listing',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='listings.listing'),
+        ),
+        migrations.AddIndex(
+            model_name='bookednight',
+            index=models.Index(fields=['night', 'listing'], name='bookednight_night_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookednight',
+            constraint=models.UniqueConstraint(fields=('listing', 'night'), name='unique_listing_night'),
+        ),
+        migrations.RunPython(backfill_booked_nights, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+MYSQL_CREATE = (
+    'CREATE FULLTEXT INDEX listing_fulltext_idx '
+    'ON listings_listing (title, description, location, amenities)'
+)
+MYSQL_DROP = 'DROP INDEX listing_fulltext_idx ON listings_listing'
+
+# Must match PostgresFullTextBackend.vector_sql for the planner to use it
+POSTGRES_CREATE = (
+    "CREATE INDEX listing_search_idx ON listings_listing USING GIN ("
+    "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, '') "
+    "|| ' ' || coalesce(location, '') || ' ' || coalesce(amenities, '')))"
+)
+POSTGRES_DROP = 'DROP INDEX IF EXISTS listing_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(MYSQL_CREATE)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(MYSQL_DROP)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_DROP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_booked_nights'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
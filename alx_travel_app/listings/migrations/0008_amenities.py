@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def split_amenities(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Listing = apps.get_model('listings', 'Listing')
+    Amenity = apps.get_model('listings', 'Amenity')
+    ListingAmenity = apps.get_model('listings', 'ListingAmenity')
+
+    amenity_ids = {}
+    links = []
+    for listing_id, text in Listing.objects.using(db).values_list('pk', 'amenities').iterator(chunk_size=1000):
+        slugs = set()
+        for name in (text or '').split(','):
+            slug = slugify(name)
+            if not slug or slug in slugs:
+                continue
+            slugs.add(slug)
+            if slug not in amenity_ids:
+                amenity_ids[slug] = Amenity.objects.using(db).create(slug=slug, name=name.strip()).pk
+            links.append(ListingAmenity(listing_id=listing_id, amenity_id=amenity_ids[slug]))
+        if len(links) >= 1000:
+            ListingAmenity.objects.using(db).bulk_create(links)
+            links = []
+    ListingAmenity.objects.using(db).bulk_create(links)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_listing_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Amenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'amenities',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ListingAmenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amenity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='listing_links', to='listings.amenity')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='amenity_links', to='listings.listing')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='amenity_items',
+            field=models.ManyToManyField(blank=True, related_name='listings', through='listings.ListingAmenity', to='listings.amenity'),
+        ),
+        migrations.AddIndex(
+            model_name='listingamenity',
+            index=models.Index(fields=['amenity', 'listing'], name='listingamenity_amenity_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='listingamenity',
+            constraint=models.UniqueConstraint(fields=('listing', 'amenity'), name='unique_listing_amenity'),
+        ),
+        migrations.RunPython(split_amenities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_stats(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Listing = apps.get_model('listings', 'Listing')
+    Booking = apps.get_model('listings', 'Booking')
+    Payment = apps.get_model('listings', 'Payment')
+    Review = apps.get_model('listings', 'Review')
+    StatsRollup = apps.get_model('listings', 'StatsRollup')
+    DailyListingStats = apps.get_model('listings', 'DailyListingStats')
+
+    completed = Payment.objects.using(db).filter(status='completed').order_by()
+    reviews = Review.objects.using(db).aggregate(count=Count('pk'), total=Sum('rating'))
+    StatsRollup.objects.using(db).create(
+        shard=0,
+        total_listings=Listing.objects.using(db).count(),
+        total_bookings=Booking.objects.using(db).count(),
+        total_revenue=completed.aggregate(total=Sum('amount'))['total'] or 0,
+        review_count=reviews['count'],
+        rating_sum=reviews['total'] or 0,
+    )
+
+    daily = {}
+    bookings = Booking.objects.using(db).order_by().values('listing_id', day=TruncDate('created_at'))
+    for row in bookings.annotate(total=Count('pk')):
+        daily[row['listing_id'], row['day']] = DailyListingStats(
+            listing_id=row['listing_id'], date=row['day'], bookings=row['total']
+        )
+    for row in completed.values('booking__listing_id', day=TruncDate('created_at')).annotate(total=Sum('amount')):
+        key = (row['booking__listing_id'], row['day'])
+        daily.setdefault(key, DailyListingStats(listing_id=key[0], date=key[1])).revenue = row['total']
+    DailyListingStats.objects.using(db).bulk_create(daily.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsRollup',
+            fields=[
+                ('shard', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('total_listings', models.BigIntegerField(default=0)),
+                ('total_bookings', models.BigIntegerField(default=0)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('review_count', models.BigIntegerField(default=0)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyListingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='listings.listing')),
+            ],
+            options={
+                'ordering': ['date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'listing'), name='unique_listing_day')],
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
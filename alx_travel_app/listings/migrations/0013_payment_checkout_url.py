@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='checkout_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.6 on 2026-10-18 07:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_listing_coordinates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['guest', 'created_at', 'booking_id'], name='booking_guest_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['guest', 'status', 'created_at', 'booking_id'], name='booking_guest_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['guest', 'check_in_date', 'booking_id'], name='booking_guest_check_in_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['check_in_date', 'booking_id'], name='booking_check_in_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['location', 'created_at', 'listing_id'], name='listing_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['price_per_night', 'created_at', 'listing_id'], name='listing_price_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['price_per_night', 'listing_id'], name='listing_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['average_rating', 'listing_id'], name='listing_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['review_count', 'listing_id'], name='listing_review_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['amount', 'payment_id'], name='payment_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['listing', 'created_at', 'review_id'], name='review_listing_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['rating', 'created_at', 'review_id'], name='review_rating_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['rating', 'review_id'], name='review_rating_idx'),
+        ),
+        # listing_rating_idx replaces the single-column index
+        migrations.AlterField(
+            model_name='listing',
+            name='average_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+    ]
@@ -1,8 +1,73 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Cast, Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from .geo import GeohashField
+
+
+def loaded(instance, relation, attname):
+    """
+    ``instance.<relation>.<attname>`` if the related object is already
+    loaded, else the foreign key: __str__ shouldn't run a query per row.
+    """
+    field = instance._meta.get_field(relation)
+    if field.is_cached(instance):
+        return getattr(getattr(instance, relation), attname)
+    return getattr(instance, field.attname)
+
+
+class ListingQuerySet(models.QuerySet):
+    def apply_review_delta(self, count_delta, rating_delta):
+        """
+        Shift the denormalized review aggregates by the given amounts and
+        recompute the average, without reading the rows into Python.
+        """
+        self.update(
+            review_count=models.F('review_count') + count_delta,
+            rating_sum=models.F('rating_sum') + rating_delta,
+        )
+        self._update_average_rating()
+
+    def refresh_rating_stats(self):
+        """
+        Recompute the review aggregates of every listing in the queryset from
+        the Review table in a single UPDATE.
+        """
+        reviews = Review.objects.filter(listing=models.OuterRef('pk')).order_by().values('listing')
+        self.update(
+            review_count=Coalesce(
+                models.Subquery(reviews.annotate(total=models.Count('pk')).values('total')), 0
+            ),
+            rating_sum=Coalesce(
+                models.Subquery(reviews.annotate(total=models.Sum('rating')).values('total')), 0
+            ),
+        )
+        self._update_average_rating()
+
+    def _update_average_rating(self):
+        self.update(
+            average_rating=models.Case(
+                models.When(review_count=0, then=models.Value(0.0)),
+                default=Cast('rating_sum', models.FloatField()) / models.F('review_count'),
+                output_field=models.FloatField(),
+            )
+        )
+
+
+class Amenity(models.Model):
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'amenities'
+
 
 class Listing(models.Model):
     listing_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -10,27 +75,125 @@ class Listing(models.Model):
     description = models.TextField()
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     location = models.CharField(max_length=100)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Kept in sync with latitude/longitude for ?near= and ?bbox=; see geo.py
+    geohash = GeohashField()
     amenities = models.TextField(help_text="Comma-separated list of amenities")
+    amenity_items = models.ManyToManyField(Amenity, through='ListingAmenity', related_name='listings', blank=True)
     host = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_available = models.BooleanField(default=True)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(default=0, editable=False)
+
+    objects = ListingQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # The save signal in signals.py syncs amenity_items from the
+        # amenities text; run it in the same transaction as the listing row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def get_amenities_list(self):
+        return [amenity.strip() for amenity in self.amenities.split(',') if amenity.strip()]
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination walks (created_at, pk)
+            models.Index(fields=['created_at', 'listing_id'], name='listing_created_idx'),
+            # Location filters scan geohash prefix ranges
+            models.Index(fields=['geohash'], name='listing_geohash_idx'),
+            # ?location= and ?price_per_night= pages in the default order,
+            # and the other ordering_fields of ListingViewSet; see
+            # query_plans.py
+            models.Index(fields=['location', 'created_at', 'listing_id'], name='listing_location_idx'),
+            models.Index(fields=['price_per_night', 'created_at', 'listing_id'], name='listing_price_created_idx'),
+            models.Index(fields=['price_per_night', 'listing_id'], name='listing_price_idx'),
+            models.Index(fields=['average_rating', 'listing_id'], name='listing_rating_idx'),
+            models.Index(fields=['review_count', 'listing_id'], name='listing_review_count_idx'),
+        ]
+
+
+class ListingAmenity(models.Model):
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='amenity_links')
+    amenity = models.ForeignKey(Amenity, on_delete=models.CASCADE, related_name='listing_links')
+
+    def __str__(self):
+        return f"{self.listing_id} has {self.amenity_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'amenity'], name='unique_listing_amenity'),
+        ]
+        indexes = [
+            # Amenity filters look up listings by amenity
+            models.Index(fields=['amenity', 'listing'], name='listingamenity_amenity_idx'),
+        ]
+
+
+class DaysBetween(models.Func):
+    """Whole days from the ``start`` date column to the ``end`` one, as an integer, on each backend."""
+    output_field = models.IntegerField()
+    arity = 2
+
+    def __init__(self, start, end, **extra):
+        # Every backend's SQL below names the end first
+        super().__init__(end, start, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # PostgreSQL: date - date is already a number of days
+        return super().as_sql(compiler, connection, template='(%(expressions)s)', arg_joiner=' - ', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='DATEDIFF', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(', **extra_context,
+        )
+
+
+class BookingQuerySet(models.QuerySet):
+    def with_stay_fields(self, today=None):
+        """
+        Annotate ``duration`` (nights) and ``is_active`` (holds its nights
+        and hasn't ended by ``today``) in SQL, so both can be filtered and
+        ordered on.
+        """
+        today = today or timezone.localdate()
+        return self.annotate(
+            duration=DaysBetween('check_in_date', 'check_out_date'),
+            is_active=models.ExpressionWrapper(
+                models.Q(status__in=Booking.ACTIVE_STATUSES, check_out_date__gt=today),
+                output_field=models.BooleanField(),
+            ),
+        )
 
 
 class Booking(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_CONFIRMED = 'confirmed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_COMPLETED = 'completed'
+
     STATUS_CHOICES = [
-        ('pending', 'Pending'),
-        ('confirmed', 'Confirmed'),
-        ('cancelled', 'Cancelled'),
-        ('completed', 'Completed'),
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_CONFIRMED, 'Confirmed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+        (STATUS_COMPLETED, 'Completed'),
     ]
 
+    # Bookings in these states hold their nights on the listing
+    ACTIVE_STATUSES = [STATUS_PENDING, STATUS_CONFIRMED]
+
     booking_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='bookings')
     guest = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
@@ -41,28 +204,96 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BookingQuerySet.as_manager()
+
     def __str__(self):
-        return f"Booking for {self.listing.title} by {self.guest.username}"
+        return f"Booking for {loaded(self, 'listing', 'title')} by {loaded(self, 'guest', 'username')}"
+
+    def save(self, *args, **kwargs):
+        # The save signal in signals.py rewrites the booking's BookedNight
+        # rows; run it in the same transaction as the booking row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @property
+    def holds_nights(self):
+        return self.status in self.ACTIVE_STATUSES
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'booking_id'], name='booking_created_idx'),
+            models.Index(
+                fields=['listing', 'status', 'check_in_date', 'check_out_date'],
+                name='booking_listing_avail_idx',
+            ),
+            # Guests page through their own bookings, optionally by status
+            # or by check-in date; staff by check-in date across everyone's
+            models.Index(fields=['guest', 'created_at', 'booking_id'], name='booking_guest_created_idx'),
+            models.Index(fields=['guest', 'status', 'created_at', 'booking_id'], name='booking_guest_status_idx'),
+            models.Index(fields=['guest', 'check_in_date', 'booking_id'], name='booking_guest_check_in_idx'),
+            models.Index(fields=['check_in_date', 'booking_id'], name='booking_check_in_idx'),
+        ]
+
+
+class BookedNight(models.Model):
+    """
+    One row per night held by an active booking. The unique (listing, night)
+    key turns availability checks into index range scans.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='booked_nights')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='booked_nights')
+    night = models.DateField()
+
+    def __str__(self):
+        return f"{self.listing_id} booked on {self.night}"
+
+    class Meta:
+        ordering = ['listing', 'night']
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'night'], name='unique_listing_night'),
+        ]
+        indexes = [
+            models.Index(fields=['night', 'listing'], name='bookednight_night_idx'),
+        ]
 
 
 class Review(models.Model):
+    RATING_CHOICES = [
+        (1, '1 - Poor'),
+        (2, '2 - Fair'),
+        (3, '3 - Good'),
+        (4, '4 - Very Good'),
+        (5, '5 - Excellent'),
+    ]
+
     review_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='reviews')
     reviewer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
-    rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    rating = models.IntegerField(choices=RATING_CHOICES, validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Review for {self.listing.title} by {self.reviewer.username}"
+        return f"Review for {loaded(self, 'listing', 'title')} by {loaded(self, 'reviewer', 'username')}"
+
+    def save(self, *args, **kwargs):
+        # The save signals in signals.py update the listing's rating
+        # aggregates; run them in the same transaction as the review row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     class Meta:
         ordering = ['-created_at']
         unique_together = ['listing', 'reviewer']  # One review per user per listing
+        indexes = [
+            models.Index(fields=['created_at', 'review_id'], name='review_created_idx'),
+            # ?listing= and ?rating= newest first, and ?ordering=rating
+            models.Index(fields=['listing', 'created_at', 'review_id'], name='review_listing_created_idx'),
+            models.Index(fields=['rating', 'created_at', 'review_id'], name='review_rating_created_idx'),
+            models.Index(fields=['rating', 'review_id'], name='review_rating_idx'),
+        ]
 
 
 class Payment(models.Model):
@@ -79,11 +310,139 @@ class Payment(models.Model):
     reference = models.CharField(max_length=255, unique=True)
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
     payment_method = models.CharField(max_length=50, default='chapa')
+    checkout_url = models.URLField(max_length=500, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Payment {self.reference} - {self.status}"
 
+    def save(self, *args, **kwargs):
+        # Keep the revenue rollup written by the save signals in step
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def mark_as_completed(self, transaction_id=None):
+        """Complete the payment and confirm its pending booking."""
+        with transaction.atomic():
+            self.status = 'completed'
+            if transaction_id:
+                self.transaction_id = transaction_id
+            self.save(update_fields=['status', 'transaction_id', 'updated_at'])
+            if self.booking.status == Booking.STATUS_PENDING:
+                self.booking.status = Booking.STATUS_CONFIRMED
+                self.booking.save(update_fields=['status', 'updated_at'])
+
+    def mark_as_failed(self):
+        self.status = 'failed'
+        self.save(update_fields=['status', 'updated_at'])
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'payment_id'], name='payment_created_idx'),
+            models.Index(fields=['amount', 'payment_id'], name='payment_amount_idx'),
+        ]
+
+
+class StatsRollup(models.Model):
+    """
+    Site-wide totals behind StatsAPIView, spread over a few shard rows so
+    concurrent writers don't queue on a single hot row. The totals are the
+    sum over all shards; see stats.py.
+    """
+    shard = models.PositiveSmallIntegerField(primary_key=True)
+    total_listings = models.BigIntegerField(default=0)
+    total_bookings = models.BigIntegerField(default=0)
+    total_revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    review_count = models.BigIntegerField(default=0)
+    rating_sum = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Stats shard {self.shard}"
+
+
+class DailyListingStats(models.Model):
+    """
+    Bookings made and completed-payment revenue per listing per day, keyed
+    by the booking's and payment's creation date.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    bookings = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.listing_id} on {self.date}"
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'listing'], name='unique_listing_day'),
+        ]
+
+
+class EmailNotification(models.Model):
+    """
+    An outgoing email, queued until the dispatcher sends it. The idempotency
+    key makes queueing the same notification twice (a retried request or
+    task) a no-op; see notifications.py.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} to {self.to_email} ({self.status})"
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # The dispatcher claims the oldest pending rows
+            models.Index(fields=['status', 'created_at'], name='email_status_created_idx'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """
+    A Celery task call recorded in the same transaction as the change that
+    triggers it, and published to the broker later by outbox.relay().
+    """
+    event = models.CharField(max_length=100)
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.event} #{self.pk}"
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # The relay reads unpublished events in id order; the purge
+            # deletes by published_at
+            models.Index(fields=['published_at', 'id'], name='outbox_published_idx'),
+        ]
@@ -0,0 +1,202 @@
+"""
+Outgoing email, queued in EmailNotification rows and sent in batches.
+
+queue_email() stores a notification under an idempotency key. Queueing
+the same key again, from a retried request or task, leaves the existing
+row alone, so a notification is sent at most once however often it is
+queued.
+
+Sending is coalesced. The first notification queued schedules one
+listings.tasks.dispatch_emails run, settings.LISTING_EMAIL_DISPATCH_DELAY
+seconds later. Anything queued in the meantime joins that run. The run
+claims the pending rows in batches and sends them all over one SMTP
+connection. The "dispatch scheduled" flag is kept in the default cache,
+so point CACHES['default'] at a shared cache to coalesce across
+processes. A periodic sweep (CELERY_BEAT_SCHEDULE) picks up rows whose
+dispatch was lost.
+
+A row is marked sent as soon as the SMTP server accepts it. A failed
+dispatch is retried without resending the rows it already delivered.
+Only a worker dying between the SMTP reply and that UPDATE can send a
+message twice.
+"""
+import logging
+from datetime import timedelta
+from smtplib import SMTPException
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EmailNotification, Payment
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_SCHEDULED_KEY = 'listings:email-dispatch-scheduled'
+
+# Errors that leave the message unsent but are worth retrying later
+SEND_ERRORS = (SMTPException, OSError)
+
+
+def batch_size():
+    return getattr(settings, 'LISTING_EMAIL_BATCH_SIZE', 100)
+
+
+def queue_email(key, to_email, subject, body, dispatch=True):
+    """
+    Queue an email under the idempotency ``key``. Returns (notification,
+    created); nothing is queued when ``key`` was seen before. With
+    ``dispatch``, a send is scheduled once the transaction commits.
+    """
+    notification, created = EmailNotification.objects.get_or_create(
+        idempotency_key=key,
+        defaults={'to_email': to_email, 'subject': subject, 'body': body},
+    )
+    if created and dispatch:
+        transaction.on_commit(schedule_dispatch)
+    return notification, created
+
+
+def queue_booking_confirmation(booking_id, to_email, dispatch=True):
+    return queue_email(
+        f'booking-confirmation:{booking_id}',
+        to_email,
+        'Booking Confirmation - ALX Travel App',
+        f'Your booking #{booking_id} has been confirmed. Thank you!',
+        dispatch=dispatch,
+    )
+
+
+def queue_payment_receipt(payment_id, dispatch=True):
+    """Queue the receipt for a payment; None if it is gone or the guest has no email."""
+    payment = Payment.objects.select_related('booking__guest').filter(pk=payment_id).first()
+    if payment is None or not payment.booking.guest.email:
+        return None
+    return queue_email(
+        f'payment-receipt:{payment_id}',
+        payment.booking.guest.email,
+        'Payment Received - ALX Travel App',
+        f'We received your payment of {payment.amount} for booking #{payment.booking_id} '
+        f'(reference {payment.reference}). Thank you!',
+        dispatch=dispatch,
+    )
+
+
+def schedule_dispatch():
+    """Schedule a dispatch_emails run unless one is already scheduled."""
+    from .tasks import dispatch_emails
+
+    delay = getattr(settings, 'LISTING_EMAIL_DISPATCH_DELAY', 5)
+    # The flag outlives the countdown by a margin so a lost task only
+    # delays delivery until the flag expires or the sweep runs
+    if not cache.add(DISPATCH_SCHEDULED_KEY, True, timeout=delay + 60):
+        return
+    try:
+        dispatch_emails.apply_async(countdown=delay)
+    except Exception:
+        # Called after commit: the rows are safe, the sweep will send them
+        cache.delete(DISPATCH_SCHEDULED_KEY)
+        logger.exception('Could not schedule an email dispatch')
+
+
+def dispatch_started():
+    """Clear the flag, so mail queued from now on schedules a new run."""
+    cache.delete(DISPATCH_SCHEDULED_KEY)
+
+
+def claim_batch(size):
+    """
+    Mark up to ``size`` of the oldest pending notifications as sending and
+    return them. Rows claimed by a worker that died more than
+    settings.LISTING_EMAIL_CLAIM_TIMEOUT seconds ago are claimed again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'LISTING_EMAIL_CLAIM_TIMEOUT', 600))
+    with transaction.atomic():
+        rows = EmailNotification.objects.filter(
+            Q(status=EmailNotification.STATUS_PENDING)
+            | Q(status=EmailNotification.STATUS_SENDING, claimed_at__lt=stale)
+        ).order_by('created_at', 'pk')
+        # Concurrent dispatchers take different rows instead of waiting
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        claimed = list(rows.select_for_update(skip_locked=skip_locked)[:size])
+        EmailNotification.objects.filter(pk__in=[row.pk for row in claimed]).update(
+            status=EmailNotification.STATUS_SENDING, claimed_at=now,
+        )
+    return claimed
+
+
+def release(notifications, failed=None, error=None):
+    """
+    Return unsent claimed rows to pending. ``failed``, the row whose send
+    raised ``error``, is charged an attempt and given up on after
+    settings.LISTING_EMAIL_MAX_ATTEMPTS.
+    """
+    EmailNotification.objects.filter(pk__in=[row.pk for row in notifications]).update(
+        status=EmailNotification.STATUS_PENDING, claimed_at=None,
+    )
+    if failed is not None:
+        failed.attempts += 1
+        give_up = failed.attempts >= getattr(settings, 'LISTING_EMAIL_MAX_ATTEMPTS', 5)
+        EmailNotification.objects.filter(pk=failed.pk).update(
+            status=EmailNotification.STATUS_FAILED if give_up else EmailNotification.STATUS_PENDING,
+            attempts=failed.attempts,
+            claimed_at=None,
+            last_error=str(error)[:1000],
+        )
+
+
+def send_batch(notifications, smtp):
+    """Send claimed ``notifications`` over the open ``smtp`` connection."""
+    remaining = list(notifications)
+    while remaining:
+        notification = remaining[0]
+        message = EmailMessage(
+            notification.subject, notification.body, settings.DEFAULT_FROM_EMAIL,
+            [notification.to_email], connection=smtp,
+        )
+        try:
+            smtp.send_messages([message])
+        except SEND_ERRORS as exc:
+            release(remaining[1:], failed=notification, error=exc)
+            raise
+        except BaseException:
+            release(remaining)
+            raise
+        EmailNotification.objects.filter(pk=notification.pk).update(
+            status=EmailNotification.STATUS_SENT, sent_at=timezone.now(),
+            attempts=notification.attempts + 1, claimed_at=None, last_error='',
+        )
+        remaining.pop(0)
+
+
+def dispatch_pending(size=None):
+    """
+    Send every pending notification, ``size`` at a time, over a single
+    SMTP connection that is opened only if there is something to send.
+    Returns the number sent; send errors propagate after the unsent rows
+    are released.
+    """
+    size = size or batch_size()
+    sent = 0
+    smtp = None
+    try:
+        while True:
+            claimed = claim_batch(size)
+            if claimed and smtp is None:
+                try:
+                    smtp = get_connection()
+                    smtp.open()
+                except BaseException:
+                    release(claimed)
+                    raise
+            send_batch(claimed, smtp)
+            sent += len(claimed)
+            if len(claimed) < size:
+                return sent
+    finally:
+        if smtp is not None:
+            smtp.close()
@@ -0,0 +1,112 @@
+"""
+Transactional outbox for the Celery tasks triggered by booking and payment
+changes.
+
+Calling delay() from a request publishes before the transaction commits,
+so a rolled-back change can still trigger its task. A broker outage also
+either fails the request or loses the task. Instead, record() writes an
+OutboxEvent row in the transaction of the change itself, and relay() later
+publishes the unpublished rows in id order. It publishes a batch at a time
+over one broker connection. The listings.tasks.relay_outbox beat task and
+the relay_outbox management command both run it.
+
+Delivery is at-least-once. A relay that dies after publishing but before
+marking the batch publishes those events again, so every task the outbox
+feeds must be idempotent. The email tasks are, because notifications are
+keyed by booking/payment. So are the payment tasks, which skip payments
+that are already initiated or settled.
+"""
+from datetime import timedelta
+
+from celery import current_app
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+BOOKING_CREATED = 'booking.created'
+PAYMENT_COMPLETED = 'payment.completed'
+PAYMENT_INITIATED = 'payment.initiated'
+PAYMENT_VERIFY_REQUESTED = 'payment.verify_requested'
+
+EVENT_TASKS = {
+    BOOKING_CREATED: 'listings.tasks.send_booking_confirmation_email',
+    PAYMENT_COMPLETED: 'listings.tasks.send_payment_receipt_email',
+    PAYMENT_INITIATED: 'listings.tasks.initiate_payment',
+    PAYMENT_VERIFY_REQUESTED: 'listings.tasks.verify_payment',
+}
+
+
+def build(event, *args, **kwargs):
+    """An unsaved OutboxEvent running the task of ``event`` with JSON arguments."""
+    return OutboxEvent(event=event, task=EVENT_TASKS[event], args=list(args), kwargs=kwargs)
+
+
+def record(event, *args, **kwargs):
+    outbox_event = build(event, *args, **kwargs)
+    outbox_event.save()
+    return outbox_event
+
+
+def booking_created(booking):
+    """The confirmation event for ``booking``, or None if the guest has no email."""
+    email = booking.guest.email
+    return build(BOOKING_CREATED, str(booking.pk), email) if email else None
+
+
+def relay_batch(size, app=None):
+    """
+    Publish up to ``size`` unpublished events and mark them published.
+    Returns (published, error): on a broker error the events published so
+    far are still marked and the error is returned for the caller to raise.
+    """
+    app = app or current_app
+    with transaction.atomic():
+        rows = OutboxEvent.objects.filter(published_at__isnull=True).order_by('pk')
+        # Concurrent relays take different rows instead of waiting
+        skip_locked = connection.features.has_select_for_update_skip_locked
+        events = list(rows.select_for_update(skip_locked=skip_locked)[:size])
+        published, error = [], None
+        if events:
+            with app.producer_or_acquire() as producer:
+                for event in events:
+                    try:
+                        app.send_task(
+                            event.task, args=event.args, kwargs=event.kwargs,
+                            task_id=f'outbox-{event.pk}', producer=producer,
+                        )
+                    except Exception as exc:
+                        error = exc
+                        OutboxEvent.objects.filter(pk=event.pk).update(
+                            attempts=event.attempts + 1, last_error=str(exc)[:1000],
+                        )
+                        break
+                    published.append(event.pk)
+            OutboxEvent.objects.filter(pk__in=published).update(published_at=timezone.now())
+    return len(published), error
+
+
+def relay(batch_size=None, app=None):
+    """
+    Publish every unpublished event, ``batch_size`` per transaction.
+    Returns the number published; broker errors propagate once the events
+    already published are marked.
+    """
+    size = batch_size or getattr(settings, 'LISTING_OUTBOX_BATCH_SIZE', 500)
+    total = 0
+    while True:
+        published, error = relay_batch(size, app)
+        total += published
+        if error is not None:
+            raise error
+        if published < size:
+            return total
+
+
+def purge(days=None):
+    """Delete events published more than ``days`` ago; returns the count."""
+    days = getattr(settings, 'LISTING_OUTBOX_RETENTION_DAYS', 7) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = OutboxEvent.objects.filter(published_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,192 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the queryset's ordering plus the primary key
+    as a tiebreaker, e.g. (-created_at, -listing_id). Each page is a single
+    indexed range query, so page 10,000 costs the same as page 1.
+
+    No COUNT(*) is run unless the client asks for it with ?count=true.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.get_page_queryset(queryset, request)
+        self.count = queryset.count() if self.count_requested(request) else None
+        return self.set_page(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views, using the async ORM."""
+        page = self.get_page_queryset(queryset, request)
+        self.count = await queryset.acount() if self.count_requested(request) else None
+        return self.set_page([instance async for instance in page])
+
+    def get_page_queryset(self, queryset, request):
+        """Return the (unevaluated) queryset of this page plus one lookahead row."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.fields = [self.get_field(queryset, name) for name, _ in self.ordering]
+        self.cursor = self.decode_cursor(request)
+
+        self.reverse = self.cursor is not None and self.cursor['reverse']
+        if self.cursor is not None:
+            queryset = queryset.filter(self.position_filter(self.cursor['position'], self.reverse))
+        queryset = queryset.order_by(*[
+            ('-' if descending != self.reverse else '') + name for name, descending in self.ordering
+        ])
+        return queryset[:self.page_size + 1]
+
+    def count_requested(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return payload
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123, 'description': 'Only present with ?count=true'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """
+        Return [(field name, descending)] for the queryset's ordering with the
+        primary key appended as a tiebreaker.
+        """
+        opts = queryset.model._meta
+        ordering = []
+        for entry in queryset.query.order_by or opts.ordering:
+            if not isinstance(entry, str):
+                continue
+            name = entry.lstrip('-')
+            ordering.append(('pk' if name == opts.pk.name else name, entry.startswith('-')))
+        if 'pk' not in [name for name, _ in ordering]:
+            ordering.append(('pk', ordering[-1][1] if ordering else True))
+        return ordering
+
+    def get_field(self, queryset, name):
+        if name == 'pk':
+            return queryset.model._meta.pk
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise NotFound(self.invalid_cursor_message)
+
+    def position_filter(self, position, reverse):
+        """
+        Rows strictly after the position in (possibly reversed) ordering:
+        a <= x AND ((a < x) OR (a = x AND b < y) OR ...) for a descending
+        ordering. The redundant leading bound lets the database turn the
+        OR into an index range scan instead of filtering every row.
+        """
+        condition = Q()
+        for index, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, (previous_name, _) in enumerate(self.ordering[:index]):
+                step &= Q(**{previous_name: position[previous]})
+            condition |= step
+        name, descending = self.ordering[0]
+        leading = Q(**{f'{name}__{"lte" if descending != reverse else "gte"}': position[0]})
+        return leading & condition
+
+    def get_position(self, instance):
+        return [getattr(instance, name) for name, _ in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': [encode_value(value) for value in position], 'r': reverse})
+        cursor = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(self.fields, values)]
+            return {'position': position, 'reverse': bool(payload.get('r'))}
+        except (TypeError, ValueError, KeyError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+def encode_value(value):
+    # Full precision: DjangoJSONEncoder truncates datetimes to milliseconds,
+    # which would skip or repeat rows created within the same millisecond.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
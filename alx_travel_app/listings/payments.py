@@ -0,0 +1,178 @@
+"""
+Payments through the Chapa gateway.
+
+Nothing here is called from the request path. Initiating a payment writes
+an outbox event (outbox.py), and the initiate_payment task asks the
+gateway for a checkout URL. The gateway reports the outcome through the
+webhook, and the verify_payment task polls for payments whose webhook
+never arrived. Both end in apply_gateway_status(), which is idempotent
+per payment reference. A replayed webhook or a verify racing the webhook
+changes nothing the second time.
+
+Each process keeps one GatewayClient (get_gateway()). Its requests.Session
+holds a pool of keep-alive connections, so a worker pays the TCP and TLS
+handshake once rather than once per call. Every call has connect and
+read timeouts.
+"""
+import hashlib
+import hmac
+import uuid
+from decimal import Decimal, InvalidOperation
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from requests.adapters import HTTPAdapter
+
+from .models import Payment
+
+GATEWAY_SUCCESS = 'success'
+GATEWAY_FAILED = 'failed'
+GATEWAY_PENDING = 'pending'
+
+SIGNATURE_HEADER = 'HTTP_X_CHAPA_SIGNATURE'
+
+
+class GatewayError(Exception):
+    """The gateway rejected the call."""
+
+
+class GatewayUnavailable(GatewayError):
+    """Timeouts, connection errors and 5xx/429 answers; worth retrying."""
+
+
+class GatewayClient:
+    def __init__(self, base_url, secret_key, timeout=(3.05, 10), pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Authorization'] = f'Bearer {secret_key}'
+
+    def request(self, method, path, **kwargs):
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            raise GatewayUnavailable(str(exc)) from exc
+        if response.status_code >= 500 or response.status_code == 429:
+            raise GatewayUnavailable(f'Gateway answered {response.status_code}')
+        try:
+            payload = response.json()
+        except ValueError:
+            raise GatewayError(f'Gateway answered {response.status_code} without JSON')
+        if response.status_code >= 400:
+            raise GatewayError(payload.get('message') or f'Gateway answered {response.status_code}')
+        return payload
+
+    def initialize(self, payment, email, first_name='', last_name=''):
+        """Register ``payment`` with the gateway and return its checkout URL."""
+        payload = self.request('POST', '/v1/transaction/initialize', json={
+            'amount': str(payment.amount),
+            'currency': getattr(settings, 'CHAPA_CURRENCY', 'ETB'),
+            'email': email,
+            'first_name': first_name,
+            'last_name': last_name,
+            'tx_ref': payment.reference,
+            'callback_url': getattr(settings, 'CHAPA_CALLBACK_URL', ''),
+            'return_url': getattr(settings, 'CHAPA_RETURN_URL', ''),
+        })
+        return payload['data']['checkout_url']
+
+    def verify(self, reference):
+        """The gateway's view of a transaction: a dict with at least 'status'."""
+        return self.request('GET', f'/v1/transaction/verify/{reference}').get('data') or {}
+
+    def close(self):
+        self.session.close()
+
+
+_gateway = None
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        _gateway = GatewayClient(
+            getattr(settings, 'CHAPA_API_URL', 'https://api.chapa.co'),
+            getattr(settings, 'CHAPA_SECRET_KEY', ''),
+            timeout=(
+                getattr(settings, 'CHAPA_CONNECT_TIMEOUT', 3.05),
+                getattr(settings, 'CHAPA_READ_TIMEOUT', 10),
+            ),
+            pool_size=getattr(settings, 'CHAPA_POOL_SIZE', 10),
+        )
+    return _gateway
+
+
+def reset_gateway():
+    global _gateway
+    if _gateway is not None:
+        _gateway.close()
+    _gateway = None
+
+
+def new_reference():
+    return f'tx-{uuid.uuid4().hex}'
+
+
+def sign(body, secret=None):
+    """Hex HMAC-SHA256 of the raw webhook ``body``."""
+    secret = getattr(settings, 'CHAPA_WEBHOOK_SECRET', '') if secret is None else secret
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def valid_signature(body, signature):
+    secret = getattr(settings, 'CHAPA_WEBHOOK_SECRET', '')
+    return bool(secret and signature) and hmac.compare_digest(sign(body, secret), signature)
+
+
+def apply_gateway_status(reference, status, transaction_id=None, amount=None):
+    """
+    Move the payment with ``reference`` to the outcome the gateway
+    reported, confirming its booking on success. Completed payments are
+    final, so replays and late duplicates are no-ops. A success for a
+    different amount than the one charged counts as a failure. Returns the
+    payment, or None for an unknown reference.
+    """
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().filter(reference=reference).first()
+        if payment is None or payment.status == 'completed':
+            return payment
+        if status == GATEWAY_SUCCESS and amount is not None and not amount_matches(payment, amount):
+            status = GATEWAY_FAILED
+        if status == GATEWAY_SUCCESS:
+            payment.mark_as_completed(transaction_id=transaction_id)
+        elif status == GATEWAY_FAILED and payment.status != 'failed':
+            payment.mark_as_failed()
+    return payment
+
+
+def amount_matches(payment, amount):
+    try:
+        return Decimal(str(amount)) == payment.amount
+    except InvalidOperation:
+        return False
+
+
+def initiate(payment):
+    """
+    Ask the gateway for the checkout URL of a pending payment and store it.
+    Does nothing for payments that already have one or are settled.
+    """
+    if payment.status != 'pending' or payment.checkout_url:
+        return payment
+    guest = payment.booking.guest
+    payment.checkout_url = get_gateway().initialize(
+        payment, guest.email, first_name=guest.first_name, last_name=guest.last_name,
+    )
+    payment.save(update_fields=['checkout_url', 'updated_at'])
+    return payment
+
+
+def verify(reference):
+    data = get_gateway().verify(reference)
+    return apply_gateway_status(
+        reference, data.get('status'), transaction_id=data.get('reference'), amount=data.get('amount'),
+    )
@@ -0,0 +1,88 @@
+"""
+EXPLAIN checks for the queries behind the list endpoints.
+
+list_query_shapes() derives the query-string combinations a viewset's list
+endpoint serves from its filterset and ordering fields: no parameters,
+each filter alone, and each ordering in both directions. Every one of
+them should be answered by an index that also yields the order, which is
+what the composite indexes in models.py are laid out for:
+(filter column, ordering column, pk) for the filters and
+(ordering column, pk) for the orderings, behind the scoping column
+(guest) where the viewset narrows rows to the user's.
+
+plan_problems() EXPLAINs a query and reports the plan steps that read a
+whole table or sort rows outside an index. Walking an index end to end is
+not reported: it is how an ordered page with a LIMIT is read.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.settings import api_settings
+
+# Plan steps on tables this small are fine whatever they are
+SMALL_TABLES = {'listings_amenity', 'listings_statsrollup'}
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST TERM OF )?ORDER BY')
+
+
+def list_query_shapes(view_class, samples, computed=()):
+    """
+    [(label, query params)] for the list endpoint of ``view_class``.
+    ``samples`` maps each filter name to a value to filter on; a filter
+    without one raises KeyError, so new filters can't go unchecked.
+    Filters that don't take part in index selection (amenity subqueries,
+    availability) can be left out by mapping them to None, and filters
+    and ordering fields on values computed per row by naming them in
+    ``computed``.
+    """
+    if getattr(view_class, 'filterset_class', None) is not None:
+        filters = list(view_class.filterset_class.base_filters)
+    else:
+        filters = list(getattr(view_class, 'filterset_fields', None) or [])
+    shapes = [('default', {})]
+    for name in filters:
+        if name not in computed and samples[name] is not None:
+            shapes.append((name, {name: samples[name]}))
+    for field in getattr(view_class, 'ordering_fields', None) or []:
+        if field in computed:
+            continue
+        for ordering in (field, f'-{field}'):
+            shapes.append((f'ordering={ordering}', {api_settings.ORDERING_PARAM: ordering}))
+    return shapes
+
+
+def explain(sql, params, using=DEFAULT_DB_ALIAS):
+    """The plan of a query as rows: strings on SQLite, dicts on MySQL."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            columns = [column[0].lower() for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    raise NotImplementedError(f'No EXPLAIN checks for {connection.vendor}')
+
+
+def plan_problems(sql, params, using=DEFAULT_DB_ALIAS):
+    """Full table scans and sorts in the query's plan, as readable strings."""
+    problems = []
+    if connections[using].vendor == 'sqlite':
+        for step in explain(sql, params, using):
+            scan = SQLITE_FULL_SCAN.match(step)
+            if scan and scan.group(1) not in SMALL_TABLES:
+                problems.append(f'full scan of {scan.group(1)}')
+            elif SQLITE_SORT.search(step):
+                problems.append(f'sort: {step}')
+        return problems
+    for step in explain(sql, params, using):
+        table, extra = step.get('table'), step.get('extra') or ''
+        if table in SMALL_TABLES:
+            continue
+        if step.get('type') == 'ALL':
+            problems.append(f'full scan of {table}')
+        if 'Using filesort' in extra:
+            problems.append(f'filesort on {table}: {extra}')
+    return problems
@@ -0,0 +1,160 @@
+"""
+Read replica routing.
+
+settings.LISTING_DB_REPLICAS names database aliases holding read-only
+copies of ``default``. ReplicaRouter sends a read to one of them only
+inside replica_reads(). The listing, review and stats read views enter it
+through ReplicaReadMixin. Everything else reads from the primary: other
+views, Celery tasks, management commands, and anything inside a
+transaction.
+
+Read-your-writes:
+- The first write of a request pins the rest of that request to the
+  primary.
+- PrimaryPinMiddleware then sets a short-lived cookie. Later requests
+  carrying it stay on the primary for LISTING_DB_PIN_SECONDS, long enough
+  for the replicas to catch up.
+- Unsafe methods never read from a replica.
+
+Checks that guard writes, such as the booking overlap check, run inside
+read_from_primary().
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_COOKIE = 'db_primary_pin'
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.replica = None
+        self.pinned = pinned
+        self.wrote = False
+        self.primary_depth = 0
+
+
+_state = ContextVar('listings_db_routing', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'LISTING_DB_REPLICAS', [])
+
+
+@contextmanager
+def routing_state(pinned=False):
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    """Let reads in this block go to a replica, the same one throughout."""
+    state = _state.get()
+    if state is None:
+        with routing_state(), replica_reads():
+            yield
+        return
+    previous = state.replica
+    if previous is None and replica_aliases():
+        state.replica = random.choice(replica_aliases())
+    try:
+        yield
+    finally:
+        state.replica = previous
+
+
+@contextmanager
+def read_from_primary():
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    state.primary_depth += 1
+    try:
+        yield
+    finally:
+        state.primary_depth -= 1
+
+
+def in_transaction():
+    # TestCase wraps each test in atomic blocks of its own; those don't count
+    return any(not getattr(block, '_from_testcase', False) for block in connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.pinned or state.primary_depth or in_transaction():
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations on the database the instance came from
+            return instance._state.db
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    """Serve safe-method requests of a DRF view from a replica."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PrimaryPinMiddleware:
+    """
+    Give every request its routing state, pinned to the primary for unsafe
+    methods and for clients that wrote in the last LISTING_DB_PIN_SECONDS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with routing_state(self.pinned(request)) as state:
+            response = self.get_response(request)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        with routing_state(self.pinned(request)) as state:
+            response = await self.get_response(request)
+        return self.finish(state, response)
+
+    def pinned(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    def finish(self, state, response):
+        if state.wrote and replica_aliases():
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'LISTING_DB_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,318 @@
+"""
+Pluggable full-text search for listings.
+
+The backend is picked from settings.LISTING_SEARCH_BACKEND ('auto', 'mysql',
+'postgresql' or 'inverted_index'). 'auto' uses the database's native
+full-text index on MySQL and PostgreSQL and falls back to an in-process
+inverted index elsewhere (SQLite in tests and local development).
+
+Every backend follows SearchFilter's semantics: all terms must match
+(each as a word prefix) in at least one of the searchable fields. Results
+are annotated with ``search_rank`` and ordered by it.
+"""
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+SEARCH_FIELDS = ('title', 'description', 'location', 'amenities')
+
+# Relative weight of a term occurrence in each field for the inverted index
+FIELD_WEIGHTS = {'title': 3.0, 'location': 2.0, 'amenities': 2.0, 'description': 1.0}
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class BaseSearchBackend:
+    def search(self, queryset, terms):
+        raise NotImplementedError
+
+    def is_ready(self):
+        """
+        Whether search() can build its queryset without querying the
+        database, and so be called from async code.
+        """
+        return True
+
+    def listing_saved(self, listing):
+        """Hook called after a Listing is saved."""
+
+    def listing_deleted(self, listing_id):
+        """Hook called after a Listing is deleted."""
+
+
+class MySQLFullTextBackend(BaseSearchBackend):
+    """
+    MATCH ... AGAINST in boolean mode over the listing_fulltext_idx index.
+    """
+    match_sql = 'MATCH (title, description, location, amenities) AGAINST (%s IN BOOLEAN MODE)'
+
+    def search(self, queryset, terms):
+        words = [token for term in terms for token in tokenize(term)]
+        if not words:
+            return queryset
+        query = ' '.join(f'+{word}*' for word in words)
+        return queryset.annotate(
+            search_rank=RawSQL(self.match_sql, (query,), output_field=FloatField())
+        ).filter(search_rank__gt=0).order_by('-search_rank')
+
+
+class PostgresFullTextBackend(BaseSearchBackend):
+    """
+    tsvector/tsquery match over the listing_search_idx GIN expression index.
+    The vector expression must stay identical to the one in the migration.
+    """
+    vector_sql = (
+        "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, '') "
+        "|| ' ' || coalesce(location, '') || ' ' || coalesce(amenities, ''))"
+    )
+
+    def search(self, queryset, terms):
+        words = [token for term in terms for token in tokenize(term)]
+        if not words:
+            return queryset
+        query = ' & '.join(f'{word}:*' for word in words)
+        rank_sql = f"ts_rank({self.vector_sql}, to_tsquery('simple', %s))"
+        match_sql = f"{self.vector_sql} @@ to_tsquery('simple', %s)"
+        return queryset.annotate(
+            search_match=RawSQL(match_sql, (query,), output_field=BooleanField()),
+            search_rank=RawSQL(rank_sql, (query,), output_field=FloatField()),
+        ).filter(search_match=True).order_by('-search_rank')
+
+
+class InvertedIndex:
+    """
+    Token -> {doc: weighted term frequency} postings, plus a sorted token
+    list so prefix lookups are a binary search. Listings are keyed by small
+    integer doc numbers internally; hashing UUIDs dominated scoring time.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.doc_numbers = {}
+        self.listing_ids = []
+        self._sorted_tokens = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, listing_id, fields):
+        weights = defaultdict(float)
+        for field, text in fields.items():
+            for token in tokenize(text):
+                weights[token] += FIELD_WEIGHTS.get(field, 1.0)
+
+        with self._lock:
+            self.remove(listing_id)
+            doc = self.doc_numbers.get(listing_id)
+            if doc is None:
+                doc = self.doc_numbers[listing_id] = len(self.listing_ids)
+                self.listing_ids.append(listing_id)
+            for token, weight in weights.items():
+                if token not in self.postings:
+                    self._sorted_tokens = None
+                self.postings[token][doc] = weight
+            self.documents[doc] = tuple(weights)
+
+    def remove(self, listing_id):
+        with self._lock:
+            doc = self.doc_numbers.get(listing_id)
+            for token in self.documents.pop(doc, ()):
+                postings = self.postings[token]
+                postings.pop(doc, None)
+                if not postings:
+                    del self.postings[token]
+                    self._sorted_tokens = None
+
+    def tokens_with_prefix(self, prefix):
+        with self._lock:
+            if self._sorted_tokens is None:
+                self._sorted_tokens = sorted(self.postings)
+            tokens = self._sorted_tokens
+        start = bisect_left(tokens, prefix)
+        matches = []
+        for token in tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            matches.append(token)
+        return matches
+
+    def search(self, words, limit=None, candidates=None):
+        """
+        Return (listing_id, score) pairs for listings matching every word as
+        a token prefix, best first. Scores are TF-IDF sums. ``candidates``,
+        an iterable of listing ids, restricts the results to those listings.
+        """
+        total = len(self.documents) or 1
+        with self._lock:
+            allowed = None
+            if candidates is not None:
+                allowed = {self.doc_numbers.get(listing_id) for listing_id in candidates}
+            # (postings, idf) per matching token, for each query word
+            expanded = []
+            for word in words:
+                matches = [
+                    (self.postings[token], math.log(1 + total / len(self.postings[token])))
+                    for token in self.tokens_with_prefix(word)
+                ]
+                if not matches:
+                    return []
+                expanded.append(matches)
+
+            # Score the rarest word first so later words only probe candidates
+            expanded.sort(key=lambda matches: sum(len(postings) for postings, _ in matches))
+            scores = defaultdict(float)
+            for postings, idf in expanded[0]:
+                for doc, weight in postings.items():
+                    if allowed is None or doc in allowed:
+                        scores[doc] += weight * idf
+            for matches in expanded[1:]:
+                narrowed = {}
+                for doc, score in scores.items():
+                    word_score = 0.0
+                    for postings, idf in matches:
+                        weight = postings.get(doc)
+                        if weight:
+                            word_score += weight * idf
+                    if word_score:
+                        narrowed[doc] = score + word_score
+                scores = narrowed
+            if not scores:
+                return []
+
+            if limit:
+                ranked = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+            else:
+                ranked = sorted(scores.items(), key=itemgetter(1), reverse=True)
+            return [(self.listing_ids[doc], score) for doc, score in ranked]
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """
+    In-process fallback built lazily from the Listing table and kept current
+    from Listing save/delete signals. Each process holds its own copy, so it
+    only sees writes made through that process; use a database backend when
+    several processes serve writes.
+
+    At most ``max_results`` listings are returned, so later pages and
+    ?count=true stop there. When the queryset is already filtered, its ids
+    are read first and only those listings are ranked, so the cap never
+    drops a filtered listing in favour of one the filters exclude.
+    """
+
+    def __init__(self, max_results=None):
+        self.max_results = max_results or getattr(settings, 'LISTING_SEARCH_MAX_RESULTS', 1000)
+        self.index = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        from .models import Listing
+
+        index = InvertedIndex()
+        rows = Listing.objects.order_by().values_list('pk', *SEARCH_FIELDS)
+        for listing_id, *values in rows.iterator(chunk_size=2000):
+            index.add(listing_id, dict(zip(SEARCH_FIELDS, values)))
+        self.index = index
+        return index
+
+    def is_ready(self):
+        # Filtered querysets are read for their candidate ids
+        return False
+
+    def get_index(self):
+        if self.index is None:
+            with self._lock:
+                if self.index is None:
+                    self.build()
+        return self.index
+
+    def search(self, queryset, terms):
+        words = [token for term in terms for token in tokenize(term)]
+        if not words:
+            return queryset
+        candidates = None
+        if queryset.query.has_filters():
+            candidates = set(queryset.order_by().values_list('pk', flat=True))
+        ranked = self.get_index().search(words, limit=self.max_results, candidates=candidates)
+        if not ranked:
+            return queryset.none()
+        # Order by position in the ranking with one raw CASE; building a
+        # When() per result costs more than the search itself.
+        pk = queryset.model._meta.pk
+        column = f'{connection.ops.quote_name(queryset.model._meta.db_table)}.{connection.ops.quote_name(pk.column)}'
+        ids = [listing_id for listing_id, _ in ranked]
+        params = []
+        for position, listing_id in enumerate(ids):
+            params.extend([pk.get_db_prep_value(listing_id, connection), len(ids) - position])
+        rank = RawSQL(
+            f"CASE {column} {' '.join(['WHEN %s THEN %s'] * len(ids))} ELSE 0 END",
+            params,
+            output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=ids).annotate(search_rank=rank).order_by('-search_rank')
+
+    def listing_saved(self, listing):
+        if self.index is not None:
+            self.index.add(listing.pk, {field: getattr(listing, field) for field in SEARCH_FIELDS})
+
+    def listing_deleted(self, listing_id):
+        if self.index is not None:
+            self.index.remove(listing_id)
+
+
+BACKENDS = {
+    'mysql': MySQLFullTextBackend,
+    'postgresql': PostgresFullTextBackend,
+    'inverted_index': InvertedIndexBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'LISTING_SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            name = connection.vendor if connection.vendor in BACKENDS else 'inverted_index'
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+def reset_search_backend():
+    global _backend
+    _backend = None
+
+
+class ListingSearchFilter(SearchFilter):
+    """
+    SearchFilter that delegates ?search= to the configured search backend.
+    Results are ordered by relevance unless the client asked for ?ordering=,
+    so it must come after OrderingFilter in filter_backends.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        ordering = queryset.query.order_by
+        queryset = get_search_backend().search(queryset, terms)
+        if request.query_params.get(api_settings.ORDERING_PARAM) and ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
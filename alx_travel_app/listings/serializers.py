@@ -1,71 +1,214 @@
 import uuid
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from rest_framework.exceptions import APIException
 from .models import Listing, Booking, Review, Payment
+from .availability import is_available
+from .instrumentation import current_metrics
+from .replicas import read_from_primary
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-
-class UserSerializer(serializers.ModelSerializer):
+EXPAND_PARAM = 'expand'
+FIELDS_PARAM = 'fields'
+
+
+def parse_field_paths(value):
+    """
+    Turn a comma-separated list of dotted names into a tree:
+    'guest,listing.host' -> {'guest': {}, 'listing': {'host': {}}}.
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def requested_paths(request):
+    """Return the (expand, fields) trees asked for in the request's query string."""
+    if request is None:
+        return {}, {}
+    params = request.query_params
+    return parse_field_paths(params.get(EXPAND_PARAM)), parse_field_paths(params.get(FIELDS_PARAM))
+
+
+class ExpandableFieldsMixin:
+    """
+    Relations named in Meta.expandable_fields render as primary keys unless
+    the client asks for them with ?expand=, using dotted names to expand
+    further down (?expand=booking.listing.host). ?fields= keeps only the
+    named fields on reads; dotted names select fields of expanded objects.
+
+    Nested serializers receive their part of both trees through the
+    ``expand``/``fields`` arguments; the root serializer reads them from
+    the request.
+    """
+
+    def __init__(self, *args, expand=None, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self._context.get('request')
+        if expand is None and fields is None:
+            expand, fields = requested_paths(request)
+            if request is not None and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                fields = {}
+        expand, fields = expand or {}, fields or {}
+
+        for name, serializer_class in getattr(self.Meta, 'expandable_fields', {}).items():
+            if name not in self.fields:
+                continue
+            if name in expand:
+                self.fields[name] = serializer_class(
+                    read_only=True, expand=expand[name], fields=fields.get(name, {})
+                )
+            else:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+        if fields:
+            for name in list(self.fields):
+                if name not in fields and not self.fields[name].write_only:
+                    self.fields.pop(name)
+
+    def to_representation(self, instance):
+        metrics = current_metrics()
+        if metrics is None:
+            return super().to_representation(instance)
+        with metrics.timing('serialize'):
+            return super().to_representation(instance)
+
+    @classmethod
+    def related_lookups(cls, expand, fields, prefix=''):
+        """
+        Return the (select_related, prefetch_related) lookups needed to
+        render the given expansions without per-row queries.
+        """
+        select, prefetch = [], []
+        for name, lookup in getattr(cls.Meta, 'prefetch_fields', {}).items():
+            if not fields or name in fields:
+                prefetch.append(prefix + lookup)
+        for name, serializer_class in getattr(cls.Meta, 'expandable_fields', {}).items():
+            if name not in expand or (fields and name not in fields):
+                continue
+            select.append(prefix + name)
+            nested_select, nested_prefetch = serializer_class.related_lookups(
+                expand[name], fields.get(name, {}), prefix=f'{prefix}{name}__'
+            )
+            select += nested_select
+            prefetch += nested_prefetch
+        return select, prefetch
+
+
+def validate_coordinates(serializer, data):
+    """Listings have both a latitude and a longitude, or neither."""
+    instance = serializer.instance
+    latitude = data.get('latitude', getattr(instance, 'latitude', None))
+    longitude = data.get('longitude', getattr(instance, 'longitude', None))
+    if (latitude is None) != (longitude is None):
+        raise serializers.ValidationError({
+            "longitude" if longitude is None else "latitude": "Latitude and longitude must be given together."
+        })
+
+
+def validate_stay_dates(check_in, check_out):
+    if check_in >= check_out:
+        raise serializers.ValidationError({
+            "check_out_date": "Check-out date must be after check-in date."
+        })
+
+    from django.utils import timezone
+    if check_in < timezone.now().date():
+        raise serializers.ValidationError({
+            "check_in_date": "Check-in date cannot be in the past."
+        })
+
+
+class UserSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
         read_only_fields = ['id']
 
 
-class ListingSerializer(serializers.ModelSerializer):
-    host = UserSerializer(read_only=True)
+class ListingSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    host = serializers.PrimaryKeyRelatedField(read_only=True)
     host_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), 
         source='host', 
         write_only=True
     )
-    amenities_list = serializers.SerializerMethodField()
-    average_rating = serializers.SerializerMethodField()
-    total_reviews = serializers.SerializerMethodField()
+    amenities_list = serializers.SlugRelatedField(
+        source='amenity_items',
+        slug_field='name',
+        many=True,
+        read_only=True
+    )
+    total_reviews = serializers.IntegerField(source='review_count', read_only=True)
+    distance = serializers.SerializerMethodField(help_text='Km from ?near=, null without it')
 
     class Meta:
         model = Listing
         fields = [
             'listing_id', 'title', 'description', 'price_per_night', 
-            'location', 'amenities', 'amenities_list', 'host', 'host_id',
+            'location', 'latitude', 'longitude', 'distance', 'amenities', 'amenities_list', 'host', 'host_id',
             'is_available', 'created_at', 'updated_at', 'average_rating', 'total_reviews'
         ]
         read_only_fields = ['listing_id', 'created_at', 'updated_at', 'average_rating', 'total_reviews']
-
-    def get_amenities_list(self, obj):
-        return obj.get_amenities_list()
-
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
-
-    def get_total_reviews(self, obj):
-        return obj.reviews.count()
+        expandable_fields = {'host': UserSerializer}
+        prefetch_fields = {'amenities_list': 'amenity_items'}
 
     def validate_price_per_night(self, value):
         if value <= 0:
             raise serializers.ValidationError("Price per night must be greater than 0.")
         return value
 
+    def validate(self, data):
+        validate_coordinates(self, data)
+        return data
+
+    def get_distance(self, obj):
+        distance = getattr(obj, 'distance', None)
+        return None if distance is None else round(distance, 3)
+
 
-class BookingSerializer(serializers.ModelSerializer):
-    listing = ListingSerializer(read_only=True)
+class BookingConflict(APIException):
+    status_code = 409
+    default_detail = 'The listing is being booked by another request; try again.'
+    default_code = 'conflict'
+
+
+# MySQL's lock wait timeout and deadlock error codes
+MYSQL_LOCK_ERRORS = {1205, 1213}
+
+
+def raise_if_lock_timeout(exc):
+    """Raise BookingConflict if ``exc`` is a lock wait that timed out."""
+    if (exc.args and exc.args[0] in MYSQL_LOCK_ERRORS) or 'locked' in str(exc):
+        raise BookingConflict() from exc
+
+
+class BookingSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    listing = serializers.PrimaryKeyRelatedField(read_only=True)
     listing_id = serializers.PrimaryKeyRelatedField(
         queryset=Listing.objects.all(), 
         source='listing', 
         write_only=True
     )
-    guest = UserSerializer(read_only=True)
+    guest = serializers.PrimaryKeyRelatedField(read_only=True)
     guest_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), 
         source='guest', 
         write_only=True
     )
-    duration = serializers.ReadOnlyField()
-    is_active = serializers.ReadOnlyField()
+    # Annotated by BookingQuerySet.with_stay_fields(); left out for
+    # bookings read without it
+    duration = serializers.IntegerField(read_only=True, help_text='Nights')
+    is_active = serializers.BooleanField(
+        read_only=True, help_text='Holds its nights (pending or confirmed) and has not ended'
+    )
 
     class Meta:
         model = Booking
@@ -75,6 +218,7 @@ class BookingSerializer(serializers.ModelSerializer):
             'duration', 'is_active', 'created_at', 'updated_at'
         ]
         read_only_fields = ['booking_id', 'total_price', 'created_at', 'updated_at']
+        expandable_fields = {'listing': ListingSerializer, 'guest': UserSerializer}
 
     def validate(self, data):
         """
@@ -85,28 +229,13 @@ class BookingSerializer(serializers.ModelSerializer):
         listing = data.get('listing')
 
         if check_in and check_out:
-            if check_in >= check_out:
-                raise serializers.ValidationError({
-                    "check_out_date": "Check-out date must be after check-in date."
-                })
-
-            from django.utils import timezone
-            if check_in < timezone.now().date():
-                raise serializers.ValidationError({
-                    "check_in_date": "Check-in date cannot be in the past."
-                })
+            validate_stay_dates(check_in, check_out)
 
+            # Never trust a lagging replica with an overlap check
             if listing:
-                overlapping_bookings = Booking.objects.filter(
-                    listing=listing,
-                    status__in=[Booking.STATUS_PENDING, Booking.STATUS_CONFIRMED],
-                    check_in_date__lt=check_out,
-                    check_out_date__gt=check_in
-                )
-                if self.instance:
-                    overlapping_bookings = overlapping_bookings.exclude(booking_id=self.instance.booking_id)
-                
-                if overlapping_bookings.exists():
+                with read_from_primary():
+                    available = is_available(listing, check_in, check_out, exclude_booking=self.instance)
+                if not available:
                     raise serializers.ValidationError({
                         "dates": "The listing is not available for the selected dates."
                     })
@@ -121,17 +250,68 @@ class BookingSerializer(serializers.ModelSerializer):
         duration = (check_out - check_in).days
         validated_data['total_price'] = listing.price_per_night * duration
         
-        return super().create(validated_data)
-
-
-class ReviewSerializer(serializers.ModelSerializer):
-    listing = ListingSerializer(read_only=True)
+        try:
+            with transaction.atomic():
+                self.lock_listing_dates(validated_data)
+                return self.save_holding_nights(super().create, validated_data)
+        except OperationalError as exc:
+            raise_if_lock_timeout(exc)
+            raise
+
+    def update(self, instance, validated_data):
+        try:
+            with transaction.atomic():
+                self.lock_listing_dates(validated_data, instance)
+                return self.save_holding_nights(super().update, instance, validated_data)
+        except OperationalError as exc:
+            raise_if_lock_timeout(exc)
+            raise
+
+    def lock_listing_dates(self, validated_data, instance=None):
+        """
+        Take a row lock on the booked listing and re-check availability under
+        it. validate() runs before the lock, so two requests for the same
+        dates can both pass it; only requests for the same listing wait here.
+        Without SELECT ... FOR UPDATE (SQLite) a no-op UPDATE of the listing
+        takes the database's write lock instead, which serializes every
+        booking write.
+        """
+        listing = validated_data.get('listing', getattr(instance, 'listing', None))
+        check_in = validated_data.get('check_in_date', getattr(instance, 'check_in_date', None))
+        check_out = validated_data.get('check_out_date', getattr(instance, 'check_out_date', None))
+        status = validated_data.get('status', getattr(instance, 'status', Booking.STATUS_PENDING))
+        if status not in Booking.ACTIVE_STATUSES:
+            return
+
+        if connection.features.has_select_for_update:
+            Listing.objects.select_for_update().only('pk').get(pk=listing.pk)
+        else:
+            Listing.objects.filter(pk=listing.pk).update(updated_at=F('updated_at'))
+        if not is_available(listing, check_in, check_out, exclude_booking=instance):
+            raise serializers.ValidationError({
+                "dates": "The listing is not available for the selected dates."
+            })
+
+    def save_holding_nights(self, save, *args):
+        # The unique (listing, night) key on BookedNight is the last line of
+        # defence on backends where select_for_update() is a no-op.
+        try:
+            with transaction.atomic():
+                return save(*args)
+        except IntegrityError:
+            raise serializers.ValidationError({
+                "dates": "The listing is not available for the selected dates."
+            })
+
+
+class ReviewSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    listing = serializers.PrimaryKeyRelatedField(read_only=True)
     listing_id = serializers.PrimaryKeyRelatedField(
         queryset=Listing.objects.all(), 
         source='listing', 
         write_only=True
     )
-    reviewer = UserSerializer(read_only=True)
+    reviewer = serializers.PrimaryKeyRelatedField(read_only=True)
     reviewer_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(), 
         source='reviewer', 
@@ -146,6 +326,7 @@ class ReviewSerializer(serializers.ModelSerializer):
             'rating', 'rating_display', 'comment', 'created_at', 'updated_at'
         ]
         read_only_fields = ['review_id', 'created_at', "'updated_at"]
+        expandable_fields = {'listing': ListingSerializer, 'reviewer': UserSerializer}
 
     def get_rating_display(self, obj):
         return obj.get_rating_display()
@@ -184,8 +365,8 @@ class ReviewSerializer(serializers.ModelSerializer):
         return data
 
 
-class PaymentSerializer(serializers.ModelSerializer):
-    booking = BookingSerializer(read_only=True)
+class PaymentSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    booking = serializers.PrimaryKeyRelatedField(read_only=True)
     booking_id = serializers.PrimaryKeyRelatedField(
         queryset=Booking.objects.all(), 
         source='booking', 
@@ -197,9 +378,10 @@ class PaymentSerializer(serializers.ModelSerializer):
         fields = [
             'payment_id', 'booking', 'booking_id', 'amount', 
             'transaction_id', 'reference', 'status', 'payment_method',
-            'created_at', 'updated_at'
+            'checkout_url', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['payment_id', 'created_at', 'updated_at']
+        read_only_fields = ['payment_id', 'checkout_url', 'created_at', 'updated_at']
+        expandable_fields = {'booking': BookingSerializer}
 
     def validate_amount(self, value):
         if value <= 0:
@@ -223,13 +405,48 @@ class PaymentSerializer(serializers.ModelSerializer):
 class ListingCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Listing
-        fields = ['title', 'description', 'price_per_night', 'location', 'amenities']
+        fields = ['title', 'description', 'price_per_night', 'location', 'latitude', 'longitude', 'amenities']
+
+    def validate(self, data):
+        validate_coordinates(self, data)
+        return data
 
 
-class BookingCreateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Booking
-        fields = ['listing_id', 'check_in_date', 'check_out_date']
+class BookingCreateSerializer(BookingSerializer):
+    listing = None
+    guest = None
+    guest_id = None
+    duration = None
+    is_active = None
+
+    class Meta(BookingSerializer.Meta):
+        fields = ['booking_id', 'listing_id', 'check_in_date', 'check_out_date', 'total_price', 'status']
+        read_only_fields = ['booking_id', 'total_price', 'status']
+
+
+class BulkBookingItemSerializer(serializers.Serializer):
+    """
+    One entry of a bulk booking request. Only the dates are checked here;
+    listings are looked up and availability checked for the whole batch
+    in bulk.py.
+    """
+    listing_id = serializers.UUIDField()
+    check_in_date = serializers.DateField()
+    check_out_date = serializers.DateField()
+
+    def validate(self, data):
+        validate_stay_dates(data['check_in_date'], data['check_out_date'])
+        return data
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+
+    def validate(self, data):
+        if data['check_in'] >= data['check_out']:
+            raise serializers.ValidationError({"check_out": "check_out must be after check_in."})
+        return data
 
 
 class PaymentCreateSerializer(serializers.ModelSerializer):
@@ -238,6 +455,18 @@ class PaymentCreateSerializer(serializers.ModelSerializer):
         fields = ['booking_id', 'payment_method']
 
 
+class PaymentInitiateSerializer(serializers.Serializer):
+    booking_id = serializers.PrimaryKeyRelatedField(queryset=Booking.objects.all())
+
+    def validate_booking_id(self, booking):
+        # Other guests' bookings look the same as missing ones
+        if booking.guest_id != self.context['request'].user.pk:
+            raise serializers.ValidationError(f'Invalid pk "{booking.pk}" - object does not exist.')
+        if booking.status not in Booking.ACTIVE_STATUSES:
+            raise serializers.ValidationError(f"Cannot pay for a {booking.status} booking.")
+        return booking
+
+
 class ReviewCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
@@ -0,0 +1,185 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import outbox
+from .amenities import sync_listing_amenities
+from .availability import sync_booked_nights
+from .cache import invalidate_availability_pages, invalidate_listing
+from .models import Booking, Listing, Payment, Review
+from .search import get_search_backend
+from .stats import completed_amount, record_daily, record_totals
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    """
+    Stash the stored listing/rating of a review that is being updated so the
+    post_save handler can apply the difference.
+    """
+    instance._previous_rating = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_rating = (
+        Review.objects.filter(pk=instance.pk).values_list('listing_id', 'rating').first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_listing_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        Listing.objects.filter(pk=instance.listing_id).apply_review_delta(1, instance.rating)
+        return
+
+    previous_listing_id, previous_rating = previous
+    if previous_listing_id != instance.listing_id:
+        Listing.objects.filter(pk=previous_listing_id).apply_review_delta(-1, -previous_rating)
+        Listing.objects.filter(pk=instance.listing_id).apply_review_delta(1, instance.rating)
+    elif previous_rating != instance.rating:
+        Listing.objects.filter(pk=instance.listing_id).apply_review_delta(0, instance.rating - previous_rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_listing_rating_on_delete(sender, instance, **kwargs):
+    # Deletions run inside the collector's transaction, so this stays atomic
+    # with the DELETE (including cascades from a deleted listing, where the
+    # UPDATE simply matches no rows).
+    Listing.objects.filter(pk=instance.listing_id).apply_review_delta(-1, -instance.rating)
+
+
+@receiver(post_save, sender=Booking)
+def update_booked_nights(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sync_booked_nights(instance)
+
+
+@receiver(post_save, sender=Listing)
+def index_listing(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sync_listing_amenities(instance)
+    get_search_backend().listing_saved(instance)
+
+
+@receiver(post_delete, sender=Listing)
+def unindex_listing(sender, instance, **kwargs):
+    get_search_backend().listing_deleted(instance.pk)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_cached_listing(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_listing(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_cached_listing_rating(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_listing(instance.listing_id)
+    previous = getattr(instance, '_previous_rating', None)
+    if previous and previous[0] != instance.listing_id:
+        invalidate_listing(previous[0])
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_cached_availability(sender, instance, raw=False, **kwargs):
+    # Bookings only show up in listing responses through the check_in /
+    # check_out filter, so detail payloads and other pages stay valid.
+    if raw:
+        return
+    invalidate_availability_pages()
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def update_listing_total(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if kwargs['signal'] is post_delete:
+        record_totals(total_listings=-1)
+    elif created:
+        record_totals(total_listings=1)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def update_booking_stats(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if kwargs['signal'] is post_delete:
+        delta = -1
+    elif created:
+        delta = 1
+    else:
+        return
+    record_totals(total_bookings=delta)
+    record_daily(instance.listing_id, timezone.localdate(instance.created_at), bookings=delta)
+
+
+@receiver(pre_save, sender=Payment)
+def remember_previous_payment(sender, instance, raw=False, **kwargs):
+    instance._previous_payment = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_payment = (
+        Payment.objects.filter(pk=instance.pk).values_list('status', 'amount').first()
+    )
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def update_revenue_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_payment', None)
+    before = completed_amount(*previous) if previous else 0
+    after = completed_amount(instance.status, instance.amount)
+    delta = -after if kwargs['signal'] is post_delete else after - before
+    if not delta:
+        return
+    record_totals(total_revenue=delta)
+    listing_id = Booking.objects.filter(pk=instance.booking_id).values_list('listing_id', flat=True).first()
+    if listing_id is not None:
+        record_daily(listing_id, timezone.localdate(instance.created_at), revenue=delta)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_review_totals(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if kwargs['signal'] is post_delete:
+        record_totals(review_count=-1, rating_sum=-instance.rating)
+    elif created or previous is None:
+        record_totals(review_count=1, rating_sum=instance.rating)
+    else:
+        record_totals(rating_sum=instance.rating - previous[1])
+
+
+@receiver(post_save, sender=Booking)
+def record_booking_created(sender, instance, created, raw=False, **kwargs):
+    # Written in the booking's transaction; outbox.relay() publishes it
+    if raw or not created:
+        return
+    event = outbox.booking_created(instance)
+    if event is not None:
+        event.save()
+
+
+@receiver(post_save, sender=Payment)
+def record_payment_completed(sender, instance, created, raw=False, **kwargs):
+    if raw or instance.status != 'completed':
+        return
+    previous = getattr(instance, '_previous_payment', None)
+    if created or previous is None or previous[0] != 'completed':
+        outbox.record(outbox.PAYMENT_COMPLETED, str(instance.pk))
@@ -0,0 +1,193 @@
+"""
+Precomputed statistics for StatsAPIView.
+
+Site-wide totals live in StatsRollup rows and per-listing daily bookings
+and revenue in DailyListingStats rows. The model signals in signals.py
+keep both current as rows are written, so reading them never touches the
+Listing, Booking, Payment or Review tables. Writes that bypass signals
+(QuerySet.update, bulk_create, raw SQL) are picked up by
+reconcile_stats(), which the listings.tasks.reconcile_stats Celery task
+runs periodically.
+
+Totals are spread over settings.LISTING_STATS_SHARDS rows. Each thread
+always writes the same shard, so one transaction never holds locks on two
+of them, and different threads and processes mostly write different ones.
+"""
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Booking, DailyListingStats, Listing, Payment, Review, StatsRollup
+
+TOTAL_FIELDS = ('total_listings', 'total_bookings', 'total_revenue', 'review_count', 'rating_sum')
+
+BREAKDOWN_LISTING = 'listing'
+BREAKDOWN_LOCATION = 'location'
+BREAKDOWN_KEYS = {BREAKDOWN_LISTING: 'listing_id', BREAKDOWN_LOCATION: 'listing__location'}
+
+
+def current_shard():
+    # Thread idents are aligned addresses, so they are hashed rather than
+    # taken modulo the shard count, which would put every thread on shard 0
+    return hash((os.getpid(), threading.get_ident())) % max(1, getattr(settings, 'LISTING_STATS_SHARDS', 8))
+
+
+def increment(model, lookup, create=True, **deltas):
+    """
+    Add ``deltas`` to the row matching ``lookup``, inserting it when missing
+    and ``create`` is true.
+    """
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates) or not create:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another writer inserted it first
+        model.objects.filter(**lookup).update(**updates)
+
+
+def record_totals(**deltas):
+    increment(StatsRollup, {'shard': current_shard()}, **deltas)
+
+
+def record_daily(listing_id, day, bookings=0, revenue=0):
+    # Decrements only touch existing rows: while a listing is being deleted
+    # its daily rows are already gone and must not be recreated.
+    increment(
+        DailyListingStats,
+        {'listing_id': listing_id, 'date': day},
+        create=bookings > 0 or revenue > 0,
+        bookings=bookings,
+        revenue=revenue,
+    )
+
+
+def completed_amount(status, amount):
+    return Decimal(str(amount)) if status == 'completed' else Decimal('0')
+
+
+def get_totals():
+    """Return the StatsAPIView payload with a single query over the shard rows."""
+    return totals_payload(StatsRollup.objects.aggregate(**{field: Sum(field) for field in TOTAL_FIELDS}))
+
+
+async def aget_totals():
+    return totals_payload(await StatsRollup.objects.aaggregate(**{field: Sum(field) for field in TOTAL_FIELDS}))
+
+
+def totals_payload(totals):
+    review_count = totals['review_count'] or 0
+    return {
+        'total_listings': totals['total_listings'] or 0,
+        'total_bookings': totals['total_bookings'] or 0,
+        'total_revenue': totals['total_revenue'] or 0,
+        'average_rating': totals['rating_sum'] / review_count if review_count else 0,
+    }
+
+
+def daily_breakdown(by, start, end):
+    """
+    Daily bookings and revenue between ``start`` and ``end`` (inclusive)
+    per listing or per location.
+    """
+    return [breakdown_row(by, row) for row in breakdown_queryset(by, start, end)]
+
+
+async def adaily_breakdown(by, start, end):
+    return [breakdown_row(by, row) async for row in breakdown_queryset(by, start, end)]
+
+
+def breakdown_queryset(by, start, end):
+    key = BREAKDOWN_KEYS[by]
+    return (
+        DailyListingStats.objects.filter(date__gte=start, date__lte=end)
+        .values('date', key)
+        .annotate(total_bookings=Sum('bookings'), total_revenue=Sum('revenue'))
+        .order_by('date', key)
+    )
+
+
+def breakdown_row(by, row):
+    return {
+        'date': row['date'],
+        by: row[BREAKDOWN_KEYS[by]],
+        'bookings': row['total_bookings'],
+        'revenue': row['total_revenue'],
+    }
+
+
+def day_bounds(start, end):
+    """Aware datetimes spanning the local dates ``start`` to ``end`` inclusive."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def reconcile_stats(days=None, batch_size=1000):
+    """
+    Recompute the totals from the source tables, and the daily rows for the
+    last ``days`` days (all of them when ``days`` is None).
+
+    The shard rows are locked before anything is counted, so a concurrent
+    write either committed before the count or applies its increment on
+    top of the reconciled values once the lock is released.
+    """
+    with transaction.atomic():
+        shards = list(StatsRollup.objects.select_for_update().values_list('shard', flat=True))
+
+        reviews = Review.objects.aggregate(count=Count('pk'), total=Sum('rating'))
+        totals = {
+            'total_listings': Listing.objects.count(),
+            'total_bookings': Booking.objects.count(),
+            'total_revenue': Payment.objects.filter(status='completed').aggregate(
+                total=Sum('amount')
+            )['total'] or 0,
+            'review_count': reviews['count'],
+            'rating_sum': reviews['total'] or 0,
+        }
+        StatsRollup.objects.update_or_create(shard=0, defaults=totals)
+        StatsRollup.objects.filter(shard__in=[shard for shard in shards if shard != 0]).update(
+            **{field: 0 for field in TOTAL_FIELDS}
+        )
+
+        bookings = Booking.objects.order_by()
+        payments = Payment.objects.filter(status='completed').order_by()
+        daily = DailyListingStats.objects.all()
+        if days is not None:
+            end = timezone.localdate()
+            start = end - timedelta(days=days - 1)
+            since, until = day_bounds(start, end)
+            bookings = bookings.filter(created_at__gte=since, created_at__lt=until)
+            payments = payments.filter(created_at__gte=since, created_at__lt=until)
+            daily = daily.filter(date__gte=start, date__lte=end)
+
+        buckets = defaultdict(lambda: {'bookings': 0, 'revenue': Decimal('0')})
+        for row in bookings.values('listing_id', day=TruncDate('created_at')).annotate(total=Count('pk')):
+            buckets[row['listing_id'], row['day']]['bookings'] = row['total']
+        for row in payments.values('booking__listing_id', day=TruncDate('created_at')).annotate(total=Sum('amount')):
+            buckets[row['booking__listing_id'], row['day']]['revenue'] = row['total']
+
+        daily.delete()
+        DailyListingStats.objects.bulk_create(
+            [
+                DailyListingStats(listing_id=listing_id, date=day, **values)
+                for (listing_id, day), values in buckets.items()
+            ],
+            batch_size=batch_size,
+        )
+    return totals
@@ -1,19 +1,105 @@
+from datetime import timedelta
+
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
+from django.utils import timezone
+
+from . import notifications, outbox, payments, stats
+from .models import Payment
+
+# Gateway calls that hit a timeout, a dropped connection or a 5xx are retried
+gateway_retries = {
+    'autoretry_for': (payments.GatewayUnavailable,),
+    'retry_backoff': True,
+    'retry_backoff_max': 5 * 60,
+    'retry_jitter': True,
+    'max_retries': getattr(settings, 'CHAPA_MAX_RETRIES', 6),
+}
+
 
-@shared_task
+@shared_task(ignore_result=True)
 def send_booking_confirmation_email(booking_id, user_email):
     """
-    Send booking confirmation email as a Celery task
-    """
-    try:
-        subject = 'Booking Confirmation - ALX Travel App'
-        message = f'Your booking #{booking_id} has been confirmed. Thank you!'
-        from_email = settings.DEFAULT_FROM_EMAIL
-        recipient_list = [user_email]
-        
-        send_mail(subject, message, from_email, recipient_list)
-        return f"Email sent to {user_email}"
-    except Exception as e:
-        return f"Error sending email: {str(e)}"
+    Queue the booking confirmation email. Calling this again for the same
+    booking, e.g. on a retry, does not send a second email.
+    """
+    notifications.queue_booking_confirmation(booking_id, user_email)
+
+
+@shared_task(ignore_result=True)
+def send_payment_receipt_email(payment_id):
+    """Queue the receipt for a completed payment, once per payment."""
+    notifications.queue_payment_receipt(payment_id)
+
+
+@shared_task(
+    ignore_result=True,
+    autoretry_for=notifications.SEND_ERRORS,
+    retry_backoff=True,
+    retry_backoff_max=10 * 60,
+    retry_jitter=True,
+    max_retries=getattr(settings, 'LISTING_EMAIL_MAX_RETRIES', 8),
+)
+def dispatch_emails():
+    """
+    Send all pending EmailNotifications over one SMTP connection. On an
+    SMTP or network error the run is retried with exponential backoff;
+    notifications it already sent are not sent again.
+    """
+    notifications.dispatch_started()
+    notifications.dispatch_pending()
+
+
+@shared_task(ignore_result=True)
+def reconcile_stats(days=None):
+    """
+    Rebuild the StatsAPIView rollup from the source tables, correcting drift
+    from writes that bypassed the model signals.
+    """
+    stats.reconcile_stats(days=days)
+
+
+@shared_task(ignore_result=True, **gateway_retries)
+def initiate_payment(payment_id):
+    """Fetch the gateway checkout URL of a payment created by the initiate endpoint."""
+    payment = Payment.objects.select_related('booking__guest').filter(pk=payment_id).first()
+    if payment is not None:
+        payments.initiate(payment)
+
+
+@shared_task(ignore_result=True, **gateway_retries)
+def verify_payment(reference):
+    """Apply the gateway's current status of the payment with ``reference``."""
+    payments.verify(reference)
+
+
+@shared_task(ignore_result=True)
+def verify_pending_payments():
+    """
+    Poll the gateway for recent pending payments whose webhook has not
+    arrived after CHAPA_VERIFY_AFTER seconds. Payments older than
+    CHAPA_VERIFY_WINDOW seconds are taken as abandoned and left alone.
+    """
+    now = timezone.now()
+    references = Payment.objects.filter(
+        status='pending',
+        created_at__lt=now - timedelta(seconds=getattr(settings, 'CHAPA_VERIFY_AFTER', 10 * 60)),
+        created_at__gte=now - timedelta(seconds=getattr(settings, 'CHAPA_VERIFY_WINDOW', 24 * 60 * 60)),
+    ).exclude(checkout_url='').values_list('reference', flat=True)
+    for reference in references.iterator():
+        try:
+            payments.verify(reference)
+        except payments.GatewayError:
+            # Leave it for the next run
+            continue
+
+
+@shared_task(ignore_result=True)
+def relay_outbox():
+    """
+    Publish the OutboxEvents written since the last run and drop old
+    published ones. A broker error fails the run; the next one resumes
+    after the last event that was published.
+    """
+    outbox.relay()
+    outbox.purge()
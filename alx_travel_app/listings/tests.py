@@ -1,3 +1,1871 @@
-from django.test import TestCase
+import json
+import logging
+import math
+import random
+import tempfile
+import threading
+import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from smtplib import SMTPServerDisconnected
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from . import notifications, outbox, payments
+from .availability import is_available
+from .models import Amenity, EmailNotification, Listing, OutboxEvent, Booking, BookedNight, Review, Payment, StatsRollup
+from .cache import LocalLRUCache, get_listing_cache
+from .db.pool import PooledDatabaseWrapperMixin, close_pools, get_pool
+from .fake_gateway import FakeGateway
+from .geo import encode, successor
+from .management.commands._synthetic import generate_dataset, generate_listings
+from .query_plans import list_query_shapes, plan_problems
+from .instrumentation import RequestMetricsMiddleware, install_query_recorder, registry
+from .replicas import PIN_COOKIE, replica_reads, routing_state
+from .search import reset_search_backend
+from .serializers import BookingSerializer
+from .views import BookingViewSet, ListingViewSet, PaymentViewSet, ReviewViewSet
+from .stats import reconcile_stats, record_totals
+
+logger = logging.getLogger(__name__)
+
+
+def make_listing(host, **kwargs):
+    defaults = {
+        'title': 'Cozy Beach House',
+        'description': 'Beautiful beach house with ocean view',
+        'price_per_night': Decimal('150.00'),
+        'location': 'Miami, FL',
+        'amenities': 'WiFi, Pool, Parking',
+    }
+    defaults.update(kwargs)
+    return Listing.objects.create(host=host, **defaults)
+
+
+def make_booking(listing, guest, check_in, nights=3, **kwargs):
+    defaults = {
+        'check_out_date': check_in + timedelta(days=nights),
+        'total_price': listing.price_per_night * nights,
+        'status': 'confirmed',
+    }
+    defaults.update(kwargs)
+    return Booking.objects.create(listing=listing, guest=guest, check_in_date=check_in, **defaults)
+
+
+class ListingsTestCase(TestCase):
+    """
+    Start every test with empty process-level caches; rolled-back test data
+    would otherwise leak between tests through them.
+    """
+
+    def setUp(self):
+        super().setUp()
+        get_listing_cache().clear()
+        reset_search_backend()
+        self.addCleanup(reset_search_backend)
+
+
+class ListingRatingQueryCountTests(ListingsTestCase):
+    """
+    The number of queries per endpoint must not grow with the page size.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        cls.hosts = [User.objects.create_user(f'host{i}', password='password123') for i in range(3)]
+        cls.guests = [User.objects.create_user(f'guest{i}', password='password123') for i in range(3)]
+        start = date.today() + timedelta(days=30)
+        for i in range(6):
+            listing = make_listing(cls.hosts[i % 3], title=f'Listing {i}')
+            for j, guest in enumerate(cls.guests):
+                booking = make_booking(listing, guest, start + timedelta(days=10 * j), status='completed')
+                Payment.objects.create(
+                    booking=booking, amount=booking.total_price, reference=f'BK-{booking.booking_id}'
+                )
+                Review.objects.create(listing=listing, reviewer=guest, rating=(i + j) % 5 + 1, comment='Nice')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_listing_list(self):
+        # One SELECT + amenities prefetch; the host renders as an id
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/listings/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(response.data['results'][0]['total_reviews'], 3)
+
+    def test_listing_list_expanded_host(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/listings/', {'expand': 'host'})
+        self.assertEqual(response.data['results'][0]['host']['username'], 'host2')
+
+    def test_listing_detail(self):
+        listing = Listing.objects.get(title='Listing 0')
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/listings/{listing.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['average_rating'], 2.0)
+        self.assertEqual(response.data['total_reviews'], 3)
+        self.assertEqual(response.data['amenities_list'], ['Parking', 'Pool', 'WiFi'])
+        self.assertEqual(response.data['host'], listing.host_id)
+
+    def test_booking_list(self):
+        # Relations render as ids by default, so this is a single SELECT
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/bookings/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 18)
+        self.assertIsInstance(response.data['results'][0]['listing'], uuid.UUID)
+
+    def test_booking_list_expanded(self):
+        # Bookings joined to guest, listing and host + the amenities prefetch
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/bookings/', {'expand': 'guest,listing.host'})
+        booking = response.data['results'][0]
+        self.assertEqual(booking['listing']['host']['username'], 'host2')
+        self.assertEqual(booking['guest']['username'], 'guest2')
+
+    def test_review_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/reviews/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 18)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/reviews/', {'expand': 'reviewer'})
+        self.assertIn('email', response.data['results'][0]['reviewer'])
+
+    def test_payment_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/payments/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 18)
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/payments/', {'expand': 'booking.listing.host,booking.guest'})
+        self.assertEqual(response.data['results'][0]['booking']['listing']['title'], 'Listing 5')
+
+    def test_sparse_fields(self):
+        # Unexpanded and unrequested relations are not even joined
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/payments/', {
+                'expand': 'booking.listing', 'fields': 'reference,booking.status,booking.guest',
+            })
+        payment = response.data['results'][0]
+        self.assertEqual(set(payment), {'reference', 'booking'})
+        self.assertEqual(set(payment['booking']), {'status', 'guest'})
+
+
+class KeysetPaginationTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        for i in range(7):
+            make_listing(cls.host, title=f'Listing {i}', price_per_night=Decimal(100 + i % 3))
+        # Same created_at for several rows: the primary key breaks the tie
+        Listing.objects.filter(title__in=['Listing 2', 'Listing 3', 'Listing 4']).update(
+            created_at=Listing.objects.get(title='Listing 2').created_at
+        )
+
+    def walk(self, url, params):
+        client = APIClient()
+        titles = []
+        response = client.get(url, params)
+        pages = [response]
+        while response.data['next']:
+            response = client.get(response.data['next'])
+            pages.append(response)
+        for page in pages:
+            titles.extend(item['title'] for item in page.data['results'])
+        return titles, pages
+
+    def test_walks_every_row_once_without_count(self):
+        expected = [listing.title for listing in Listing.objects.order_by('-created_at', '-pk')]
+        with self.assertNumQueries(2):
+            response = APIClient().get('/api/listings/', {'page_size': 3})
+        self.assertNotIn('count', response.data)
+        titles, pages = self.walk('/api/listings/', {'page_size': 3})
+        self.assertEqual(titles, expected)
+        self.assertEqual(len(pages), 3)
+
+    def test_previous_link_returns_the_prior_page(self):
+        _, pages = self.walk('/api/listings/', {'page_size': 3})
+        response = APIClient().get(pages[2].data['previous'])
+        self.assertEqual(response.data['results'], pages[1].data['results'])
+
+    def test_follows_client_ordering(self):
+        expected = [
+            listing.title for listing in Listing.objects.order_by('price_per_night', 'pk')
+        ]
+        titles, _ = self.walk('/api/listings/', {'page_size': 2, 'ordering': 'price_per_night'})
+        self.assertEqual(titles, expected)
+
+    def test_count_is_opt_in(self):
+        response = APIClient().get('/api/listings/', {'page_size': 2, 'count': 'true'})
+        self.assertEqual(response.data['count'], 7)
+        self.assertNotIn('count=', response.data['next'])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = APIClient().get('/api/listings/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ListingRatingAggregateTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guests = [User.objects.create_user(f'guest{i}', password='password123') for i in range(3)]
+        cls.listing = make_listing(cls.host, title='Rated')
+        cls.other = make_listing(cls.host, title='Other')
+
+    def assertRatingStats(self, listing, count, total, average):
+        listing.refresh_from_db()
+        self.assertEqual(listing.review_count, count)
+        self.assertEqual(listing.rating_sum, total)
+        self.assertAlmostEqual(listing.average_rating, average)
+
+    def test_create_update_delete_maintain_aggregates(self):
+        first = Review.objects.create(listing=self.listing, reviewer=self.guests[0], rating=5, comment='Great')
+        Review.objects.create(listing=self.listing, reviewer=self.guests[1], rating=2, comment='Meh')
+        self.assertRatingStats(self.listing, 2, 7, 3.5)
+
+        first.rating = 3
+        first.save()
+        self.assertRatingStats(self.listing, 2, 5, 2.5)
+
+        first.listing = self.other
+        first.save()
+        self.assertRatingStats(self.listing, 1, 2, 2.0)
+        self.assertRatingStats(self.other, 1, 3, 3.0)
+
+        Review.objects.filter(listing=self.listing).delete()
+        self.assertRatingStats(self.listing, 0, 0, 0.0)
+
+    def test_rebuild_command_recomputes_from_reviews(self):
+        for i, guest in enumerate(self.guests):
+            Review.objects.create(listing=self.listing, reviewer=guest, rating=i + 3, comment='Ok')
+        Listing.objects.update(review_count=0, rating_sum=0, average_rating=0)
+
+        call_command('rebuild_rating_stats', chunk_size=1, stdout=StringIO())
+        self.assertRatingStats(self.listing, 3, 12, 4.0)
+        self.assertRatingStats(self.other, 0, 0, 0.0)
+
+    def test_filter_and_order_by_average_rating(self):
+        Review.objects.create(listing=self.listing, reviewer=self.guests[0], rating=4, comment='Good')
+        Review.objects.create(listing=self.other, reviewer=self.guests[0], rating=2, comment='Poor')
+
+        response = APIClient().get('/api/listings/', {'ordering': '-average_rating'})
+        self.assertEqual([item['title'] for item in response.data['results']], ['Rated', 'Other'])
+
+        response = APIClient().get('/api/listings/', {'min_rating': 3})
+        self.assertEqual([item['title'] for item in response.data['results']], ['Rated'])
+
+
+class AvailabilityTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.listing = make_listing(cls.host, title='Booked')
+        cls.free = make_listing(cls.host, title='Free')
+        cls.start = date.today() + timedelta(days=10)
+
+    def test_booking_holds_its_nights_until_cancelled(self):
+        booking = make_booking(self.listing, self.guest, self.start, nights=3)
+        self.assertEqual(BookedNight.objects.filter(booking=booking).count(), 3)
+        self.assertFalse(is_available(self.listing, self.start + timedelta(days=2), self.start + timedelta(days=5)))
+        # Check-out day is free for the next guest
+        self.assertTrue(is_available(self.listing, self.start + timedelta(days=3), self.start + timedelta(days=5)))
+        self.assertTrue(is_available(self.listing, self.start, self.start + timedelta(days=3), exclude_booking=booking))
+
+        booking.status = Booking.STATUS_CANCELLED
+        booking.save()
+        self.assertFalse(BookedNight.objects.filter(booking=booking).exists())
+        self.assertTrue(is_available(self.listing, self.start, self.start + timedelta(days=3)))
+
+    def test_moving_a_booking_moves_its_nights(self):
+        booking = make_booking(self.listing, self.guest, self.start, nights=2)
+        booking.check_in_date = self.start + timedelta(days=5)
+        booking.check_out_date = self.start + timedelta(days=7)
+        booking.save()
+        self.assertEqual(
+            list(BookedNight.objects.filter(booking=booking).values_list('night', flat=True)),
+            [self.start + timedelta(days=5), self.start + timedelta(days=6)],
+        )
+
+    def test_listing_list_filters_by_free_dates(self):
+        make_booking(self.listing, self.guest, self.start, nights=3)
+        client = APIClient()
+
+        response = client.get('/api/listings/', {
+            'check_in': self.start + timedelta(days=1),
+            'check_out': self.start + timedelta(days=2),
+        })
+        self.assertEqual([item['title'] for item in response.data['results']], ['Free'])
+
+        response = client.get('/api/listings/', {
+            'check_in': self.start + timedelta(days=3),
+            'check_out': self.start + timedelta(days=4),
+        })
+        self.assertEqual(len(response.data['results']), 2)
+
+        response = client.get('/api/listings/', {'check_in': self.start, 'check_out': self.start})
+        self.assertEqual(response.status_code, 400)
+
+    def test_backfill_stops_on_existing_double_bookings(self):
+        backfill = import_module('listings.migrations.0006_booked_nights').backfill_booked_nights
+        schema_editor = mock.Mock(connection=connection)
+        first = make_booking(self.listing, self.guest, self.start, nights=3)
+        make_booking(self.free, self.guest, self.start, nights=3)
+        # Written around the nights, as bookings were before they existed
+        Booking.objects.bulk_create([Booking(
+            listing=self.listing, guest=self.host, check_in_date=self.start + timedelta(days=2),
+            check_out_date=self.start + timedelta(days=4), total_price=Decimal('300.00'), status='confirmed',
+        )])
+        BookedNight.objects.all().delete()
+
+        with self.assertRaisesMessage(RuntimeError, f'booking {first.pk} '):
+            backfill(django_apps, schema_editor)
+        self.assertFalse(BookedNight.objects.exists())
+
+        Booking.objects.filter(guest=self.host).update(status=Booking.STATUS_CANCELLED)
+        backfill(django_apps, schema_editor)
+        self.assertEqual(BookedNight.objects.count(), 6)
+
+
+class BookingCreateTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.listing = make_listing(cls.host)
+        cls.start = date.today() + timedelta(days=10)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+    def book(self, check_in, nights):
+        return self.client.post('/api/bookings/', {
+            'listing_id': str(self.listing.pk),
+            'check_in_date': check_in,
+            'check_out_date': check_in + timedelta(days=nights),
+        })
+
+    def test_create_prices_booking_and_rejects_overlap(self):
+        response = self.book(self.start, 3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('450.00'))
+        self.assertEqual(response.data['status'], Booking.STATUS_PENDING)
+
+        response = self.book(self.start + timedelta(days=2), 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('dates', response.data)
+
+    def test_night_key_rejects_booking_that_slipped_past_validation(self):
+        # A concurrent request that committed between validate() and the
+        # insert is caught by the unique (listing, night) key.
+        from .serializers import BookingSerializer
+
+        make_booking(self.listing, self.guest, self.start, nights=3)
+        with self.assertRaises(ValidationError):
+            BookingSerializer().save_holding_nights(
+                lambda: make_booking(self.listing, self.guest, self.start + timedelta(days=1), nights=1)
+            )
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_lock_timeout_is_a_conflict(self):
+        from .serializers import BookingSerializer
+
+        locked = OperationalError('database is locked')
+        with mock.patch.object(BookingSerializer, 'lock_listing_dates', side_effect=locked):
+            response = self.book(self.start, 3)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Booking.objects.exists())
+
+
+class BookingStayFieldTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.listing = make_listing(cls.host, title='Beach House')
+        today = date.today()
+        cls.past = make_booking(cls.listing, cls.guest, today - timedelta(days=10), nights=2, status='completed')
+        cls.current = make_booking(cls.listing, cls.guest, today - timedelta(days=1), nights=5)
+        cls.upcoming = make_booking(cls.listing, cls.guest, today + timedelta(days=20), nights=3, status='pending')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+    def bookings(self, **params):
+        response = self.client.get('/api/bookings/', params)
+        self.assertEqual(response.status_code, 200)
+        return {item['booking_id']: (item['duration'], item['is_active']) for item in response.data['results']}
+
+    def test_duration_and_is_active_are_annotated(self):
+        self.assertEqual(self.bookings(), {
+            str(self.past.pk): (2, False), str(self.current.pk): (5, True), str(self.upcoming.pk): (3, True),
+        })
+
+    def test_filter_and_order_on_them(self):
+        self.assertEqual(set(self.bookings(is_active='false')), {str(self.past.pk)})
+        self.assertEqual(set(self.bookings(min_duration=3, max_duration=4)), {str(self.upcoming.pk)})
+        self.assertEqual(list(self.bookings(ordering='-duration')), [
+            str(self.current.pk), str(self.upcoming.pk), str(self.past.pk),
+        ])
+
+    def test_cancel_returns_the_new_is_active(self):
+        response = self.client.post(f'/api/bookings/{self.upcoming.pk}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['is_active']), ('cancelled', False))
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/api/bookings/', {'expand': 'listing,guest'})
+        for week in range(5, 15):
+            make_booking(self.listing, self.guest, date.today() + timedelta(weeks=week))
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/api/bookings/', {'expand': 'listing,guest'})
+        self.assertEqual(len(response.data['results']), 13)
+        self.assertEqual(len(many), len(few))
+
+    def test_str_does_not_query(self):
+        booking = Booking.objects.get(pk=self.current.pk)
+        review = Review.objects.create(listing=self.listing, reviewer=self.guest, rating=4, comment='Nice')
+        review = Review.objects.get(pk=review.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(booking), f'Booking for {self.listing.pk} by {self.guest.pk}')
+            self.assertEqual(str(review), f'Review for {self.listing.pk} by {self.guest.pk}')
+        booking = Booking.objects.select_related('listing', 'guest').get(pk=self.current.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(booking), 'Booking for Beach House by guest')
+
+
+class ConcurrentBookingStressTests(TransactionTestCase):
+    """
+    Fire many overlapping booking requests in parallel and check that no two
+    active bookings of a listing share a night.
+    """
+    attempts = 200
+    workers = 16
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # Threads share an in-memory database through SQLite's shared
+            # cache, which fails on table locks instead of waiting for them
+            self.skipTest('needs a database file, not an in-memory SQLite database')
+        self.host = User.objects.create_user('host', password='password123')
+        self.guests = [User.objects.create_user(f'guest{i}', password='password123') for i in range(self.workers)]
+        self.listings = [make_listing(self.host, title=f'Listing {i}') for i in range(4)]
+
+    def attempt(self, index):
+        rng = random.Random(index)
+        listing = rng.choice(self.listings)
+        check_in = date.today() + timedelta(days=rng.randint(1, 30))
+        client = APIClient()
+        client.force_authenticate(self.guests[index % self.workers])
+        try:
+            response = client.post('/api/bookings/', {
+                'listing_id': str(listing.pk),
+                'check_in_date': check_in,
+                'check_out_date': check_in + timedelta(days=rng.randint(1, 4)),
+            })
+            return response.status_code
+        finally:
+            connection.close()
+
+    def test_parallel_bookings_never_overlap(self):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            statuses = list(pool.map(self.attempt, range(self.attempts)))
+        elapsed = time.perf_counter() - started
+
+        # 409 is a lock wait that timed out
+        self.assertEqual(set(statuses) - {201, 400, 409}, set())
+        self.assertGreater(statuses.count(201), 0)
+
+        for listing in self.listings:
+            stays = sorted(
+                Booking.objects.filter(listing=listing, status__in=Booking.ACTIVE_STATUSES)
+                .values_list('check_in_date', 'check_out_date')
+            )
+            for (_, previous_out), (next_in, _) in zip(stays, stays[1:]):
+                self.assertLessEqual(previous_out, next_in)
+
+        logger.info(
+            '%d booking attempts in %.2fs (%.0f req/s): %d created, %d rejected, %d timed out',
+            self.attempts, elapsed, self.attempts / elapsed, statuses.count(201), statuses.count(400),
+            statuses.count(409),
+        )
+
+
+class AmenityTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        make_listing(cls.host, title='Pool and WiFi', amenities='Pool, WiFi, Parking')
+        make_listing(cls.host, title='Pool only', amenities='pool')
+        make_listing(cls.host, title='WiFi only', amenities='Wifi , Gym')
+
+    def titles(self, **params):
+        response = APIClient().get('/api/listings/', params)
+        return sorted(item['title'] for item in response.data['results'])
+
+    def test_amenities_text_is_normalized_into_shared_rows(self):
+        self.assertEqual(Amenity.objects.count(), 4)
+        self.assertEqual(Amenity.objects.get(slug='wifi').listings.count(), 2)
+
+    def test_changing_amenities_text_resyncs_links(self):
+        listing = Listing.objects.get(title='Pool only')
+        listing.amenities = 'Hot Tub, Pool'
+        listing.save()
+        self.assertEqual(
+            sorted(listing.amenity_items.values_list('slug', flat=True)), ['hot-tub', 'pool']
+        )
+
+    def test_filter_requires_all_amenities_by_default(self):
+        self.assertEqual(self.titles(amenities='pool,wifi'), ['Pool and WiFi'])
+        self.assertEqual(self.titles(amenities='pool,sauna'), [])
+
+    def test_filter_any_amenity(self):
+        self.assertEqual(
+            self.titles(amenities='pool,gym', amenities_match='any'),
+            ['Pool and WiFi', 'Pool only', 'WiFi only'],
+        )
+
+
+@override_settings(LISTING_SEARCH_BACKEND='inverted_index')
+class ListingSearchTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        make_listing(cls.host, title='Beach House', description='Quiet stay', location='Miami, FL')
+        make_listing(cls.host, title='Mountain Cabin', description='Short walk to the beach', location='Aspen, CO')
+        make_listing(cls.host, title='Downtown Loft', description='City views', location='New York, NY',
+                     amenities='WiFi, Gym')
+
+    def search(self, term, **params):
+        response = APIClient().get('/api/listings/', {'search': term, **params})
+        return [item['title'] for item in response.data['results']]
+
+    def test_ranks_title_matches_above_description_matches(self):
+        self.assertEqual(self.search('beach'), ['Beach House', 'Mountain Cabin'])
+
+    def test_terms_are_anded_word_prefixes(self):
+        self.assertEqual(self.search('mount cab'), ['Mountain Cabin'])
+        self.assertEqual(self.search('beach gym'), [])
+        self.assertEqual(self.search('gym'), ['Downtown Loft'])
+
+    def test_explicit_ordering_overrides_relevance(self):
+        self.assertEqual(self.search('beach', ordering='created_at'), ['Beach House', 'Mountain Cabin'])
+        self.assertEqual(self.search('beach', ordering='-created_at'), ['Mountain Cabin', 'Beach House'])
+
+    def test_index_follows_listing_saves_and_deletes(self):
+        self.assertEqual(self.search('loft'), ['Downtown Loft'])
+        listing = Listing.objects.get(title='Downtown Loft')
+        listing.title = 'Harbour Studio'
+        listing.save()
+        self.assertEqual(self.search('loft'), [])
+        self.assertEqual(self.search('harbour'), ['Harbour Studio'])
+        listing.delete()
+        self.assertEqual(self.search('harbour'), [])
+
+    @override_settings(LISTING_SEARCH_MAX_RESULTS=1)
+    def test_result_cap_applies_after_filters(self):
+        self.assertEqual(self.search('beach'), ['Beach House'])
+        self.assertEqual(self.search('beach', location='Aspen, CO'), ['Mountain Cabin'])
+        self.assertEqual(self.search('beach', location='New York, NY'), [])
+
+
+class GeoSearchTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        make_listing(cls.host, title='South Beach', latitude=25.7700, longitude=-80.1900, price_per_night=Decimal('300'))
+        make_listing(cls.host, title='Little Haiti', latitude=25.8300, longitude=-80.1950, price_per_night=Decimal('90'))
+        make_listing(cls.host, title='Fort Lauderdale', latitude=26.1224, longitude=-80.1373)
+        make_listing(cls.host, title='Nowhere in particular')
+        make_listing(cls.host, title='Suva', location='Fiji', latitude=-18.1248, longitude=178.4501)
+        make_listing(cls.host, title='Apia', location='Samoa', latitude=-13.8333, longitude=-171.7667)
+
+    def titles(self, **params):
+        response = APIClient().get('/api/listings/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item['title'] for item in response.data['results']]
+
+    def test_geohash_encoding(self):
+        self.assertEqual(encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(successor('u4pr'), 'u4ps')
+        self.assertEqual(successor('u4pz'), 'u4q')
+        self.assertIsNone(successor('zz'))
+
+    def test_near_returns_listings_within_radius_nearest_first(self):
+        self.assertEqual(self.titles(near='25.7617,-80.1918', radius=10), ['South Beach', 'Little Haiti'])
+        self.assertEqual(
+            self.titles(near='25.7617,-80.1918', radius=50), ['South Beach', 'Little Haiti', 'Fort Lauderdale'],
+        )
+        response = APIClient().get('/api/listings/', {'near': '25.7617,-80.1918', 'radius': 10})
+        self.assertAlmostEqual(response.data['results'][0]['distance'], 0.9, places=1)
+
+    def test_explicit_ordering_overrides_distance(self):
+        self.assertEqual(
+            self.titles(near='25.7617,-80.1918', radius=10, ordering='price_per_night'), ['Little Haiti', 'South Beach'],
+        )
+
+    def test_bbox_crossing_the_antimeridian(self):
+        self.assertEqual(sorted(self.titles(bbox='-20,170,-10,-170')), ['Apia', 'Suva'])
+        self.assertEqual(self.titles(bbox='-20,170,-10,179'), ['Suva'])
+
+    def test_radius_search_matches_a_full_scan(self):
+        rng = random.Random(7)
+        generate_listings(300, rng)
+        Listing.objects.bulk_create([
+            Listing(title=f'Anywhere {i}', description='', price_per_night=Decimal('100'), location='Earth',
+                    amenities='', host=self.host, latitude=rng.uniform(-90, 90), longitude=rng.uniform(-180, 180))
+            for i in range(300)
+        ])
+        centers = [(25.76, -80.19), (89.9, 10), (-89.5, -100), (-17, 179.99), (0, -179.9)]
+        centers += [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(10)]
+        for latitude, longitude in centers:
+            for radius in (5, 100, 500):
+                with self.subTest(latitude=latitude, longitude=longitude, radius=radius):
+                    self.assertEqual(
+                        sorted(self.titles(near=f'{latitude},{longitude}', radius=radius, page_size=1000)),
+                        sorted(
+                            listing.title for listing in Listing.objects.exclude(latitude=None)
+                            if haversine_km(latitude, longitude, listing.latitude, listing.longitude) <= radius
+                        ),
+                    )
+
+    def test_geohash_follows_coordinates(self):
+        listing = Listing.objects.get(title='Nowhere in particular')
+        self.assertEqual(listing.geohash, '')
+        listing.latitude, listing.longitude = 25.77, -80.19
+        listing.save()
+        self.assertEqual(Listing.objects.get(pk=listing.pk).geohash, encode(25.77, -80.19))
+
+    def test_invalid_parameters(self):
+        client = APIClient()
+        for params in [{'near': 'miami'}, {'near': '91,0'}, {'near': '25,-80', 'radius': 5000},
+                       {'radius': 5}, {'bbox': '1,2,3'}, {'bbox': '10,0,0,10'}]:
+            with self.subTest(params=params):
+                self.assertEqual(client.get('/api/listings/', params).status_code, 400)
+
+    def test_coordinates_are_set_together(self):
+        client = APIClient()
+        client.force_authenticate(self.host)
+        data = {'title': 'Pinned', 'description': 'x', 'price_per_night': '80', 'location': 'Accra', 'amenities': 'WiFi'}
+        self.assertEqual(client.post('/api/listings/', {**data, 'latitude': 5.6}, format='json').status_code, 400)
+        response = client.post('/api/listings/', {**data, 'latitude': 5.6, 'longitude': -0.19}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.titles(near='5.6037,-0.1870', radius=1), ['Pinned'])
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    half_chord = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(min(half_chord, 1.0)))
+
+
+@skipUnless(connection.vendor in ('sqlite', 'mysql'), 'EXPLAIN checks cover SQLite and MySQL')
+@override_settings(LISTING_CACHE_BACKEND='none')
+class QueryPlanTests(ListingsTestCase):
+    """
+    Every filter and ordering of the list endpoints, as a guest and as
+    staff, must be read through an index that yields the page in order.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.staff = User.objects.create_user('staff', password='password123', is_staff=True)
+        cls.listing = make_listing(cls.host, latitude=25.77, longitude=-80.19)
+        make_listing(cls.host, location='Accra', price_per_night=Decimal('80.00'))
+        booking = make_booking(cls.listing, cls.guest, date.today() - timedelta(days=10))
+        make_booking(cls.listing, cls.guest, date.today() + timedelta(days=10), status='pending')
+        Payment.objects.create(booking=booking, amount=booking.total_price, reference='PLAN-1')
+        Review.objects.create(listing=cls.listing, reviewer=cls.guest, rating=5, comment='Great')
+
+    def assert_indexed(self, user, path, view_class, samples, allow_sort=False, computed=()):
+        """
+        EXPLAIN the page query of every list_query_shapes() request; the
+        prefetches and lookups around it select by primary key.
+        """
+        table = connection.ops.quote_name(view_class.queryset.model._meta.db_table)
+        client = APIClient()
+        client.force_authenticate(user)
+        for label, params in list_query_shapes(view_class, samples, computed):
+            with self.subTest(user=user.username, path=path, shape=label):
+                queries = []
+
+                def capture(execute, sql, params, many, context):
+                    queries.append((sql, params))
+                    return execute(sql, params, many, context)
+
+                with connection.execute_wrapper(capture):
+                    response = client.get(path, params)
+                self.assertEqual(response.status_code, 200, response.data)
+                pages = [(sql, sql_params) for sql, sql_params in queries if f' FROM {table}' in sql and 'LIMIT' in sql]
+                self.assertTrue(pages)
+                problems = [
+                    f'{", ".join(found)}: {sql}' for sql, sql_params in pages
+                    if (found := [
+                        problem for problem in plan_problems(sql, sql_params)
+                        if not (allow_sort and problem.startswith('sort'))
+                    ])
+                ]
+                if problems:
+                    self.fail('\n'.join(problems))
+
+    def test_listing_list(self):
+        samples = {
+            'location': 'Accra', 'price_per_night': '80.00', 'is_available': 'true',
+            'min_price': 100, 'max_price': 100, 'min_rating': 4, 'max_rating': 2,
+            # Subquery filters: the listings they match are sorted
+            'amenities': None, 'amenities_match': None, 'check_in': None, 'check_out': None,
+        }
+        self.assert_indexed(self.guest, '/api/listings/', ListingViewSet, samples)
+
+    def test_booking_list(self):
+        # duration and is_active are computed for each row
+        computed = ['duration', 'min_duration', 'max_duration', 'is_active']
+        for user in (self.guest, self.staff):
+            self.assert_indexed(user, '/api/bookings/', BookingViewSet, {'status': 'pending'}, computed=computed)
+
+    def test_review_list(self):
+        samples = {'listing': str(self.listing.pk), 'rating': 5}
+        self.assert_indexed(self.guest, '/api/reviews/', ReviewViewSet, samples)
+
+    def test_payment_list(self):
+        samples = {'status': 'pending', 'payment_method': 'chapa'}
+        self.assert_indexed(self.staff, '/api/payments/', PaymentViewSet, samples)
+        # A guest's payments are found through their bookings, and the
+        # handful of them sorted: no payment index can lead with the guest
+        self.assert_indexed(self.guest, '/api/payments/', PaymentViewSet, samples, allow_sort=True)
+
+    def test_plan_problems_reports_scans_and_sorts(self):
+        table = Listing._meta.db_table
+        self.assertEqual(plan_problems(f'SELECT * FROM {table} ORDER BY created_at, listing_id', ()), [])
+        self.assertTrue(plan_problems(f'SELECT * FROM {table} WHERE title = %s', ('x',)))
+        self.assertTrue(plan_problems(f'SELECT * FROM {table} ORDER BY title', ()))
+
+
+class ListingFacetTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        make_listing(cls.host, title='Cheap Accra', location='Accra', price_per_night=Decimal('40'), amenities='WiFi')
+        make_listing(cls.host, title='Mid Accra', location='Accra', price_per_night=Decimal('120'), amenities='WiFi, Pool')
+        make_listing(cls.host, title='Mid Miami', location='Miami, FL', price_per_night=Decimal('140'), amenities='Pool')
+        make_listing(cls.host, title='Luxury Miami', location='Miami, FL', price_per_night=Decimal('1200'), amenities='Pool, Gym')
+        make_listing(cls.host, title='Nairobi Loft', location='Nairobi', price_per_night=Decimal('90'), amenities='Gym')
+
+    def titles(self, params):
+        response = APIClient().get('/api/listings/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return sorted(item['title'] for item in response.data['results'])
+
+    def test_price_and_location_filters(self):
+        self.assertEqual(self.titles({'min_price': 100, 'max_price': 150}), ['Mid Accra', 'Mid Miami'])
+        self.assertEqual(
+            self.titles({'location': ['Accra', 'Miami, FL'], 'max_price': 130}), ['Cheap Accra', 'Mid Accra'],
+        )
+        self.assertEqual(self.titles({'location': 'Miami, FL'}), ['Luxury Miami', 'Mid Miami'])
+
+    def test_rating_bounds(self):
+        listing = Listing.objects.get(title='Nairobi Loft')
+        Review.objects.create(listing=listing, reviewer=self.host, rating=5, comment='Great')
+        self.assertEqual(self.titles({'min_rating': 4.5}), ['Nairobi Loft'])
+        self.assertEqual(len(self.titles({'max_rating': 4.5})), 4)
+
+    def test_facets_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            response = APIClient().get('/api/listings/facets/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['locations'], [
+            {'location': 'Accra', 'count': 2}, {'location': 'Miami, FL', 'count': 2}, {'location': 'Nairobi', 'count': 1},
+        ])
+        self.assertEqual(
+            [(bucket['min'], bucket['max'], bucket['count']) for bucket in response.data['price'] if bucket['count']],
+            [(0, 50, 1), (50, 100, 1), (100, 150, 2), (1000, None, 1)],
+        )
+        self.assertEqual(response.data['amenities'], [
+            {'slug': 'pool', 'name': 'Pool', 'count': 3},
+            {'slug': 'gym', 'name': 'Gym', 'count': 2},
+            {'slug': 'wifi', 'name': 'WiFi', 'count': 2},
+        ])
+
+    def test_facets_follow_the_filters(self):
+        response = APIClient().get('/api/listings/facets/', {'location': ['Accra', 'Nairobi'], 'amenities': 'gym'})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['locations'], [{'location': 'Nairobi', 'count': 1}])
+        self.assertEqual(response.data['amenities'], [{'slug': 'gym', 'name': 'Gym', 'count': 1}])
+
+
+class ListingCacheTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.listing = make_listing(cls.host, title='Cached')
+
+    def test_detail_is_served_from_cache_until_listing_changes(self):
+        client = APIClient()
+        url = f'/api/listings/{self.listing.pk}/'
+        first = client.get(url)
+        with self.assertNumQueries(0):
+            second = client.get(url)
+        self.assertEqual(second.data, first.data)
+
+        self.listing.title = 'Renamed'
+        self.listing.save()
+        self.assertEqual(client.get(url).data['title'], 'Renamed')
+
+    def test_review_write_invalidates_detail_and_pages(self):
+        client = APIClient()
+        url = f'/api/listings/{self.listing.pk}/'
+        client.get(url)
+        client.get('/api/listings/')
+        Review.objects.create(listing=self.listing, reviewer=self.guest, rating=4, comment='Good')
+        self.assertEqual(client.get(url).data['total_reviews'], 1)
+        self.assertEqual(client.get('/api/listings/').data['results'][0]['total_reviews'], 1)
+
+    def test_booking_write_invalidates_availability_pages(self):
+        client = APIClient()
+        check_in = date.today() + timedelta(days=5)
+        params = {'check_in': check_in, 'check_out': check_in + timedelta(days=2)}
+        self.assertEqual(len(client.get('/api/listings/', params).data['results']), 1)
+        client.get('/api/listings/')
+        make_booking(self.listing, self.guest, check_in, nights=2)
+        self.assertEqual(len(client.get('/api/listings/', params).data['results']), 0)
+        # Pages that don't filter by availability don't depend on bookings
+        with self.assertNumQueries(0):
+            client.get('/api/listings/')
+
+    def test_list_pages_are_keyed_by_normalized_params(self):
+        client = APIClient()
+        client.get('/api/listings/', {'ordering': 'price_per_night', 'is_available': 'true'})
+        with self.assertNumQueries(0):
+            client.get('/api/listings/', {'is_available': 'true', 'ordering': 'price_per_night'})
+
+    def test_if_none_match_returns_304(self):
+        client = APIClient()
+        url = f'/api/listings/{self.listing.pk}/'
+        etag = client.get(url)['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        self.listing.price_per_night = Decimal('99.00')
+        self.listing.save()
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_lru_evicts_least_recently_used_and_expires_entries(self):
+        store = LocalLRUCache(max_entries=2, timeout=60)
+        store.set('a', 1)
+        store.set('b', 2)
+        store.get('a')
+        store.set('c', 3)
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('a'), 1)
+
+        store.set('d', 4, timeout=0)
+        self.assertIsNone(store.get('d'))
+
+    def test_generation_counters_survive_eviction(self):
+        store = LocalLRUCache(max_entries=2, timeout=60)
+        store.incr('generation')
+        for key in 'abc':
+            store.set(key, key)
+        self.assertEqual(store.counter('generation'), 1)
+        self.assertEqual(store.incr('generation'), 2)
+
+
+class StatsRollupTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guests = [User.objects.create_user(f'guest{i}', password='password123') for i in range(2)]
+        start = date.today() + timedelta(days=30)
+        cls.miami = make_listing(cls.host, title='Miami')
+        cls.denver = make_listing(cls.host, title='Denver', location='Denver, CO')
+        cls.payments = []
+        for listing in (cls.miami, cls.denver):
+            for i, guest in enumerate(cls.guests):
+                booking = make_booking(listing, guest, start + timedelta(days=10 * i))
+                cls.payments.append(Payment.objects.create(
+                    booking=booking, amount=booking.total_price, reference=f'BK-{booking.booking_id}'
+                ))
+                Review.objects.create(listing=listing, reviewer=guest, rating=4 + i, comment='Nice')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def expected_totals(self):
+        return {
+            'total_listings': Listing.objects.count(),
+            'total_bookings': Booking.objects.count(),
+            'total_revenue': sum(p.amount for p in Payment.objects.filter(status='completed')),
+            'average_rating': sum(r.rating for r in Review.objects.all()) / Review.objects.count(),
+        }
+
+    def test_stats_read_the_rollup_in_one_query(self):
+        for payment in self.payments[:3]:
+            payment.status = 'completed'
+            payment.save()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, self.expected_totals())
+        self.assertEqual(response.data['total_revenue'], Decimal('1350.00'))
+        self.assertEqual(response.data['average_rating'], 4.5)
+
+    def test_rollup_follows_updates_and_deletes(self):
+        self.payments[0].status = 'completed'
+        self.payments[0].save()
+        self.payments[0].amount = Decimal('100.00')
+        self.payments[0].save()
+        self.payments[1].status = 'completed'
+        self.payments[1].save()
+        self.payments[1].status = 'failed'
+        self.payments[1].save()
+        review = Review.objects.filter(listing=self.miami).first()
+        review.rating = 1
+        review.save()
+        self.denver.delete()
+
+        self.assertEqual(self.client.get('/api/stats/').data, self.expected_totals())
+        self.assertEqual(self.client.get('/api/stats/').data['total_revenue'], Decimal('100.00'))
+
+    def test_daily_breakdown_by_listing_and_location(self):
+        for payment in self.payments:
+            payment.status = 'completed'
+            payment.save()
+        today = timezone.localdate().isoformat()
+
+        response = self.client.get('/api/stats/', {'breakdown': 'location'})
+        self.assertEqual(response.data['daily'], [
+            {'date': timezone.localdate(), 'location': 'Denver, CO', 'bookings': 2, 'revenue': Decimal('900.00')},
+            {'date': timezone.localdate(), 'location': 'Miami, FL', 'bookings': 2, 'revenue': Decimal('900.00')},
+        ])
+
+        response = self.client.get('/api/stats/', {'breakdown': 'listing', 'start': today, 'end': today})
+        self.assertEqual(
+            {row['listing'] for row in response.data['daily']}, {self.miami.pk, self.denver.pk}
+        )
+        self.assertEqual(self.client.get('/api/stats/', {'breakdown': 'host'}).status_code, 400)
+        self.assertEqual(
+            self.client.get('/api/stats/', {'breakdown': 'listing', 'start': '2020-01-01'}).status_code, 400
+        )
+
+    def test_reconcile_corrects_writes_that_bypass_signals(self):
+        Payment.objects.update(status='completed')
+        Booking.objects.filter(listing=self.denver).delete()
+        StatsRollup.objects.create(shard=99, total_listings=5)
+
+        reconcile_stats()
+
+        self.assertEqual(self.client.get('/api/stats/').data, self.expected_totals())
+        daily = self.client.get('/api/stats/', {'breakdown': 'listing'}).data['daily']
+        self.assertEqual(daily, [
+            {'date': timezone.localdate(), 'listing': self.miami.pk, 'bookings': 2, 'revenue': Decimal('900.00')},
+        ])
+
+
+class StatsShardTests(TransactionTestCase):
+    threads = 16
+
+    def test_threads_spread_over_the_shards(self):
+        # All threads are alive at once, so none of them reuses another's ident
+        barrier = threading.Barrier(self.threads)
+
+        def write():
+            barrier.wait()
+            try:
+                record_totals(total_bookings=1)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for future in [pool.submit(write) for _ in range(self.threads)]:
+                future.result()
+
+        self.assertGreater(StatsRollup.objects.count(), 1)
+        self.assertEqual(sum(StatsRollup.objects.values_list('total_bookings', flat=True)), self.threads)
+
+
+class BulkCreateTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.listing = make_listing(cls.host)
+        cls.other = make_listing(cls.host, title='Other', price_per_night=Decimal('80.00'))
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+        self.start = date.today() + timedelta(days=30)
+
+    def booking_item(self, listing, offset, nights=2):
+        check_in = self.start + timedelta(days=offset)
+        return {
+            'listing_id': str(listing.pk),
+            'check_in_date': check_in.isoformat(),
+            'check_out_date': (check_in + timedelta(days=nights)).isoformat(),
+        }
+
+    def test_bulk_listings_from_ndjson(self):
+        lines = [
+            {'title': f'Partner {i}', 'description': 'Synced', 'price_per_night': '120.00',
+             'location': 'Accra', 'amenities': 'WiFi, Sauna'}
+            for i in range(3)
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines + [{'title': 'Broken'}])
+        response = self.client.post('/api/listings/bulk/', body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 1))
+        self.assertIn('price_per_night', response.data['results'][3]['errors'])
+        created = Listing.objects.filter(title__startswith='Partner')
+        self.assertEqual(created.count(), 3)
+        self.assertTrue(all(listing.host_id == self.guest.pk for listing in created))
+        self.assertEqual(
+            sorted(created[0].amenity_items.values_list('slug', flat=True)), ['sauna', 'wifi']
+        )
+        self.assertEqual(self.client.get('/api/stats/').data['total_listings'], 5)
+
+    @override_settings(LISTING_STATS_SHARDS=1)
+    def test_bulk_bookings_check_overlaps_set_based(self):
+        make_booking(self.listing, self.host, self.start, nights=3)
+        items = [
+            self.booking_item(self.listing, 1),         # overlaps the existing booking
+            self.booking_item(self.listing, 3),         # free
+            self.booking_item(self.listing, 4),         # overlaps item 1 of the batch
+            self.booking_item(self.other, 1, nights=4),
+            {**self.booking_item(self.other, 10), 'listing_id': str(uuid.uuid4())},
+            {**self.booking_item(self.other, 10), 'check_out_date': self.start.isoformat()},
+        ]
+        # Date checks per item are in-memory; the lock, the occupancy lookup
+        # and the inserts run once for the batch, whatever its size.
+        with self.assertNumQueries(14):
+            response = self.client.post('/api/bookings/bulk/', items, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['error', 'created', 'error', 'created', 'error', 'error'])
+        self.assertIn('dates', response.data['results'][0]['errors'])
+        self.assertIn('listing_id', response.data['results'][4]['errors'])
+        self.assertIn('check_out_date', response.data['results'][5]['errors'])
+
+        booking = Booking.objects.get(pk=response.data['results'][3]['id'])
+        self.assertEqual(booking.total_price, Decimal('320.00'))
+        self.assertEqual(booking.guest, self.guest)
+        self.assertEqual(BookedNight.objects.filter(booking=booking).count(), 4)
+        self.assertFalse(is_available(self.listing, self.start + timedelta(days=3), self.start + timedelta(days=5)))
+        self.assertEqual(self.client.get('/api/stats/').data['total_bookings'], 3)
+
+    def test_rejects_non_arrays_and_oversized_batches(self):
+        response = self.client.post('/api/bookings/bulk/', self.booking_item(self.listing, 0), format='json')
+        self.assertEqual(response.status_code, 400)
+        with self.settings(LISTING_BULK_MAX_ITEMS=1):
+            items = [self.booking_item(self.listing, 0), self.booking_item(self.listing, 5)]
+            response = self.client.post('/api/bookings/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Booking.objects.count(), 0)
+
+
+class ExportTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.listing = make_listing(cls.admin)
+        start = date.today() + timedelta(days=30)
+        cls.bookings = [
+            make_booking(cls.listing, cls.guest, start + timedelta(days=5 * i), status=status)
+            for i, status in enumerate(['confirmed', 'cancelled', 'confirmed', 'pending', 'confirmed'])
+        ]
+        Payment.objects.create(booking=cls.bookings[0], amount=Decimal('450.00'), reference='BK-1', status='completed')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def read_ndjson(self, response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_streams_ndjson_in_keyset_chunks(self):
+        response = self.client.get('/api/exports/bookings/', {'status': 'confirmed,pending'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = self.read_ndjson(response)
+        self.assertEqual(
+            [row['booking_id'] for row in rows],
+            [str(booking.pk) for booking in self.bookings if booking.status != 'cancelled'],
+        )
+        self.assertEqual(rows[0]['total_price'], '450.00')
+
+        # Rows are read 2 at a time: 5 rows take 3 queries
+        output = StringIO()
+        with self.assertNumQueries(3):
+            call_command('export_records', 'bookings', '--chunk-size', '2', stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 5)
+
+    def test_resumes_after_last_row_received(self):
+        response = self.client.get('/api/exports/bookings/', {'after': str(self.bookings[2].pk)})
+        self.assertEqual(
+            [row['booking_id'] for row in self.read_ndjson(response)],
+            [str(self.bookings[3].pk), str(self.bookings[4].pk)],
+        )
+        self.assertEqual(self.client.get('/api/exports/bookings/', {'after': str(uuid.uuid4())}).status_code, 400)
+
+    def test_csv_with_date_range(self):
+        today = timezone.localdate()
+        response = self.client.get('/api/exports/payments/', {
+            'file_format': 'csv', 'created_after': today.isoformat(), 'created_before': today.isoformat(),
+        })
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['payment_id', 'booking_id', 'amount'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn(',450.00,,BK-1,completed,', lines[1])
+
+        response = self.client.get('/api/exports/payments/', {
+            'file_format': 'csv', 'created_before': (today - timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 1)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.guest)
+        self.assertEqual(self.client.get('/api/exports/bookings/').status_code, 403)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get('/api/exports/bookings/')
+        self.assertTrue(response.is_async)
+        lines = b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+
+
+@override_settings(LISTING_SEARCH_BACKEND='inverted_index')
+class AsyncReadPathTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.listings = [
+            make_listing(cls.host, title=f'Sunny Loft {i}', price_per_night=Decimal(100 + 10 * i))
+            for i in range(5)
+        ]
+        cls.check_in = date.today() + timedelta(days=30)
+        make_booking(cls.listings[0], cls.guest, cls.check_in)
+
+    def setUp(self):
+        super().setUp()
+        self.sync_client = APIClient()
+
+    async def test_listing_list_matches_sync_endpoint(self):
+        params = {
+            'ordering': '-price_per_night', 'page_size': 2, 'expand': 'host', 'amenities': 'pool',
+            'check_in': self.check_in.isoformat(), 'check_out': (self.check_in + timedelta(days=2)).isoformat(),
+        }
+        response = await self.async_client.get('/api/async/listings/', params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        expected = await sync_to_async(lambda: self.sync_client.get('/api/listings/', params).json())()
+        self.assertEqual(data['results'], expected['results'])
+        self.assertEqual([row['title'] for row in data['results']], ['Sunny Loft 4', 'Sunny Loft 3'])
+        self.assertIn('/api/async/listings/', data['next'])
+
+        response = await self.async_client.get(data['next'].split('testserver')[1])
+        self.assertEqual([row['title'] for row in response.json()['results']], ['Sunny Loft 2', 'Sunny Loft 1'])
+
+        response = await self.async_client.get('/api/async/listings/', {'search': 'loft 3'})
+        self.assertEqual([row['title'] for row in response.json()['results']], ['Sunny Loft 3'])
+
+        response = await self.async_client.get('/api/async/listings/', {'check_in': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_listing_detail_is_cached_with_etag(self):
+        url = f'/api/async/listings/{self.listings[1].pk}/'
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json()['title'], 'Sunny Loft 1')
+        self.assertEqual(response.json()['amenities_list'], ['Parking', 'Pool', 'WiFi'])
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get(f'/api/async/listings/{uuid.uuid4()}/')
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.post(url)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_availability(self):
+        listing = self.listings[0]
+        for check_in, available in [(self.check_in + timedelta(days=2), False), (self.check_in + timedelta(days=3), True)]:
+            params = {'check_in': check_in.isoformat(), 'check_out': (check_in + timedelta(days=2)).isoformat()}
+            response = await self.async_client.get(f'/api/async/listings/{listing.pk}/availability/', params)
+            self.assertIs(response.json()['available'], available)
+            expected = await sync_to_async(
+                lambda: self.sync_client.get(f'/api/listings/{listing.pk}/availability/', params).json()
+            )()
+            self.assertEqual(response.json(), expected)
+
+        params = {'check_in': self.check_in.isoformat(), 'check_out': self.check_in.isoformat()}
+        response = await self.async_client.get(f'/api/async/listings/{listing.pk}/availability/', params)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_stats_require_authentication(self):
+        response = await self.async_client.get('/api/async/stats/')
+        self.assertEqual(response.status_code, 403)
+
+        await self.async_client.aforce_login(self.guest)
+        response = await self.async_client.get('/api/async/stats/', {'breakdown': 'location'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_listings'], 5)
+        self.assertEqual(response.json()['daily'][0]['bookings'], 1)
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """Locmem backend that counts opened connections and drops the one
+    sending a subject listed in ``fail_subjects``."""
+    opened = 0
+    fail_subjects = set()
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.subject in self.fail_subjects:
+                raise SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='listings.tests.FlakyEmailBackend', LISTING_EMAIL_MAX_ATTEMPTS=2)
+class EmailNotificationTests(TestCase):
+    def setUp(self):
+        FlakyEmailBackend.opened = 0
+        FlakyEmailBackend.fail_subjects = set()
+        cache.delete(notifications.DISPATCH_SCHEDULED_KEY)
+
+    def queue(self, count, dispatch=False):
+        for i in range(count):
+            notifications.queue_email(f'test:{i}', f'guest{i}@example.com', f'Subject {i}', 'Body', dispatch=dispatch)
+
+    def test_queueing_is_idempotent(self):
+        notifications.queue_booking_confirmation(42, 'guest@example.com', dispatch=False)
+        _, created = notifications.queue_booking_confirmation(42, 'guest@example.com', dispatch=False)
+        self.assertFalse(created)
+        self.assertEqual(notifications.dispatch_pending(), 1)
+        self.assertEqual(notifications.dispatch_pending(), 0)
+        notifications.queue_booking_confirmation(42, 'guest@example.com', dispatch=False)
+        self.assertEqual(notifications.dispatch_pending(), 0)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('#42', mail.outbox[0].body)
+
+    def test_batches_share_one_connection(self):
+        self.queue(5)
+        self.assertEqual(notifications.dispatch_pending(size=2), 5)
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual([message.to for message in mail.outbox], [[f'guest{i}@example.com'] for i in range(5)])
+        self.assertFalse(EmailNotification.objects.exclude(status=EmailNotification.STATUS_SENT).exists())
+
+        # Nothing pending: no connection is opened
+        notifications.dispatch_pending()
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+
+    def test_failed_dispatch_does_not_resend(self):
+        self.queue(3)
+        FlakyEmailBackend.fail_subjects = {'Subject 1'}
+        with self.assertRaises(SMTPServerDisconnected):
+            notifications.dispatch_pending()
+        rows = {row.subject: row for row in EmailNotification.objects.all()}
+        self.assertEqual(rows['Subject 0'].status, EmailNotification.STATUS_SENT)
+        self.assertEqual((rows['Subject 1'].status, rows['Subject 1'].attempts), (EmailNotification.STATUS_PENDING, 1))
+        self.assertIn('unexpectedly closed', rows['Subject 1'].last_error)
+        self.assertEqual((rows['Subject 2'].status, rows['Subject 2'].attempts), (EmailNotification.STATUS_PENDING, 0))
+
+        # The second failure uses up LISTING_EMAIL_MAX_ATTEMPTS
+        with self.assertRaises(SMTPServerDisconnected):
+            notifications.dispatch_pending()
+        self.assertEqual(EmailNotification.objects.get(subject='Subject 1').status, EmailNotification.STATUS_FAILED)
+
+        self.assertEqual(notifications.dispatch_pending(), 1)
+        self.assertEqual([message.subject for message in mail.outbox], ['Subject 0', 'Subject 2'])
+
+    def test_stale_claims_are_reclaimed(self):
+        self.queue(1)
+        notifications.claim_batch(10)
+        self.assertEqual(notifications.dispatch_pending(), 0)
+        EmailNotification.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(notifications.dispatch_pending(), 1)
+
+    def test_dispatches_are_coalesced(self):
+        with mock.patch('listings.tasks.dispatch_emails.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.queue(3, dispatch=True)
+            self.assertEqual(apply_async.call_count, 1)
+
+            notifications.dispatch_started()
+            with self.captureOnCommitCallbacks(execute=True):
+                notifications.queue_email('test:late', 'late@example.com', 'Late', 'Body')
+            self.assertEqual(apply_async.call_count, 2)
+
+    def test_booking_confirmation_task(self):
+        from .tasks import dispatch_emails, send_booking_confirmation_email
+
+        send_booking_confirmation_email.apply(args=(7, 'guest@example.com'))
+        send_booking_confirmation_email.apply(args=(7, 'guest@example.com'))
+        dispatch_emails.apply()
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class OutboxTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', email='guest@example.com', password='password123')
+        cls.listing = make_listing(cls.host)
+
+    def setUp(self):
+        super().setUp()
+        # Stands in for the Celery app: records send_task() calls
+        self.app = mock.MagicMock()
+        self.check_in = date.today() + timedelta(days=10)
+
+    def test_events_are_written_with_the_change(self):
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        payload = {
+            'listing_id': str(self.listing.pk),
+            'check_in_date': self.check_in.isoformat(),
+            'check_out_date': (self.check_in + timedelta(days=2)).isoformat(),
+        }
+        response = client.post('/api/bookings/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        # A rejected booking leaves nothing behind
+        self.assertEqual(client.post('/api/bookings/', payload, format='json').status_code, 400)
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.task, 'listings.tasks.send_booking_confirmation_email')
+        self.assertEqual(event.args, [response.data['booking_id'], 'guest@example.com'])
+        self.assertIsNone(event.published_at)
+
+        booking = Booking.objects.get(pk=response.data['booking_id'])
+        payment = Payment.objects.create(booking=booking, amount=booking.total_price, reference='ref-outbox')
+        payment.status = 'completed'
+        payment.save()
+        payment.save()
+        self.assertEqual(
+            list(OutboxEvent.objects.filter(event=outbox.PAYMENT_COMPLETED).values_list('args', flat=True)),
+            [[str(payment.pk)]],
+        )
+
+    def test_bulk_bookings_write_events(self):
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        items = [
+            {'listing_id': str(self.listing.pk),
+             'check_in_date': (self.check_in + timedelta(days=3 * i)).isoformat(),
+             'check_out_date': (self.check_in + timedelta(days=3 * i + 2)).isoformat()}
+            for i in range(3)
+        ]
+        response = client.post('/api/bookings/bulk/', items, format='json')
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual(
+            sorted(args[0] for args in OutboxEvent.objects.values_list('args', flat=True)),
+            sorted(str(result['id']) for result in response.data['results']),
+        )
+
+    def test_relay_publishes_in_batches_once(self):
+        bookings = [make_booking(self.listing, self.guest, self.check_in + timedelta(days=5 * i)) for i in range(5)]
+        self.assertEqual(outbox.relay(batch_size=2, app=self.app), 5)
+        self.assertEqual(outbox.relay(batch_size=2, app=self.app), 0)
+        send_task = self.app.send_task
+        # One broker connection per batch
+        self.assertEqual(self.app.producer_or_acquire.call_count, 3)
+        self.assertEqual([call.kwargs['args'][0] for call in send_task.call_args_list], [str(b.pk) for b in bookings])
+        self.assertEqual(send_task.call_args_list[0].kwargs['task_id'], f'outbox-{OutboxEvent.objects.first().pk}')
+        self.assertFalse(OutboxEvent.objects.filter(published_at__isnull=True).exists())
+
+        OutboxEvent.objects.update(published_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(outbox.purge(days=7), 5)
+
+    def test_broker_errors_keep_unpublished_events(self):
+        for i in range(3):
+            make_booking(self.listing, self.guest, self.check_in + timedelta(days=5 * i))
+        self.app.send_task.side_effect = [None, ConnectionError('broker down')]
+        with self.assertRaises(ConnectionError):
+            outbox.relay(app=self.app)
+        first, failed, waiting = OutboxEvent.objects.all()
+        self.assertIsNotNone(first.published_at)
+        self.assertEqual((failed.published_at, failed.attempts, failed.last_error), (None, 1, 'broker down'))
+        self.assertEqual(waiting.attempts, 0)
+
+        self.app.send_task.reset_mock(side_effect=True)
+        self.assertEqual(outbox.relay(app=self.app), 2)
+        self.assertEqual(self.app.send_task.call_count, 2)
+
+
+class PaymentGatewayTests(ListingsTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gateway = FakeGateway().start()
+        cls.addClassCleanup(cls.gateway.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', email='guest@example.com', password='password123')
+        cls.staff = User.objects.create_user('staff', password='password123', is_staff=True)
+        cls.listing = make_listing(cls.host)
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(
+            CHAPA_API_URL=self.gateway.url,
+            CHAPA_SECRET_KEY=self.gateway.secret_key,
+            CHAPA_WEBHOOK_SECRET=self.gateway.webhook_secret,
+            CHAPA_READ_TIMEOUT=0.5,
+        ))
+        payments.reset_gateway()
+        self.addCleanup(payments.reset_gateway)
+        self.gateway.latency = 0
+        self.gateway.fail_next = 0
+        self.booking = make_booking(self.listing, self.guest, date.today() + timedelta(days=5), status='pending')
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+    def initiate(self):
+        from .tasks import initiate_payment
+
+        response = self.client.post('/api/payments/initiate/', {'booking_id': str(self.booking.pk)}, format='json')
+        self.assertEqual(response.status_code, 202)
+        initiate_payment(response.data['payment_id'])
+        return Payment.objects.get(pk=response.data['payment_id'])
+
+    def post_webhook(self, body, signature):
+        return APIClient().post(
+            '/api/payments/webhook/', body, content_type='application/json', HTTP_X_CHAPA_SIGNATURE=signature,
+        )
+
+    def test_initiate_then_webhook_completes_once(self):
+        payment = self.initiate()
+        self.assertEqual(payment.amount, self.booking.total_price)
+        self.assertTrue(payment.checkout_url.startswith(self.gateway.url))
+        self.assertEqual(
+            list(OutboxEvent.objects.filter(event=outbox.PAYMENT_INITIATED).values_list('args', flat=True)),
+            [[str(payment.pk)]],
+        )
+        # Initiating again hands back the pending payment
+        response = self.client.post('/api/payments/initiate/', {'booking_id': str(self.booking.pk)}, format='json')
+        self.assertEqual((response.status_code, response.data['payment_id']), (200, str(payment.pk)))
+
+        body, signature = self.gateway.pay(payment.reference)
+        self.assertEqual(self.post_webhook(body, 'bad' + signature[3:]).status_code, 403)
+        for _ in range(2):
+            response = self.post_webhook(body, signature)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.data['processed'])
+
+        payment.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(payment.transaction_id, self.gateway.transactions[payment.reference]['reference'])
+        self.assertEqual(self.booking.status, Booking.STATUS_CONFIRMED)
+        self.assertEqual(OutboxEvent.objects.filter(event=outbox.PAYMENT_COMPLETED).count(), 1)
+
+        response = self.client.post('/api/payments/initiate/', {'booking_id': str(self.booking.pk)}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_verify_applies_gateway_status(self):
+        from .tasks import verify_payment
+
+        payment = self.initiate()
+        verify_payment(payment.reference)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+
+        # A success for another amount is not accepted
+        self.gateway.pay(payment.reference)
+        self.gateway.transactions[payment.reference]['amount'] = '1.00'
+        verify_payment(payment.reference)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'failed')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, Booking.STATUS_PENDING)
+
+    def test_client_reuses_connections_and_times_out(self):
+        payment = self.initiate()
+        opened = self.gateway.connections
+        for _ in range(5):
+            payments.verify(payment.reference)
+        self.assertEqual(self.gateway.connections, opened)
+
+        self.gateway.fail_next = 1
+        with self.assertRaises(payments.GatewayUnavailable):
+            payments.verify(payment.reference)
+        self.gateway.latency = 1
+        with self.assertRaises(payments.GatewayUnavailable):
+            payments.verify(payment.reference)
+
+    def test_simulated_completion_is_staff_only(self):
+        payment = Payment.objects.create(booking=self.booking, amount=self.booking.total_price, reference='ref-sim')
+        self.assertEqual(self.client.post(f'/api/payments/{payment.pk}/complete/').status_code, 403)
+        self.client.force_authenticate(self.staff)
+        response = self.client.post(f'/api/payments/{payment.pk}/complete/')
+        self.assertEqual(response.data['status'], 'completed')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, Booking.STATUS_CONFIRMED)
+
+
+@skipUnless('replica' in connections, 'needs a second database alias named "replica"')
+@override_settings(LISTING_DB_REPLICAS=['replica'])
+class ReplicaRoutingTests(ListingsTestCase):
+    """
+    The "replica" alias is a separate, empty database here, so anything
+    read from it comes back empty.
+    """
+    # Declared only when it exists: the runner sets up every alias a test
+    # class names, even one it then skips
+    databases = {alias for alias in ('default', 'replica') if alias in connections}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.guest = User.objects.create_user('guest', password='password123')
+        cls.listing = make_listing(cls.host)
+        cls.check_in = date.today() + timedelta(days=10)
+        make_booking(cls.listing, cls.guest, cls.check_in)
+
+    def test_listing_and_stats_reads_use_the_replica(self):
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        self.assertEqual(client.get('/api/listings/').data['results'], [])
+        self.assertEqual(client.get('/api/reviews/').data['results'], [])
+        self.assertEqual(client.get('/api/stats/').data['total_listings'], 0)
+        # Bookings are read from the primary
+        self.assertEqual(len(client.get('/api/bookings/').data['results']), 1)
+
+    async def test_async_reads_use_the_replica(self):
+        response = await self.async_client.get('/api/async/listings/')
+        self.assertEqual(response.json()['results'], [])
+
+    def test_clients_read_their_writes(self):
+        client = APIClient()
+        client.force_authenticate(self.host)
+        response = client.post('/api/listings/', {
+            'title': 'New', 'description': 'Fresh', 'price_per_night': '90.00', 'location': 'Lagos',
+            'amenities': 'WiFi',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        self.assertEqual(len(client.get('/api/listings/').data['results']), 2)
+        del client.cookies[PIN_COOKIE]
+        get_listing_cache().clear()
+        self.assertEqual(client.get('/api/listings/').data['results'], [])
+
+    def test_writes_pin_the_rest_of_the_request(self):
+        with routing_state(), replica_reads():
+            self.assertFalse(Listing.objects.exists())
+            Amenity.objects.create(name='Sauna', slug='sauna')
+            self.assertTrue(Listing.objects.exists())
+
+    def test_overlap_check_reads_the_primary(self):
+        data = {
+            'listing': self.listing,
+            'check_in_date': self.check_in + timedelta(days=1),
+            'check_out_date': self.check_in + timedelta(days=2),
+        }
+        with routing_state(), replica_reads():
+            # The replica has not seen the booking...
+            self.assertTrue(is_available(self.listing, data['check_in_date'], data['check_out_date']))
+            # ...but the booking validation asks the primary
+            with self.assertRaises(ValidationError):
+                BookingSerializer().validate(data)
+
+
+class PooledSQLiteDatabaseWrapper(PooledDatabaseWrapperMixin, SQLiteDatabaseWrapper):
+    pass
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The pool is exercised through the SQLite backend')
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        if connection.is_in_memory_db():
+            # Django never closes in-memory SQLite connections, so none reach the pool
+            self.skipTest('needs a database file, not an in-memory SQLite database')
+        self.settings_dict = {
+            **connections['default'].settings_dict,
+            'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True, 'POOL': {'SIZE': 1},
+        }
+        self.addCleanup(close_pools)
+
+    def wrapper(self):
+        """A connection to default as another thread would hold it."""
+        wrapper = PooledSQLiteDatabaseWrapper(self.settings_dict, alias='pool_test')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def test_closed_connections_are_reused_by_other_threads(self):
+        first = self.wrapper()
+        raw = first.connection
+        first.close()
+        self.assertIsNone(first.connection)
+
+        second = self.wrapper()
+        self.assertIs(second.connection, raw)
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+
+    def test_keeps_at_most_size_idle_connections(self):
+        first, second = self.wrapper(), self.wrapper()
+        self.assertIsNot(first.connection, second.connection)
+        first.close()
+        second.close()
+        self.assertEqual(len(get_pool('pool_test').idle), 1)
+
+    def test_dead_idle_connections_are_replaced(self):
+        first = self.wrapper()
+        raw = first.connection
+        first.close()
+        raw.close()  # e.g. dropped by the server after wait_timeout
+
+        second = self.wrapper()
+        self.assertIsNot(second.connection, raw)
+        self.assertTrue(second.is_usable())
+
+    def test_connections_with_errors_are_closed(self):
+        first = self.wrapper()
+        first.errors_occurred = True
+        first.close()
+        self.assertEqual(len(get_pool('pool_test').idle), 0)
+
+    def test_manual_transactions_are_rolled_back(self):
+        first = self.wrapper()
+        first.set_autocommit(False)
+        with first.cursor() as cursor:
+            cursor.execute("INSERT INTO listings_amenity (name, slug) VALUES ('Sauna', 'sauna')")
+        first.close()
+
+        second = self.wrapper()
+        self.assertTrue(second.get_autocommit())
+        with second.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM listings_amenity WHERE slug = 'sauna'")
+            self.assertEqual(cursor.fetchone(), (0,))
+
+
+@override_settings(LISTING_METRICS_ENABLED=True)
+class RequestMetricsTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = User.objects.create_user('host', password='password123')
+        cls.admin = User.objects.create_superuser('admin', password='password123')
+        for i in range(3):
+            make_listing(cls.host, title=f'Loft {i}')
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.addCleanup(registry.reset)
+        # The test thread connected before any middleware was loaded
+        for alias in connections:
+            install_query_recorder(connection=connections[alias])
+
+    def test_server_timing_and_per_view_metrics(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().get('/api/listings/')
+        timing = response['Server-Timing']
+        query_count = len(queries)
+        self.assertIn(f'desc="{query_count} queries, 0 duplicates"', timing)
+        for phase in ('db;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        views = client.get('/api/metrics/').json()['views']
+        stats = views['ListingViewSet.list']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['max_queries'], query_count)
+        self.assertEqual(sum(stats['latency_ms_histogram'].values()), 1)
+        self.assertGreater(stats['mean_serialize_ms'], 0)
+
+        self.assertEqual(client.delete('/api/metrics/').status_code, 204)
+        self.assertNotIn('ListingViewSet.list', client.get('/api/metrics/').json()['views'])
+        self.assertEqual(APIClient().get('/api/metrics/').status_code, 403)
+
+    def test_duplicate_queries_are_reported(self):
+        def view(request):
+            list(Listing.objects.filter(title='Loft 1'))
+            list(Listing.objects.filter(title='Loft 1'))
+            list(Listing.objects.filter(title='Loft 2'))
+            return HttpResponse()
+
+        response = RequestMetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertIn('desc="3 queries, 1 duplicates"', response['Server-Timing'])
+        stats = registry.snapshot()['unresolved']
+        self.assertEqual(stats['duplicate_queries'], 1)
+        self.assertEqual(len(stats['top_duplicated_sql']), 1)
+
+    async def test_async_views_count_their_queries(self):
+        response = await self.async_client.get('/api/async/listings/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('desc="0 queries', response['Server-Timing'])
+        self.assertEqual(registry.snapshot()['listings.async_views.listing_list']['requests'], 1)
+
+    @override_settings(LISTING_METRICS_ENABLED=False)
+    def test_disabled_middleware_drops_out(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            RequestMetricsMiddleware(lambda request: HttpResponse())
+        response = APIClient().get('/api/listings/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(registry.snapshot(), {})
+
+
+class BenchmarkSuiteTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.counts = generate_dataset(random.Random(7), listings=30, users=20, bookings=90, reviews=60, batch_size=8)
+
+    def test_generated_dataset(self):
+        self.assertEqual(
+            {table: self.counts[table] for table in ('users', 'listings', 'bookings')},
+            {'users': 20, 'listings': 30, 'bookings': 90},
+        )
+        # Only guests with a completed stay review, as the API enforces
+        self.assertEqual(Review.objects.count(), self.counts['reviews'])
+        self.assertGreater(self.counts['reviews'], 0)
+        self.assertLessEqual(self.counts['reviews'], 60)
+        for review in Review.objects.all():
+            self.assertTrue(Booking.objects.filter(
+                listing=review.listing_id, guest=review.reviewer_id, status=Booking.STATUS_COMPLETED,
+            ).exists())
+        self.assertEqual(BookedNight.objects.count(), self.counts['booked nights'])
+        for listing in Listing.objects.all():
+            bookings = list(listing.bookings.order_by('check_in_date'))
+            self.assertEqual(len(bookings), 3)
+            for earlier, later in zip(bookings, bookings[1:]):
+                self.assertLessEqual(earlier.check_out_date, later.check_in_date)
+            self.assertEqual(listing.amenity_links.count(), len(listing.get_amenities_list()))
+
+        stored = list(Listing.objects.order_by('pk').values_list('review_count', 'rating_sum', 'average_rating'))
+        Listing.objects.refresh_rating_stats()
+        self.assertEqual(
+            stored, list(Listing.objects.order_by('pk').values_list('review_count', 'rating_sum', 'average_rating')),
+        )
+        self.assertEqual(StatsRollup.objects.get(shard=0).total_bookings, 90)
+
+    def test_regressions_against_the_baseline_fail_the_run(self):
+        baseline = Path(tempfile.mkdtemp()) / 'baseline.json'
+        self.addCleanup(baseline.unlink, missing_ok=True)
+        options = ['--use-existing', '--requests', '3', '--scenario', 'listing-list',
+                   '--scenario', 'booking-create', '--baseline', str(baseline), '--tolerance', '10']
+        call_command('benchmark_api', *options, '--save-baseline', stdout=StringIO())
+        results = json.loads(baseline.read_text())['results']
+        self.assertEqual(set(results), {'listing-list', 'booking-create'})
+        self.assertEqual(results['booking-create']['errors'], 0)
+
+        output = StringIO()
+        call_command('benchmark_api', *options, stdout=output)
+        self.assertIn('No regressions', output.getvalue())
+
+        saved = json.loads(baseline.read_text())
+        saved['results']['listing-list']['queries'] -= 1
+        baseline.write_text(json.dumps(saved))
+        with self.assertRaisesMessage(CommandError, 'listing-list: 2 queries per request, baseline 1'):
+            call_command('benchmark_api', *options, stdout=StringIO())
+
+
+class SeedCommandTests(ListingsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='password123')
+        cls.host = User.objects.create_user('host', password='password123')
+        make_listing(cls.host)
+
+    def seed(self, seed='1'):
+        output = StringIO()
+        call_command('seed', '--listings', '12', '--users', '10', '--bookings', '30', '--reviews', '10',
+                     '--seed', seed, '--batch-size', '5', stdout=output)
+        return output.getvalue()
+
+    def test_replaces_everything_but_superusers(self):
+        output = self.seed()
+        self.assertIn('rows/s', output)
+        self.assertEqual(Listing.objects.count(), 12)
+        self.assertEqual(Booking.objects.count(), 30)
+        self.assertEqual(Review.objects.count(), 10)
+        self.assertEqual(
+            set(User.objects.values_list('username', flat=True)),
+            {'admin'} | {f'synthetic_{i}' for i in range(10)},
+        )
+        self.assertTrue(User.objects.get(username='synthetic_3').check_password('password123'))
+        self.assertEqual(StatsRollup.objects.get(shard=0).total_listings, 12)
+
+    def test_same_seed_same_rows(self):
+        self.seed()
+        first = set(Booking.objects.values_list('pk', 'check_in_date', 'guest__username'))
+        self.seed()
+        self.assertEqual(set(Booking.objects.values_list('pk', 'check_in_date', 'guest__username')), first)
+        self.seed('2')
+        self.assertNotEqual(set(Booking.objects.values_list('pk', 'check_in_date', 'guest__username')), first)
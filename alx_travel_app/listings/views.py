@@ -1,23 +1,172 @@
+import json
+import uuid
+from functools import partial
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
-from drf_yasg.utils import swagger_auto_schema
+from rest_framework.filters import OrderingFilter
+from drf_yasg.utils import no_body, swagger_auto_schema
 from drf_yasg import openapi
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
+from . import outbox
 from .models import Listing, Booking, Review, Payment
+from .availability import is_available
+from .bulk import STATUS_CREATED, bulk_create_bookings, bulk_create_listings
+from .cache import get_listing_cache
+from .facets import facet_counts
+from .filters import BookingFilter, ListingFilter
+from .geo import ListingGeoFilter
+from .parsers import NDJSONParser
+from .payments import SIGNATURE_HEADER, apply_gateway_status, new_reference, valid_signature
+from .replicas import ReplicaReadMixin
+from .search import ListingSearchFilter
 from .serializers import (
     ListingSerializer, ListingCreateSerializer,
     BookingSerializer, BookingCreateSerializer, 
     ReviewSerializer, ReviewCreateSerializer,
-    PaymentSerializer, PaymentCreateSerializer,
-    UserSerializer
+    PaymentSerializer, PaymentCreateSerializer, PaymentInitiateSerializer,
+    UserSerializer, AvailabilityQuerySerializer, requested_paths
 )
 from django.contrib.auth.models import User
 
 
+class ExpandableQuerysetMixin:
+    """
+    Join or prefetch exactly the relations the serializer will render for
+    the request's ?expand= and ?fields= parameters.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if not hasattr(serializer_class, 'related_lookups'):
+            return queryset
+        select, prefetch = serializer_class.related_lookups(*requested_paths(self.request))
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+expand_parameter = openapi.Parameter(
+    'expand', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+    description="Comma-separated relations to render as objects instead of ids, dotted for nested ones (e.g. listing.host,guest)",
+)
+bulk_request_body = openapi.Schema(
+    type=openapi.TYPE_ARRAY,
+    items=openapi.Schema(type=openapi.TYPE_OBJECT),
+    description="JSON array, or one object per line with Content-Type: application/x-ndjson",
+)
+bulk_responses = {
+    201: "All items created",
+    207: "Some items created; see per-item results",
+    400: "No items created",
+}
+
+
+class BulkCreateMixin:
+    """
+    Shared handling for the bulk create actions: parse a JSON array or
+    NDJSON body, enforce LISTING_BULK_MAX_ITEMS and report per-item results.
+    """
+
+    def bulk_create_response(self, request, create):
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "Expected a JSON array or NDJSON body."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_items = getattr(settings, 'LISTING_BULK_MAX_ITEMS', 5000)
+        if len(items) > max_items:
+            return Response(
+                {"error": f"At most {max_items} items per request."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = create(items, request.user)
+        created = sum(1 for result in results if result['status'] == STATUS_CREATED)
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {'created': created, 'failed': len(results) - created, 'results': results},
+            status=response_status
+        )
+
+
+availability_response_schema = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'listing_id': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_UUID),
+        'check_in': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        'check_out': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        'available': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+    }
+)
+
+
+def availability_payload(listing_id, check_in, check_out, available):
+    return {'listing_id': listing_id, 'check_in': check_in, 'check_out': check_out, 'available': available}
+
+
+def count_list_schema(**properties):
+    return openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+        type=openapi.TYPE_OBJECT, properties={**properties, 'count': openapi.Schema(type=openapi.TYPE_INTEGER)},
+    ))
+
+
+facets_response_schema = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'count': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'locations': count_list_schema(location=openapi.Schema(type=openapi.TYPE_STRING)),
+        'price': count_list_schema(
+            min=openapi.Schema(type=openapi.TYPE_INTEGER),
+            max=openapi.Schema(type=openapi.TYPE_INTEGER, x_nullable=True),
+        ),
+        'amenities': count_list_schema(
+            slug=openapi.Schema(type=openapi.TYPE_STRING), name=openapi.Schema(type=openapi.TYPE_STRING),
+        ),
+    }
+)
+
+
+fields_parameter = openapi.Parameter(
+    'fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+    description="Comma-separated fields to return, dotted for fields of expanded relations (e.g. booking_id,listing.title)",
+)
+
+# The filters shared by the listing list and its facets
+listing_filter_parameters = [
+    openapi.Parameter('location', openapi.IN_QUERY, description="Filter by location; repeat for any of several", type=openapi.TYPE_ARRAY, items=openapi.Items(type=openapi.TYPE_STRING), collection_format='multi'),
+    openapi.Parameter('min_price', openapi.IN_QUERY, description="Minimum price per night", type=openapi.TYPE_NUMBER),
+    openapi.Parameter('max_price', openapi.IN_QUERY, description="Maximum price per night", type=openapi.TYPE_NUMBER),
+    openapi.Parameter('search', openapi.IN_QUERY, description="Full-text search in title, description, location, amenities (ranked by relevance unless ordering is given). Without a database full-text index, at most LISTING_SEARCH_MAX_RESULTS matches are returned, counted and paginated", type=openapi.TYPE_STRING),
+    openapi.Parameter('amenities', openapi.IN_QUERY, description="Comma-separated amenities, e.g. pool,wifi", type=openapi.TYPE_STRING),
+    openapi.Parameter('amenities_match', openapi.IN_QUERY, description="all (default) or any", type=openapi.TYPE_STRING, enum=['all', 'any']),
+    openapi.Parameter('check_in', openapi.IN_QUERY, description="Only listings free from this date (use with check_out)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+    openapi.Parameter('check_out', openapi.IN_QUERY, description="Only listings free until this date (use with check_in)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+    openapi.Parameter('min_rating', openapi.IN_QUERY, description="Minimum average rating", type=openapi.TYPE_NUMBER),
+    openapi.Parameter('max_rating', openapi.IN_QUERY, description="Maximum average rating", type=openapi.TYPE_NUMBER),
+    openapi.Parameter('is_available', openapi.IN_QUERY, description="Only listings open for booking", type=openapi.TYPE_BOOLEAN),
+    openapi.Parameter('near', openapi.IN_QUERY, description="lat,lng: only listings within radius of the point, nearest first unless ordering or search is given", type=openapi.TYPE_STRING),
+    openapi.Parameter('radius', openapi.IN_QUERY, description="Radius in km around near (default 10)", type=openapi.TYPE_NUMBER),
+    openapi.Parameter('bbox', openapi.IN_QUERY, description="min_lat,min_lng,max_lat,max_lng: only listings inside the box", type=openapi.TYPE_STRING),
+]
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -33,12 +182,12 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
-class ListingViewSet(viewsets.ModelViewSet):
+class ListingViewSet(ReplicaReadMixin, ExpandableQuerysetMixin, BulkCreateMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['location', 'price_per_night', 'is_available']
+    filter_backends = [DjangoFilterBackend, OrderingFilter, ListingGeoFilter, ListingSearchFilter]
+    filterset_class = ListingFilter
     search_fields = ['title', 'description', 'location', 'amenities']
-    ordering_fields = ['price_per_night', 'created_at']
+    ordering_fields = ['price_per_night', 'created_at', 'average_rating', 'review_count']
     ordering = ['-created_at']
     queryset = Listing.objects.all()
 
@@ -61,41 +210,93 @@ class ListingViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        operation_description="Create many listings at once for the current user",
+        request_body=bulk_request_body,
+        responses=bulk_responses
+    )
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk_create(self, request):
+        return self.bulk_create_response(request, bulk_create_listings)
+
     @swagger_auto_schema(
         operation_description="Get all listings with filtering and search",
-        manual_parameters=[
-            openapi.Parameter('location', openapi.IN_QUERY, description="Filter by location", type=openapi.TYPE_STRING),
-            openapi.Parameter('search', openapi.IN_QUERY, description="Search in title, description, location, amenities", type=openapi.TYPE_STRING),
+        manual_parameters=listing_filter_parameters + [
+            openapi.Parameter('ordering', openapi.IN_QUERY, description="Order by price_per_night, created_at, average_rating or review_count (prefix with - for descending)", type=openapi.TYPE_STRING),
+            expand_parameter,
+            fields_parameter,
         ],
-        responses={200: ListingSerializer(many=True)}
+        responses={200: ListingSerializer(many=True), 304: "Not modified (If-None-Match)"}
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        cache = get_listing_cache()
+        return cache.cached_response(
+            request, cache.list_key(request), partial(super().list, request, *args, **kwargs)
+        )
+
+    @swagger_auto_schema(
+        operation_description="Counts per location, price bucket and amenity of the listings the filters match, from one query",
+        manual_parameters=listing_filter_parameters,
+        responses={200: facets_response_schema, 304: "Not modified (If-None-Match)"}
+    )
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        cache = get_listing_cache()
+        return cache.cached_response(
+            request, cache.list_key(request),
+            lambda: Response(facet_counts(self.filter_queryset(self.get_queryset()))),
+        )
+
+    @swagger_auto_schema(
+        operation_description="Check whether a listing is free for a stay",
+        query_serializer=AvailabilityQuerySerializer,
+        responses={200: availability_response_schema, 404: "Listing not found"}
+    )
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        query = AvailabilityQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        listing = get_object_or_404(Listing.objects.only('pk'), pk=pk)
+        check_in, check_out = query.validated_data['check_in'], query.validated_data['check_out']
+        return Response(availability_payload(listing.pk, check_in, check_out, is_available(listing, check_in, check_out)))
 
     @swagger_auto_schema(
         operation_description="Get listing details",
-        responses={200: ListingSerializer}
+        manual_parameters=[expand_parameter, fields_parameter],
+        responses={200: ListingSerializer, 304: "Not modified (If-None-Match)"}
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        render = partial(super().retrieve, request, *args, **kwargs)
+        try:
+            listing_id = uuid.UUID(str(kwargs[self.lookup_url_kwarg or self.lookup_field]))
+        except ValueError:
+            return render()
+        if request.query_params:
+            return render()
+        cache = get_listing_cache()
+        return cache.cached_response(request, cache.detail_key(listing_id), render)
 
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(ExpandableQuerysetMixin, BulkCreateMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
-    filterset_fields = ['status']
-    ordering_fields = ['created_at', 'check_in_date']
+    filterset_class = BookingFilter
+    ordering_fields = ['created_at', 'check_in_date', 'duration']
     ordering = ['-created_at']
+    queryset = Booking.objects.all()
 
     def get_queryset(self):
         # Handle Swagger schema generation (user is anonymous)
         if getattr(self, 'swagger_fake_view', False):
             return Booking.objects.none()
         
+        # Joined so that nothing reading booking.listing or booking.guest
+        # (signals, __str__, expanded fields) queries per row
+        queryset = super().get_queryset().with_stay_fields().select_related('listing', 'guest')
         user = self.request.user
         if user.is_staff or user.is_superuser:
-            return Booking.objects.all()
-        return Booking.objects.filter(guest=user)
+            return queryset
+        return queryset.filter(guest=user)
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -105,6 +306,14 @@ class BookingViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(guest=self.request.user)
 
+    def perform_update(self, serializer):
+        serializer.save()
+        serializer.instance = self.with_stay_fields(serializer.instance)
+
+    def with_stay_fields(self, booking):
+        """The booking re-read with duration and is_active for its new dates and status."""
+        return self.get_queryset().get(pk=booking.pk)
+
     @swagger_auto_schema(
         operation_description="Create a new booking",
         request_body=BookingCreateSerializer,
@@ -116,6 +325,15 @@ class BookingViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        operation_description="Create many pending bookings at once for the current user",
+        request_body=bulk_request_body,
+        responses=bulk_responses
+    )
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk_create(self, request):
+        return self.bulk_create_response(request, bulk_create_bookings)
+
     @action(detail=True, methods=['post'])
     @swagger_auto_schema(
         operation_description="Cancel a booking",
@@ -139,11 +357,11 @@ class BookingViewSet(viewsets.ModelViewSet):
         
         booking.status = Booking.STATUS_CANCELLED
         booking.save()
-        serializer = self.get_serializer(booking)
+        serializer = self.get_serializer(self.with_stay_fields(booking))
         return Response(serializer.data)
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ReplicaReadMixin, ExpandableQuerysetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['listing', 'rating']
@@ -171,22 +389,24 @@ class ReviewViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'payment_method']
     ordering_fields = ['created_at', 'amount']
     ordering = ['-created_at']
+    queryset = Payment.objects.all()
 
     def get_queryset(self):
         # Handle Swagger schema generation (user is anonymous)
         if getattr(self, 'swagger_fake_view', False):
             return Payment.objects.none()
         
+        queryset = super().get_queryset()
         user = self.request.user
         if user.is_staff or user.is_superuser:
-            return Payment.objects.all()
-        return Payment.objects.filter(booking__guest=user)
+            return queryset
+        return queryset.filter(booking__guest=user)
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -204,29 +424,125 @@ class PaymentViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        operation_description=(
+            "Start paying for a booking. The payment is created pending and the "
+            "gateway checkout URL is filled in by a background task; poll the "
+            "payment until checkout_url is set."
+        ),
+        request_body=PaymentInitiateSerializer,
+        responses={
+            202: PaymentSerializer,
+            200: "The booking's pending payment, already initiated",
+            400: "Validation error"
+        }
+    )
+    @action(detail=False, methods=['post'])
+    def initiate(self, request):
+        serializer = PaymentInitiateSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        booking = serializer.validated_data['booking_id']
+        with transaction.atomic():
+            # Lock the booking, not the payment: when there is no payment yet
+            # there is no row to lock and two requests would both create one
+            booking = Booking.objects.select_for_update().get(pk=booking.pk)
+            existing = Payment.objects.filter(booking=booking).first()
+            if existing is not None:
+                if existing.status != 'pending':
+                    return Response(
+                        {"error": f"Booking already has a {existing.status} payment."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                return Response(PaymentSerializer(existing).data)
+            payment = Payment.objects.create(
+                booking=booking, amount=booking.total_price, reference=new_reference(),
+            )
+            outbox.record(outbox.PAYMENT_INITIATED, str(payment.pk))
+        return Response(PaymentSerializer(payment).data, status=status.HTTP_202_ACCEPTED)
+
+    @swagger_auto_schema(
+        operation_description="Ask the gateway for the outcome of a pending payment in the background",
+        request_body=no_body,
+        responses={202: PaymentSerializer, 200: "The payment is already settled"}
+    )
     @action(detail=True, methods=['post'])
+    def verify(self, request, pk=None):
+        payment = self.get_object()
+        if payment.status != 'pending':
+            return Response(self.get_serializer(payment).data)
+        outbox.record(outbox.PAYMENT_VERIFY_REQUESTED, payment.reference)
+        return Response(self.get_serializer(payment).data, status=status.HTTP_202_ACCEPTED)
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Gateway webhook. The body must be signed with CHAPA_WEBHOOK_SECRET "
+            "in the X-Chapa-Signature header; replays are harmless."
+        ),
+        request_body=no_body,
+        responses={200: "Processed or ignored", 400: "Malformed body", 403: "Bad signature"}
+    )
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny], authentication_classes=[])
+    def webhook(self, request):
+        # The signature covers the raw body, so read it before DRF parses it
+        body = request.body
+        if not valid_signature(body, request.META.get(SIGNATURE_HEADER, '')):
+            return Response({"error": "Invalid signature."}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            event = json.loads(body)
+            reference = event['tx_ref']
+        except (ValueError, TypeError, KeyError):
+            return Response({"error": "Expected a JSON event with a tx_ref."}, status=status.HTTP_400_BAD_REQUEST)
+        payment = apply_gateway_status(
+            reference, event.get('status'), transaction_id=event.get('reference'), amount=event.get('amount'),
+        )
+        return Response({"processed": payment is not None})
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     @swagger_auto_schema(
-        operation_description="Simulate payment completion",
+        operation_description="Simulate payment completion without the gateway (staff only)",
         responses={200: PaymentSerializer}
     )
     def complete(self, request, pk=None):
         payment = self.get_object()
-        # Create a simple transaction ID for demo
-        import uuid
-        payment.mark_as_completed(transaction_id=f"txn_{uuid.uuid4().hex[:16]}")
+        if payment.status != 'completed':
+            payment.mark_as_completed(transaction_id=f"txn_{uuid.uuid4().hex[:16]}")
         serializer = self.get_serializer(payment)
         return Response(serializer.data)
 
 
 # Statistics View
+from datetime import date, timedelta
+
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
-from django.db.models import Count, Avg, Sum
+from .stats import BREAKDOWN_KEYS, daily_breakdown, day_bounds, get_totals
 
-class StatsAPIView(APIView):
+
+def date_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: 'Use the YYYY-MM-DD format.'})
+
+
+class StatsAPIView(ReplicaReadMixin, APIView):
+    """
+    Reads the precomputed rollup maintained by stats.py instead of
+    aggregating the source tables on every request.
+    """
     permission_classes = [IsAuthenticated]
-    
+    max_breakdown_days = 366
+
     @swagger_auto_schema(
         operation_description="Get travel app statistics",
+        manual_parameters=[
+            openapi.Parameter('breakdown', openapi.IN_QUERY, description="Add daily bookings and revenue per listing or per location", type=openapi.TYPE_STRING, enum=list(BREAKDOWN_KEYS)),
+            openapi.Parameter('start', openapi.IN_QUERY, description="First day of the breakdown (default: 29 days before end)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('end', openapi.IN_QUERY, description="Last day of the breakdown (default: today)", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        ],
         responses={
             200: openapi.Response(
                 description="Statistics data",
@@ -237,20 +553,119 @@ class StatsAPIView(APIView):
                         'total_bookings': openapi.Schema(type=openapi.TYPE_INTEGER),
                         'total_revenue': openapi.Schema(type=openapi.TYPE_NUMBER),
                         'average_rating': openapi.Schema(type=openapi.TYPE_NUMBER),
+                        'daily': openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            description="Only present with ?breakdown=",
+                            items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                        ),
                     }
                 )
             )
         }
     )
     def get(self, request):
-        stats = {
-            'total_listings': Listing.objects.count(),
-            'total_bookings': Booking.objects.count(),
-            'total_revenue': Payment.objects.filter(status='completed').aggregate(
-                total=Sum('amount')
-            )['total'] or 0,
-            'average_rating': Review.objects.aggregate(
-                avg_rating=Avg('rating')
-            )['avg_rating'] or 0,
-        }
-        return Response(stats)
\ No newline at end of file
+        stats = get_totals()
+        breakdown = self.get_breakdown(request)
+        if breakdown:
+            stats['daily'] = daily_breakdown(*breakdown)
+        return Response(stats)
+
+    def get_breakdown(self, request):
+        """Return the (by, start, end) breakdown asked for, or None."""
+        breakdown = request.query_params.get('breakdown')
+        if not breakdown:
+            return None
+        if breakdown not in BREAKDOWN_KEYS:
+            raise ValidationError({'breakdown': f"Choose one of: {', '.join(BREAKDOWN_KEYS)}."})
+        return (breakdown, *self.get_breakdown_range(request))
+
+    def get_breakdown_range(self, request):
+        end = date_param(request, 'end') or timezone.localdate()
+        start = date_param(request, 'start') or end - timedelta(days=29)
+        if start > end:
+            raise ValidationError({'start': 'start must not be after end.'})
+        if (end - start).days >= self.max_breakdown_days:
+            raise ValidationError({'start': f'The breakdown covers at most {self.max_breakdown_days} days.'})
+        return start, end
+
+
+# Finance exports
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+from .export import CONTENT_TYPES, EXPORTS, FORMAT_NDJSON, ExportError, aiterate, stream_export
+
+class ExportAPIView(APIView):
+    """
+    Stream every booking or payment as NDJSON or CSV with flat memory use;
+    see export.py.
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Export bookings or payments for reconciliation. Resume an interrupted export with after=<id of the last row received>.",
+        manual_parameters=[
+            openapi.Parameter('file_format', openapi.IN_QUERY, description="ndjson (default) or csv", type=openapi.TYPE_STRING, enum=list(CONTENT_TYPES)),
+            openapi.Parameter('status', openapi.IN_QUERY, description="Comma-separated statuses to include", type=openapi.TYPE_STRING),
+            openapi.Parameter('created_after', openapi.IN_QUERY, description="Only rows created on or after this day", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('created_before', openapi.IN_QUERY, description="Only rows created on or before this day", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('after', openapi.IN_QUERY, description="Resume after the row with this id", type=openapi.TYPE_STRING, format=openapi.FORMAT_UUID),
+        ],
+        responses={200: "Streamed NDJSON or CSV rows ordered by creation time"}
+    )
+    def get(self, request, kind):
+        if kind not in EXPORTS:
+            raise NotFound(f"Unknown export '{kind}'.")
+        params = request.query_params
+        file_format = params.get('file_format', FORMAT_NDJSON)
+        created_after = date_param(request, 'created_after')
+        created_before = date_param(request, 'created_before')
+        after = params.get('after')
+        if after:
+            try:
+                after = uuid.UUID(after)
+            except ValueError:
+                raise ValidationError({'after': 'Must be the id of a previously exported row.'})
+
+        try:
+            chunks = stream_export(
+                kind,
+                file_format,
+                statuses=[value for value in params.get('status', '').split(',') if value],
+                since=day_bounds(created_after, created_after)[0] if created_after else None,
+                until=day_bounds(created_before, created_before)[1] if created_before else None,
+                after=after or None,
+            )
+        except ExportError as exc:
+            raise ValidationError({'detail': str(exc)})
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{file_format}"'
+        return response
+
+
+# Request metrics
+from .instrumentation import registry
+
+class MetricsAPIView(APIView):
+    """
+    Per-view request metrics of this process, collected by
+    RequestMetricsMiddleware while LISTING_METRICS_ENABLED is on.
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Query counts, SQL, serialization and render time and latency histograms per view and action, since start-up or the last reset",
+        responses={200: "Metrics keyed by view and action, e.g. ListingViewSet.list"}
+    )
+    def get(self, request):
+        return Response({
+            'enabled': getattr(settings, 'LISTING_METRICS_ENABLED', False),
+            'views': registry.snapshot(),
+        })
+
+    @swagger_auto_schema(operation_description="Reset this process's metrics", responses={204: "Reset"})
+    def delete(self, request):
+        registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)